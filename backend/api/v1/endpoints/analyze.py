@@ -1,30 +1,220 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from typing import AsyncIterator, List, Literal
+from core.config import settings
+from core.single_flight import analyze_flight
+from core.sse import sse_response
+from core.uploads import spooled_upload
+from services.contact_analytics import contact_analytics
+from services.conversation_merge import merge_analyses
 from services.vision_service import vision_service
-from services.llm_service import llm_service
+from services.llm_service import llm_service, TONES
+from services.image_preprocessor import image_preprocessor, PreparedImage
+from services.result_cache import analysis_cache, content_hash, context_hash, file_hash
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/")
-async def analyze_screenshot(file: UploadFile = File(...)):
+async def analyze_screenshot(
+    file: UploadFile = File(...),
+    mode: Literal["sequential", "fused", "parallel"] = Query(
+        "sequential",
+        description=(
+            "sequential: extract, then generate replies. "
+            "fused: one vision call returns extraction and replies. "
+            "parallel: stream the extraction, then each tone as it completes (server-sent events)."
+        ),
+    ),
+):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-    
-    contents = await file.read()
-    vision_result = await vision_service.analyze_chat_screenshot(contents)
-    
+
+    upload = spooled_upload(file, settings.UPLOAD_MAX_IMAGE_BYTES, "analyze")
+    # A byte-identical re-upload is answered from its raw hash, skipping preprocessing,
+    # which is most of what a hit on the normalized key still costs
+    upload_key = f"upload:{await asyncio.to_thread(file_hash, upload)}"
+    cached = await analysis_cache.get(upload_key, count_miss=False)
+    if cached is not None:
+        return sse_response(_stream_cached(cached)) if mode == "parallel" else cached
+
+    try:
+        image = await image_preprocessor.prepare(upload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Other re-uploads of the same screenshot (re-encoded, resized) normalize to the same bytes
+    cache_key = content_hash(image.data)
+    cached = await analysis_cache.get(cache_key, phash=image.phash)
+    if cached is not None:
+        await analysis_cache.set(upload_key, cached)
+        return sse_response(_stream_cached(cached)) if mode == "parallel" else cached
+
+    keys = (cache_key, upload_key)
+    if mode == "parallel":
+        return sse_response(_stream_parallel(image, keys))
+
+    # A retried or double-tapped upload joins the analysis already running for it
+    if mode == "fused":
+        return await analyze_flight.do(f"fused:{cache_key}", lambda: _analyze_fused(image, keys))
+    return await analyze_flight.do(f"sequential:{cache_key}", lambda: _analyze_sequential(image, keys))
+
+
+async def _cache_analysis(image: PreparedImage, keys: tuple[str, str], result: dict):
+    """Cache under the normalized image (with its perceptual hash) and the raw upload."""
+    cache_key, upload_key = keys
+    await analysis_cache.set(cache_key, result, phash=image.phash)
+    await analysis_cache.set(upload_key, result)
+
+
+async def _analyze_fused(image: PreparedImage, keys: tuple[str, str]) -> dict:
+    result = await vision_service.analyze_with_replies(image)
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+    await contact_analytics.observe_analysis(result, scope=keys[0])
+    if result["replies"]:
+        await _cache_analysis(image, keys, result)
+    return result
+
+
+async def _analyze_sequential(image: PreparedImage, keys: tuple[str, str]) -> dict:
+    vision_result = await vision_service.analyze_chat_screenshot(image)
+
     if "error" in vision_result:
         raise HTTPException(status_code=500, detail=vision_result["error"])
-    
+    # Only fresh extractions count; a cache hit is a conversation already observed
+    await contact_analytics.observe_analysis(vision_result, scope=keys[0])
+
     # Generate replies based on vision result
     replies_result = await llm_service.generate_replies(vision_result)
-    
+
     if "error" in replies_result:
-        # We can still return vision result but with warning, or fail. 
+        # We can still return vision result but with warning, or fail.
         # For now, let's just log and return vision result without replies or error out.
-        print(f"Reply generation failed: {replies_result['error']}")
+        logger.warning("reply generation failed", extra={"error": replies_result["error"]})
         # Continue without replies is safer for MVP, but spec requires them.
         vision_result["replies"] = []
     else:
         vision_result["replies"] = replies_result.get("replies", [])
-        
+        await _cache_analysis(image, keys, vision_result)
+
+    return vision_result
+
+
+@router.post("/batch")
+async def analyze_screenshots(files: List[UploadFile] = File(...)):
+    """Analyze several screenshots of one conversation in a single request.
+
+    Images are preprocessed concurrently and sent to the vision model with bounded
+    parallelism; the overlapping extractions are merged into one ordered conversation
+    and replies are generated once for the merged context.
+    """
+    if len(files) > settings.BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_IMAGES} images per batch")
+    for file in files:
+        if not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"{file.filename} must be an image")
+
+    uploads = [spooled_upload(file, settings.UPLOAD_MAX_IMAGE_BYTES, "analyze/batch") for file in files]
+    prepared = await asyncio.gather(
+        *(image_preprocessor.prepare(upload) for upload in uploads), return_exceptions=True
+    )
+
+    batch_key = context_hash([
+        [file.filename, str(image) if isinstance(image, Exception) else content_hash(image.data)]
+        for file, image in zip(files, prepared)
+    ])
+    return await analyze_flight.do(f"batch:{batch_key}", lambda: _analyze_batch(files, prepared))
+
+
+async def _analyze_batch(files: List[UploadFile], prepared: list[PreparedImage | Exception]) -> dict:
+    semaphore = asyncio.Semaphore(settings.BATCH_VISION_CONCURRENCY)
+    fresh: dict[int, str] = {}  # index -> normalized image hash, for images extracted now
+
+    async def extract(index: int, image: PreparedImage) -> dict:
+        cache_key = content_hash(image.data)
+        # A full analysis of the image (from /analyze) contains its extraction
+        cached = await analysis_cache.get(cache_key, phash=image.phash, count_miss=False)
+        if cached is None:
+            cached = await analysis_cache.get(f"extract:{cache_key}")
+        if cached is not None:
+            return {k: v for k, v in cached.items() if k != "replies"}
+        async with semaphore:
+            analysis = await vision_service.analyze_chat_screenshot(image)
+        if "error" not in analysis:
+            fresh[index] = cache_key
+            await analysis_cache.set(f"extract:{cache_key}", analysis)
+        return analysis
+
+    async def skip(error: Exception) -> dict:
+        return {"error": str(error)}
+
+    analyses = await asyncio.gather(*(
+        skip(image) if isinstance(image, Exception) else extract(index, image)
+        for index, image in enumerate(prepared)
+    ))
+
+    images = []
+    extracted = []
+    for index, (file, analysis) in enumerate(zip(files, analyses)):
+        if "error" in analysis:
+            images.append({"index": index, "filename": file.filename, "error": analysis["error"]})
+            continue
+        images.append({"index": index, "filename": file.filename, "messages": len(analysis.get("conversation", []))})
+        extracted.append(analysis)
+
+    if not extracted:
+        raise HTTPException(status_code=500, detail="No screenshot could be analyzed")
+
+    result = merge_analyses(extracted)
+    if fresh:
+        # Cached images were observed when they were extracted; only the new ones count now
+        observed = merge_analyses([analyses[index] for index in sorted(fresh)])
+        observed["participant_name"] = result["participant_name"]
+        await contact_analytics.observe_analysis(observed, scope=context_hash(sorted(fresh.values())))
+    replies_result = await llm_service.generate_replies(result)
+    if "error" in replies_result:
+        logger.warning("reply generation failed", extra={"error": replies_result["error"]})
+        result["replies"] = []
+    else:
+        result["replies"] = replies_result.get("replies", [])
+    result["images"] = images
+
+    return result
+
+
+async def _stream_cached(cached: dict) -> AsyncIterator[tuple[str, dict]]:
+    """A cached result as the events `_stream_parallel` emits."""
+    yield "analysis", {k: v for k, v in cached.items() if k != "replies"}
+    for reply in cached.get("replies", []):
+        yield "reply", reply
+    yield "done", cached
+
+
+async def _stream_parallel(image: PreparedImage, keys: tuple[str, str]) -> AsyncIterator[tuple[str, dict]]:
+    """Emit `analysis` once the conversation is extracted, a `reply` per tone as each
+    parallel generation finishes, then `done` with the full result."""
+    # Reply tones stream per request; the extraction is shared with identical uploads
+    vision_result = await analyze_flight.do(f"extract:{keys[0]}", lambda: _extract_and_observe(image, keys[0]))
+    if "error" in vision_result:
+        yield "error", {"error": vision_result["error"]}
+        return
+    yield "analysis", vision_result
+
+    async for event, data in llm_service.stream_replies_parallel(vision_result):
+        if event != "done":
+            yield event, data
+            continue
+        result = {**vision_result, "replies": data["replies"]}
+        if len(result["replies"]) == len(TONES):
+            await _cache_analysis(image, keys, result)
+        yield "done", result
+
+
+async def _extract_and_observe(image: PreparedImage, cache_key: str) -> dict:
+    vision_result = await vision_service.analyze_chat_screenshot(image)
+    if "error" not in vision_result:
+        await contact_analytics.observe_analysis(vision_result, scope=cache_key)
     return vision_result
@@ -1,29 +1,76 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
 from core.database import get_db
-from services.chat_service import chat_service
+from core.metrics import CHAT_CONNECTIONS
+from core.sse import sse_response
+from core.uploads import spooled_upload
+from pydantic import BaseModel
+from services.chat_service import SessionNotFound, chat_service, session_dict
+from services.image_preprocessor import image_preprocessor
+from contextlib import aclosing
 from typing import Optional
+import asyncio
+import base64
+import binascii
+import json
 
 router = APIRouter()
 
 
+class ChatSessionCreate(BaseModel):
+    title: Optional[str] = None
+
+
+async def _require_session(db: AsyncSession, session_id: Optional[int]):
+    try:
+        return await chat_service.get_session(db, session_id)
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/sessions")
+async def create_session(body: Optional[ChatSessionCreate] = None, db: AsyncSession = Depends(get_db)):
+    """Start a new conversation; pass its `id` as `session_id` to the other chat endpoints."""
+    return session_dict(await chat_service.create_session(db, body.title if body else None))
+
+
+@router.get("/sessions")
+async def list_sessions(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+):
+    """List chat sessions, most recently active first."""
+    return [session_dict(chat_session) for chat_session in await chat_service.list_sessions(db, skip, limit)]
+
+
 @router.post("/")
 async def send_message(
     message: str = Form(""),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    session_id: Optional[int] = Form(None, description="Session to continue (default: the most recent one)"),
+    db: AsyncSession = Depends(get_db),
 ):
     """Send a chat message with optional image attachment."""
     if not message and not image:
         raise HTTPException(status_code=400, detail="Must provide a message or image")
 
-    image_bytes = None
+    prepared_image = None
     if image:
         if not image.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="Attachment must be an image")
-        image_bytes = await image.read()
+        try:
+            prepared_image = await image_preprocessor.prepare(
+                spooled_upload(image, settings.UPLOAD_MAX_IMAGE_BYTES, "chat")
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    result = await chat_service.send_message(db, message, image_bytes)
+    try:
+        result = await chat_service.send_message(db, message, prepared_image, session_id)
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
@@ -31,14 +78,128 @@ async def send_message(
     return result
 
 
+@router.post("/stream")
+async def stream_message(
+    message: str = Form(""),
+    image: Optional[UploadFile] = File(None),
+    session_id: Optional[int] = Form(None, description="Session to continue (default: the most recent one)"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Send a chat message and stream the reply as server-sent events.
+
+    Emits `token` events as the model produces text, then a `done` event with the
+    full response and session id (or an `error` event).
+    """
+    if not message and not image:
+        raise HTTPException(status_code=400, detail="Must provide a message or image")
+    # Fail with a 404 before the stream starts
+    await _require_session(db, session_id)
+
+    prepared_image = None
+    if image:
+        if not image.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="Attachment must be an image")
+        try:
+            prepared_image = await image_preprocessor.prepare(
+                spooled_upload(image, settings.UPLOAD_MAX_IMAGE_BYTES, "chat")
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return sse_response(chat_service.stream_message(message, prepared_image, session_id))
+
+
 @router.get("/history")
-def get_history(db: Session = Depends(get_db)):
-    """Get chat message history."""
-    return {"messages": chat_service.get_history(db)}
+async def get_history(
+    session_id: Optional[int] = Query(None, description="Session to read (default: the most recent one)"),
+    before_id: Optional[int] = Query(None, description="Return messages older than this message id"),
+    limit: int = Query(settings.HISTORY_PAGE_SIZE, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get one page of a session's message history (cursor-paginated by `before_id`)."""
+    try:
+        return await chat_service.get_history(db, session_id=session_id, before_id=before_id, limit=limit)
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.delete("/")
-def clear_chat(db: Session = Depends(get_db)):
-    """Clear all chat history."""
-    chat_service.clear_history(db)
-    return {"message": "Chat history cleared"}
+async def clear_chat(
+    session_id: Optional[int] = Query(None, description="Session to delete (default: the most recent one)"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Delete one chat session and its messages."""
+    try:
+        deleted = await chat_service.clear_history(db, session_id)
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"message": "Chat history cleared", "session_id": deleted}
+
+
+def _decode_image(value: str) -> bytes:
+    """Decode a base64 image (optionally a data URL) sent over the WebSocket."""
+    if value.startswith("data:"):
+        header, _, value = value.partition(",")
+        if not header.startswith("data:image/"):
+            raise ValueError("Attachment must be an image")
+    if len(value) * 3 // 4 > settings.UPLOAD_MAX_IMAGE_BYTES:
+        raise ValueError(f"Image too large (max {settings.UPLOAD_MAX_IMAGE_BYTES / 1024 / 1024:.1f} MB)")
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise ValueError("Image is not valid base64")
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, session_id: Optional[int] = None):
+    """Chat over one long-lived connection to a session (default: the most recent one).
+
+    Send `{"message": "...", "image": "<base64 or data URL>"}` (image optional). The server
+    sends `{"event": ..., "data": ...}` frames: `session` on connect, then per message
+    `token`s and `done` (or `error`), plus pushed `memories` (facts extracted from this
+    session) and `message` (exchanges added to the session by other clients).
+    """
+    await websocket.accept()
+    try:
+        connection = await chat_service.connect(session_id)
+    except SessionNotFound as e:
+        await websocket.send_json({"event": "error", "data": {"error": str(e)}})
+        await websocket.close(code=4404)
+        return
+
+    send_lock = asyncio.Lock()
+
+    async def send(event: str, data: dict):
+        async with send_lock:
+            await websocket.send_json({"event": event, "data": data})
+
+    async def push_updates():
+        async for event, data in connection.updates():
+            await send(event, data)
+
+    pusher = asyncio.create_task(push_updates())
+    CHAT_CONNECTIONS.inc()
+    try:
+        await send("session", session_dict(connection.chat_session))
+        while True:
+            try:
+                payload = json.loads(await websocket.receive_text())
+                message = (payload.get("message") or "").strip()
+                image = payload.get("image")
+                if not message and not image:
+                    raise ValueError("Must provide a message or image")
+                prepared_image = await image_preprocessor.prepare(_decode_image(image)) if image else None
+            except (ValueError, AttributeError) as e:
+                # Bad frame: report it and keep the connection
+                await send("error", {"error": str(e) if not isinstance(e, json.JSONDecodeError) else "Invalid JSON"})
+                continue
+
+            async with aclosing(connection.turn(message, prepared_image)) as events:
+                async for event, data in events:
+                    await send(event, data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        CHAT_CONNECTIONS.dec()
+        pusher.cancel()
+        await connection.close()
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from models.contact import Contact
+from models.conversation import ContactMemory
+from services.chat_import import chat_importer
+from services.contact_analytics import contact_analytics
+from services.contact_search import contact_search
+from core.config import settings
 from core.database import get_db
+from core.uploads import spooled_upload
 from pydantic import BaseModel
-from datetime import date
+from datetime import date, datetime
 
 router = APIRouter()
 
@@ -24,22 +32,100 @@ class ContactResponse(ContactCreate):
     class Config:
         orm_mode = True
 
+class MemoryResponse(BaseModel):
+    id: int
+    fact: str
+    category: str | None = None
+    created_at: datetime | None = None
+
+    class Config:
+        orm_mode = True
+
+class ContactDetailResponse(ContactResponse):
+    memories: List[MemoryResponse] = []
+
+class SearchHit(BaseModel):
+    type: str  # contact or memory
+    id: int
+    name: str | None = None  # contacts may have no name
+    snippet: str
+    contact_id: int | None = None
+
 @router.post("/", response_model=ContactResponse)
-def create_contact(contact: ContactCreate, db: Session = Depends(get_db)):
+async def create_contact(contact: ContactCreate, db: AsyncSession = Depends(get_db)):
     db_contact = Contact(**contact.dict())
     db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
+    await db.commit()
+    await db.refresh(db_contact)
     return db_contact
 
 @router.get("/", response_model=List[ContactResponse])
-def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    contacts = db.query(Contact).offset(skip).limit(limit).all()
+async def read_contacts(
+    response: Response,
+    after_id: Optional[int] = Query(None, description="Return contacts after this id (the previous page's X-Next-Cursor)"),
+    limit: int = Query(100, ge=1, le=500),
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging; use after_id"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Contacts in id order, keyset-paginated: pass the X-Next-Cursor header as `after_id`."""
+    query = select(Contact).order_by(Contact.id)
+    if after_id is not None:
+        query = query.where(Contact.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    contacts = list((await db.scalars(query.limit(limit + 1))).all())
+    if len(contacts) > limit:
+        contacts = contacts[:limit]
+        response.headers["X-Next-Cursor"] = str(contacts[-1].id)
     return contacts
 
-@router.get("/{contact_id}", response_model=ContactResponse)
-def read_contact(contact_id: int, db: Session = Depends(get_db)):
-    contact = db.query(Contact).filter(Contact.id == contact_id).first()
+@router.post("/import")
+async def import_chat_export(
+    file: UploadFile = File(...),
+    contact_name: Optional[str] = Form(None),
+    user_name: Optional[str] = Form(None),
+    format: str = Form("auto", pattern="^(auto|whatsapp|imessage|telegram|plain)$"),
+    day_first: Optional[bool] = Form(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Import an exported chat (WhatsApp .txt/.zip, imessage-exporter .txt, Telegram result.json)
+    into the contact's message history and analytics, and queue memory extraction. The
+    response includes the latest messages as a context for /reply."""
+    source = spooled_upload(file, settings.UPLOAD_MAX_IMPORT_BYTES, "contacts/import")
+    try:
+        return await chat_importer.import_export(
+            db, source, file.filename or "", contact_name, user_name, format, day_first
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/search", response_model=List[SearchHit])
+async def search_contacts(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Full-text search over contact names, nicknames, notes and remembered facts, best match first."""
+    return await contact_search.search(db, q, limit)
+
+@router.get("/{contact_id}", response_model=ContactDetailResponse)
+async def read_contact(contact_id: int, db: AsyncSession = Depends(get_db)):
+    """A contact with the facts remembered about them, loaded in one joined query."""
+    contact = (await db.scalars(
+        select(Contact)
+        .outerjoin(Contact.memories)
+        .options(contains_eager(Contact.memories))
+        .where(Contact.id == contact_id)
+        .order_by(ContactMemory.id)
+    )).unique().first()
     if contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
     return contact
+
+@router.get("/{contact_id}/analytics")
+async def read_contact_analytics(contact_id: int, db: AsyncSession = Depends(get_db)):
+    """Emotion distribution, valence spread and reply-gap statistics behind the scores."""
+    if await db.get(Contact, contact_id) is None:
+        raise HTTPException(status_code=404, detail="Contact not found")
+    stats = await contact_analytics.stats(db, contact_id)
+    return {"contact_id": contact_id, **(stats or {})}
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from services.chat_import import chat_importer
 from services.llm_service import llm_service
-from typing import List, Dict, Any
+from core.sse import sse_response
+from typing import List, Dict, Any, Optional
 
 router = APIRouter()
 
@@ -11,6 +13,11 @@ class ConversationContext(BaseModel):
     overall_mood: str
     participant_name: str
 
+class PastedConversation(BaseModel):
+    text: str = Field(..., min_length=1, max_length=200_000)
+    participant_name: Optional[str] = None
+    user_name: Optional[str] = None
+
 @router.post("/")
 async def generate_reply(context: ConversationContext):
     result = await llm_service.generate_replies(context.dict())
@@ -19,3 +26,23 @@ async def generate_reply(context: ConversationContext):
         raise HTTPException(status_code=500, detail=result["error"])
         
     return result
+
+@router.post("/stream")
+async def stream_reply(context: ConversationContext):
+    """Stream reply options as server-sent `reply` events, followed by `done`."""
+    return sse_response(llm_service.stream_replies(context.dict()))
+
+@router.post("/text")
+async def generate_reply_from_text(pasted: PastedConversation):
+    """Reply options for a conversation pasted as text ("Name: message" lines or a chat
+    export), parsed directly instead of going through screenshot analysis."""
+    try:
+        context = await chat_importer.context_from_text(pasted.text, pasted.participant_name, pasted.user_name)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    result = await llm_service.generate_replies(context)
+
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+
+    return {**result, "context": context}
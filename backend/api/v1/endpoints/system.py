@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException
+from core.model_router import model_router
+from core.scheduler import scheduler
+from core.single_flight import analyze_flight, reply_flight
+from core.uploads import upload_stats
+from core.usage import usage_tracker
+from services.result_cache import analysis_cache, reply_cache
+
+router = APIRouter()
+
+
+@router.get("/cache")
+def cache_stats():
+    """Hit/miss counters for the analysis and reply result caches."""
+    return {
+        "analysis": analysis_cache.stats(),
+        "reply": reply_cache.stats(),
+    }
+
+
+@router.get("/single-flight")
+def single_flight_stats():
+    """Scope, upstream calls and coalesced duplicates of identical in-flight requests, per endpoint."""
+    return {
+        "analyze": analyze_flight.stats(),
+        "reply": reply_flight.stats(),
+    }
+
+
+@router.get("/uploads")
+def upload_statistics():
+    """Upload limits, per-endpoint sizes and rejections, and current/peak process RSS."""
+    return upload_stats.snapshot()
+
+
+@router.get("/scheduler")
+def scheduler_stats():
+    """Per-model upstream concurrency, rate-limit headroom, queue depth and wait times."""
+    return scheduler.stats()
+
+
+@router.get("/models")
+def model_stats():
+    """Model routes, circuit breaker states, per-task latency percentiles and hedge/fallback counts."""
+    return model_router.stats()
+
+
+@router.get("/usage")
+def usage_stats():
+    """Prompt, cached and completion tokens, prompt-cache hit rate and cost per endpoint and model."""
+    return usage_tracker.stats()
+
+
+@router.get("/usage/sessions/{session_id}")
+def session_usage(session_id: int):
+    """Token usage and cost of one chat session."""
+    usage = usage_tracker.session(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No usage recorded for this session")
+    return usage
@@ -1,29 +1,50 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 
+from core.config import settings
+from core.sse import sse_response
+from core.uploads import read_upload
 from services.transcription_service import transcription_service
 
 router = APIRouter()
 
+ALLOWED_TYPES = [
+    "audio/webm", "audio/mp3", "audio/mpeg",
+    "audio/mp4", "audio/m4a", "audio/wav",
+    "audio/ogg", "video/webm",
+]
 
-@router.post("/")
-async def transcribe_audio(file: UploadFile = File(...)):
-    """Transcribe a voice note to text using Whisper."""
-    allowed_types = [
-        "audio/webm", "audio/mp3", "audio/mpeg",
-        "audio/mp4", "audio/m4a", "audio/wav",
-        "audio/ogg", "video/webm",
-    ]
 
-    if file.content_type not in allowed_types:
+def _check_audio(file: UploadFile):
+    if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported audio format: {file.content_type}. Use webm, mp3, m4a, wav, or ogg.",
         )
 
-    audio_bytes = await file.read()
-    result = await transcription_service.transcribe_audio(audio_bytes, file.filename or "audio.webm")
+
+@router.post("/")
+async def transcribe_audio(file: UploadFile = File(...)):
+    """Transcribe a voice note to text using Whisper."""
+    _check_audio(file)
+
+    audio_bytes = await read_upload(file, settings.UPLOAD_MAX_AUDIO_BYTES, "transcribe")
+    result = await transcription_service.transcribe_audio(
+        audio_bytes, file.filename or "audio.webm", file.content_type
+    )
 
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
 
     return result
+
+
+@router.post("/stream")
+async def transcribe_audio_stream(file: UploadFile = File(...)):
+    """Transcribe a voice note, streaming partial transcripts as server-sent events
+    as each chunk of a long recording finishes."""
+    _check_audio(file)
+
+    audio_bytes = await read_upload(file, settings.UPLOAD_MAX_AUDIO_BYTES, "transcribe")
+    return sse_response(transcription_service.stream_transcription(
+        audio_bytes, file.filename or "audio.webm", file.content_type
+    ))
@@ -0,0 +1,193 @@
+"""Local stand-in for the OpenAI chat completions (text and vision) and transcription endpoints.
+
+Responses are shaped for the prompts this backend sends: JSON-mode calls get an object with
+every key the services read (conversation, replies, memories, ...), per-tone calls get a
+single reply, and plain calls get prose. Latency is drawn from a log-normal distribution,
+streams are sent in timed chunks, and a fraction of calls can be answered with 429.
+
+    python -m benchmarks.fake_openai --port 8100 --latency-ms 800 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_TONE_RE = re.compile(r'in a "([^"]+)" tone')
+
+REPLIES = [
+    {"tone": "Warm & Supportive", "text": "That sounds like a lot, I'm here for you.", "reasoning": "Validates first."},
+    {"tone": "Playful & Light", "text": "Okay but who gave you permission to be this funny?", "reasoning": "Keeps it light."},
+    {"tone": "Direct & Confident", "text": "Let's get dinner on Friday.", "reasoning": "Moves things forward."},
+]
+CHAT_TEXT = (
+    "It sounds like they are interested but a bit guarded. Keep your next message short, "
+    "mirror their energy, and ask one open question about the thing they mentioned last."
+)
+TRANSCRIPT_TEXT = "hey so I was wondering if you wanted to grab coffee this weekend"
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "300"))  # median time to first byte
+    latency_sigma: float = float(os.getenv("FAKE_OPENAI_LATENCY_SIGMA", "0.5"))  # log-normal spread
+    chunk_ms: float = float(os.getenv("FAKE_OPENAI_CHUNK_MS", "15"))  # gap between streamed chunks
+    chunk_chars: int = int(os.getenv("FAKE_OPENAI_CHUNK_CHARS", "12"))
+    error_rate: float = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))  # share of calls answered with 429
+    retry_after: float = float(os.getenv("FAKE_OPENAI_RETRY_AFTER", "0.5"))
+    cached_ratio: float = float(os.getenv("FAKE_OPENAI_CACHED_RATIO", "0.5"))  # share of prompt tokens reported cached
+    seed: int | None = int(os.environ["FAKE_OPENAI_SEED"]) if os.getenv("FAKE_OPENAI_SEED") else None
+
+
+def _estimate_tokens(body: dict) -> int:
+    tokens = 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4 + 4
+        elif isinstance(content, list):
+            tokens += sum(len(part.get("text", "")) // 4 if part.get("type") == "text" else 1445 for part in content)
+    return tokens
+
+
+def _content_for(body: dict) -> str:
+    system = next((m["content"] for m in body.get("messages", []) if m.get("role") == "system" and isinstance(m.get("content"), str)), "")
+    if body.get("response_format", {}).get("type") != "json_object":
+        return CHAT_TEXT
+    tone = _TONE_RE.search(system)
+    if tone:
+        return json.dumps({"tone": tone.group(1), "text": "Sounds good to me!", "reasoning": "Matches the tone."})
+    return json.dumps({
+        "replies": REPLIES,
+        "conversation": [
+            {"sender": "Partner", "text": "are you free this weekend?", "emotion": "curious"},
+            {"sender": "User", "text": "maybe, why?", "emotion": "neutral"},
+        ],
+        "summary": "Partner is asking about weekend plans.",
+        "overall_mood": "Flirty",
+        "participant_name": "Sam",
+        "memories": [{"contact_name": "Sam", "fact": "Likes weekend plans", "category": "preference"}],
+    })
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="fake-openai")
+    rng = random.Random(config.seed)
+    counters = {"chat": 0, "chat_stream": 0, "transcription": 0, "rate_limited": 0}
+
+    def latency() -> float:
+        return config.latency_ms / 1000 * math.exp(rng.gauss(0, config.latency_sigma))
+
+    def rate_limited() -> JSONResponse | None:
+        if rng.random() >= config.error_rate:
+            return None
+        counters["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after": str(config.retry_after)},
+        )
+
+    def usage(body: dict, completion_tokens: int) -> dict:
+        prompt = _estimate_tokens(body)
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": int(prompt * config.cached_ratio) // 128 * 128},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency())
+        if error := rate_limited():
+            return error
+
+        content = _content_for(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        completion_tokens = len(content) // 4 + 1
+
+        if not body.get("stream"):
+            counters["chat"] += 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage(body, completion_tokens),
+            }
+
+        counters["chat_stream"] += 1
+
+        def chunk(choices: list, **extra) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body["model"], "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            for start in range(0, len(content), config.chunk_chars):
+                yield chunk([{"index": 0, "delta": {"content": content[start:start + config.chunk_chars]}, "finish_reason": None}])
+                await asyncio.sleep(config.chunk_ms / 1000)
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if body.get("stream_options", {}).get("include_usage"):
+                yield chunk([], usage=usage(body, completion_tokens))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        audio = await form["file"].read()
+        # Roughly proportional to the audio length, like the real endpoint
+        await asyncio.sleep(latency() * (1 + len(audio) / 1_000_000))
+        if error := rate_limited():
+            return error
+        counters["transcription"] += 1
+        return {"text": TRANSCRIPT_TEXT}
+
+    @app.get("/_stats")
+    async def stats():
+        return {"config": asdict(config), **counters}
+
+    return app
+
+
+def main():
+    defaults = FakeConfig()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma)
+    parser.add_argument("--chunk-ms", type=float, default=defaults.chunk_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        chunk_ms=args.chunk_ms,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
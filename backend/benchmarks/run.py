@@ -0,0 +1,261 @@
+"""Run the load scenarios against a local copy of the API backed by the fake OpenAI server.
+
+Each scenario gets a fresh API process (and database), so peak memory is per scenario.
+Results go to benchmarks/results/latest.json; --save-baseline copies them to
+benchmarks/baselines/baseline.json and --check fails on regressions against it.
+
+    cd backend
+    python -m benchmarks.run                          # every scenario
+    python -m benchmarks.run chat chat_stream -n 200  # a subset, 200 requests each
+    python -m benchmarks.run --check                  # exit 1 if p95/throughput/memory regressed
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.scenarios import Scenario, build_scenarios
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_PATH = Path(__file__).resolve().parent / "results" / "latest.json"
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "baseline.json"
+
+# Metric -> True when higher is better; checked against the baseline with --tolerance
+CHECKED_METRICS = {"throughput_rps": True, "p95_ms": False, "peak_rss_mb": False}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def _peak_rss_mb(pid: int) -> float | None:
+    """High-water resident set size of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} during startup")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def _start(args: list[str], url: str, env: dict | None = None) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env)
+    try:
+        _wait_until_up(url, process)
+    except Exception:
+        process.kill()
+        raise
+    return process
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def _one(client: httpx.AsyncClient, scenario: Scenario, index: int) -> tuple[float, float | None, bool]:
+    """(latency, time to first SSE event or None, ok) for one request."""
+    started = time.perf_counter()
+    first_event = None
+    ok = False
+    try:
+        async with client.stream(scenario.method, scenario.path, **scenario.build(index)) as response:
+            async for line in response.aiter_lines():
+                if scenario.stream and first_event is None and line.startswith("event:"):
+                    first_event = time.perf_counter() - started
+                # An SSE `error` event arrives with a 200 status
+                if line.startswith("event: error"):
+                    ok = False
+                    break
+            else:
+                ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    return time.perf_counter() - started, first_event, ok
+
+
+async def _load(base_url: str, scenario: Scenario) -> dict:
+    semaphore = asyncio.Semaphore(scenario.concurrency)
+    limits = httpx.Limits(max_connections=scenario.concurrency, max_keepalive_connections=scenario.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        for method, path, kwargs in scenario.setup:
+            (await client.request(method, path, **kwargs)).raise_for_status()
+
+        async def bounded(index: int):
+            async with semaphore:
+                return await _one(client, scenario, index)
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(bounded(index) for index in range(scenario.requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, _, ok in outcomes if ok]
+    first_events = [first * 1000 for _, first, ok in outcomes if ok and first is not None]
+    result = {
+        "requests": scenario.requests,
+        "concurrency": scenario.concurrency,
+        "errors": sum(1 for _, _, ok in outcomes if not ok),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+    }
+    if scenario.stream:
+        result["first_event_p50_ms"] = _percentile(first_events, 0.50)
+        result["first_event_p95_ms"] = _percentile(first_events, 0.95)
+    return {key: round(value, 1) if isinstance(value, float) and key.endswith("_ms") else value for key, value in result.items()}
+
+
+def run_scenario(scenario: Scenario, fake_url: str, workdir: str) -> dict:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "DATABASE_URL": f"sqlite:///{workdir}/{scenario.name}.db",
+        "CACHE_DB_PATH": f"{workdir}/{scenario.name}-cache.db",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    base_url = f"http://127.0.0.1:{port}"
+    app = _start(
+        ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        f"{base_url}/", env,
+    )
+    try:
+        result = asyncio.run(_load(base_url, scenario))
+        result["peak_rss_mb"] = _peak_rss_mb(app.pid)
+        return result
+    finally:
+        _stop(app)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Human-readable regressions of `results` against `baseline` beyond `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: errors {base.get('errors', 0)} -> {result['errors']}")
+        for metric, higher_is_better in CHECKED_METRICS.items():
+            new, old = result.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def _print_table(results: dict):
+    columns = ["requests", "concurrency", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "first_event_p50_ms", "peak_rss_mb"]
+    print(f"{'scenario':<20}" + "".join(f"{column:>20}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<20}" + "".join(f"{str(result.get(column, '-')):>20}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the API against a fake OpenAI server.")
+    parser.add_argument("scenarios", nargs="*", help="scenario names (default: all)")
+    parser.add_argument("-n", "--requests", type=int, help="requests per scenario (overrides the scenario default)")
+    parser.add_argument("-c", "--concurrency", type=int, help="concurrent requests (overrides the scenario default)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="fake OpenAI median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="fake OpenAI log-normal spread")
+    parser.add_argument("--chunk-ms", type=float, default=15, help="fake OpenAI gap between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake OpenAI calls answered with 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", action="store_true", help=f"write the results to {BASELINE_PATH.name}")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a metric regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 20%%)")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args.requests, args.concurrency)
+    if args.list:
+        for scenario in scenarios.values():
+            print(f"{scenario.name:<20} {scenario.method:<7} {scenario.path} (n={scenario.requests}, c={scenario.concurrency})")
+        return
+    unknown = set(args.scenarios) - set(scenarios)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    selected = [scenarios[name] for name in args.scenarios] if args.scenarios else list(scenarios.values())
+
+    fake_port = _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake = _start(
+        [
+            "-m", "benchmarks.fake_openai", "--port", str(fake_port),
+            "--latency-ms", str(args.latency_ms), "--latency-sigma", str(args.latency_sigma),
+            "--chunk-ms", str(args.chunk_ms), "--error-rate", str(args.error_rate), "--seed", str(args.seed),
+        ],
+        f"{fake_url}/_stats",
+    )
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+            for scenario in selected:
+                print(f"running {scenario.name} ({scenario.requests} requests, concurrency {scenario.concurrency})", flush=True)
+                results[scenario.name] = run_scenario(scenario, fake_url, workdir)
+    finally:
+        _stop(fake)
+
+    _print_table(results)
+    RESULTS_PATH.parent.mkdir(exist_ok=True)
+    RESULTS_PATH.write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.save_baseline:
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        baseline.update(results)
+        BASELINE_PATH.parent.mkdir(exist_ok=True)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"baseline saved to {BASELINE_PATH.relative_to(BACKEND_DIR)}")
+
+    if args.check:
+        if not BASELINE_PATH.exists():
+            sys.exit(f"no baseline at {BASELINE_PATH.relative_to(BACKEND_DIR)}; run with --save-baseline first")
+        regressions = compare(results, json.loads(BASELINE_PATH.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Load scenarios: one per /api/v1 endpoint (and mode), each a request factory plus load shape.
+
+Payloads vary per request (image noise, context text) so the result caches don't turn the
+run into a cache benchmark; `cached_*` scenarios repeat one payload on purpose.
+"""
+import io
+import math
+import random
+import struct
+import wave
+from dataclasses import dataclass, field
+from typing import Callable
+
+from PIL import Image, ImageDraw
+
+API = "/api/v1"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    # index -> keyword arguments for httpx.AsyncClient.request (json=, data=, files=, params=)
+    build: Callable[[int], dict] = lambda i: {}
+    stream: bool = False  # server-sent events: also report time to the first event
+    requests: int = 100
+    concurrency: int = 10
+    # Requests sent (untimed) after the app starts, e.g. to create rows the scenario reads
+    setup: list[tuple[str, str, dict]] = field(default_factory=list)
+
+
+def screenshot(seed: int, size: tuple[int, int] = (1080, 2400)) -> bytes:
+    """A phone-sized PNG with chat-bubble-like blocks; different for every seed."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    y = 120
+    while y < size[1] - 200:
+        height = rng.randint(80, 220)
+        width = rng.randint(300, 800)
+        left = 40 if rng.random() < 0.5 else size[0] - 40 - width
+        colour = (rng.randint(0, 255), rng.randint(100, 255), rng.randint(100, 255))
+        draw.rounded_rectangle((left, y, left + width, y + height), radius=30, fill=colour)
+        for line in range(y + 25, y + height - 20, 36):
+            draw.line((left + 30, line, left + width - rng.randint(30, 200), line), fill=(30, 30, 30), width=14)
+        y += height + rng.randint(20, 60)
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+def voice_note(seed: int, seconds: float = 3.0, rate: int = 16000) -> bytes:
+    """A short mono 16-bit WAV tone (below the direct-upload size, so no ffmpeg chunking)."""
+    frequency = 220 + seed % 200
+    frames = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * frequency * n / rate))) for n in range(int(seconds * rate))
+    )
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return out.getvalue()
+
+
+def conversation_context(seed: int) -> dict:
+    return {
+        "conversation": [
+            {"sender": "Partner", "text": f"so what are you up to this weekend? ({seed})", "emotion": "curious"},
+            {"sender": "User", "text": "not much yet, you?", "emotion": "neutral"},
+        ],
+        "summary": f"Planning the weekend, attempt {seed}.",
+        "overall_mood": "Flirty",
+        "participant_name": "Sam",
+    }
+
+
+class _Payloads:
+    """Pre-generated inputs so the load generator spends its time sending, not encoding PNGs."""
+
+    def __init__(self, images: int = 16, audio: int = 8):
+        self.images = [screenshot(seed) for seed in range(images)]
+        self.audio = [voice_note(seed) for seed in range(audio)]
+
+    def image(self, i: int) -> tuple[str, bytes, str]:
+        return (f"shot-{i}.png", self.images[i % len(self.images)], "image/png")
+
+    def voice(self, i: int) -> tuple[str, bytes, str]:
+        return (f"note-{i}.wav", self.audio[i % len(self.audio)], "audio/wav")
+
+
+def build_scenarios(requests: int | None = None, concurrency: int | None = None) -> dict[str, Scenario]:
+    payloads = _Payloads()
+    scenarios = [
+        Scenario("analyze", "POST", f"{API}/analyze/", lambda i: {"files": {"file": payloads.image(i)}}, requests=40),
+        Scenario("analyze_fused", "POST", f"{API}/analyze/", lambda i: {"files": {"file": payloads.image(i)}, "params": {"mode": "fused"}}, requests=40),
+        Scenario("analyze_parallel", "POST", f"{API}/analyze/", lambda i: {"files": {"file": payloads.image(i)}, "params": {"mode": "parallel"}}, stream=True, requests=40),
+        Scenario(
+            "analyze_batch", "POST", f"{API}/analyze/batch",
+            lambda i: {"files": [("files", payloads.image(i + n)) for n in range(3)]},
+            requests=20, concurrency=5,
+        ),
+        Scenario("cached_analyze", "POST", f"{API}/analyze/", lambda i: {"files": {"file": payloads.image(0)}}),
+        Scenario("reply", "POST", f"{API}/reply/", lambda i: {"json": conversation_context(i)}),
+        Scenario("reply_stream", "POST", f"{API}/reply/stream", lambda i: {"json": conversation_context(i)}, stream=True),
+        Scenario("chat", "POST", f"{API}/chat/", lambda i: {"data": {"message": f"How should I answer Sam's question about the weekend? #{i}"}}),
+        Scenario("chat_stream", "POST", f"{API}/chat/stream", lambda i: {"data": {"message": f"What should I text Sam next? #{i}"}}, stream=True),
+        Scenario(
+            "chat_sessions", "POST", f"{API}/chat/",
+            lambda i: {"data": {"message": f"What should I say next? #{i}", "session_id": str(i % 20 + 1)}},
+            setup=[("POST", f"{API}/chat/sessions", {"json": {"title": f"Session {n}"}}) for n in range(20)],
+        ),
+        Scenario(
+            "chat_image", "POST", f"{API}/chat/",
+            lambda i: {"data": {"message": "What do you make of this?"}, "files": {"image": payloads.image(i)}},
+            requests=40,
+        ),
+        Scenario(
+            "chat_history", "GET", f"{API}/chat/history", requests=200, concurrency=20,
+            setup=[("POST", f"{API}/chat/", {"data": {"message": f"seed message {n}"}}) for n in range(20)],
+        ),
+        Scenario("chat_clear", "DELETE", f"{API}/chat/", requests=50, concurrency=5),
+        Scenario("transcribe", "POST", f"{API}/transcribe/", lambda i: {"files": {"file": payloads.voice(i)}}),
+        Scenario("transcribe_stream", "POST", f"{API}/transcribe/stream", lambda i: {"files": {"file": payloads.voice(i)}}, stream=True),
+        Scenario(
+            "contacts_create", "POST", f"{API}/contacts/",
+            lambda i: {"json": {"name": f"Contact {i}", "relationship_type": "friend"}}, requests=200, concurrency=20,
+        ),
+        Scenario(
+            "contacts_list", "GET", f"{API}/contacts/", requests=200, concurrency=20,
+            setup=[("POST", f"{API}/contacts/", {"json": {"name": f"Contact {n}"}}) for n in range(50)],
+        ),
+        Scenario(
+            "contacts_search", "GET", f"{API}/contacts/search",
+            lambda i: {"params": {"q": ["cont", "contact 4", "hik"][i % 3]}}, requests=200, concurrency=20,
+            setup=[("POST", f"{API}/contacts/", {"json": {"name": f"Contact {n}", "notes": "likes hiking" if n % 5 == 0 else None}}) for n in range(50)],
+        ),
+        Scenario(
+            "contacts_get", "GET", f"{API}/contacts/1", requests=200, concurrency=20,
+            setup=[("POST", f"{API}/contacts/", {"json": {"name": "Sam"}})],
+        ),
+        Scenario("system_usage", "GET", f"{API}/system/usage", requests=200, concurrency=20),
+    ]
+    for scenario in scenarios:
+        if requests is not None:
+            scenario.requests = requests
+        if concurrency is not None:
+            scenario.concurrency = concurrency
+    return {scenario.name: scenario for scenario in scenarios}
@@ -0,0 +1,114 @@
+"""Cold-start budget: time to `import main` and time until a fresh API process is ready.
+
+Each measurement is a new interpreter, so nothing is warm but the OS file cache. Exits 1
+when the median exceeds its budget or a module that must load lazily is imported by main.
+
+    cd backend
+    python -m benchmarks.startup                      # 5 runs each, default budgets
+    python -m benchmarks.startup -n 10 --import-budget-ms 700
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import BACKEND_DIR, RESULTS_PATH, _free_port, _start, _stop
+
+# Median milliseconds: the import alone, and from spawning uvicorn to a ready response
+IMPORT_BUDGET_MS = 900
+READY_BUDGET_MS = 1800
+# Heavy modules that must not be imported by `import main` (they load on first use)
+LAZY_MODULES = ("openai",)
+
+_IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+print(json.dumps({{
+    "import_ms": (time.perf_counter() - started) * 1000,
+    "eager": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def _env(workdir: str) -> dict:
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-startup",
+        "DATABASE_URL": f"sqlite:///{workdir}/startup.db",
+        "CACHE_DB_PATH": f"{workdir}/startup-cache.db",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def measure_import(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_ready(env: dict) -> float:
+    """Milliseconds from spawning uvicorn to the first successful /ready."""
+    port = _free_port()
+    started = time.perf_counter()
+    app = _start(
+        ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        f"http://127.0.0.1:{port}/ready", env,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    _stop(app)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to ready against a budget.")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--ready-budget-ms", type=float, default=READY_BUDGET_MS)
+    args = parser.parse_args()
+
+    imports, ready, eager = [], [], set()
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        env = _env(workdir)
+        for run in range(args.runs):
+            probe = measure_import(env)
+            imports.append(probe["import_ms"])
+            eager.update(probe["eager"])
+            # A fresh database each time, so every run applies the full schema
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            ready.append(measure_ready(env))
+
+    result = {
+        "runs": args.runs,
+        "import_p50_ms": round(statistics.median(imports), 1),
+        "import_max_ms": round(max(imports), 1),
+        "ready_p50_ms": round(statistics.median(ready), 1),
+        "ready_max_ms": round(max(ready), 1),
+        "eager_modules": sorted(eager),
+    }
+    print(json.dumps(result, indent=2))
+    RESULTS_PATH.parent.mkdir(exist_ok=True)
+    (RESULTS_PATH.parent / "startup.json").write_text(json.dumps(result, indent=2) + "\n")
+
+    failures = []
+    if result["import_p50_ms"] > args.import_budget_ms:
+        failures.append(f"import main: {result['import_p50_ms']} ms > budget {args.import_budget_ms:.0f} ms")
+    if result["ready_p50_ms"] > args.ready_budget_ms:
+        failures.append(f"time to ready: {result['ready_p50_ms']} ms > budget {args.ready_budget_ms:.0f} ms")
+    if eager:
+        failures.append(f"imported by main but should load lazily: {', '.join(sorted(eager))}")
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    if failures:
+        sys.exit(1)
+    print("within the startup budget")
+
+
+if __name__ == "__main__":
+    main()
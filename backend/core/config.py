@@ -1,11 +1,191 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Ordered models per task: the first is the primary, the rest are fallbacks; a slow call
+# is hedged to the next model. A model may appear only once per route.
+# Override any task with MODEL_ROUTES, e.g. {"chat": ["gpt-4o", "gpt-4o-mini"]}
+DEFAULT_MODEL_ROUTES = {
+    "chat": ["gpt-4o-mini", "gpt-4o"],
+    # Short text-only chat messages. A hedged nano call that fails along with its
+    # gpt-4o-mini hedge still has gpt-4o to fall back to
+    "chat_short": ["gpt-4.1-nano", "gpt-4o-mini", "gpt-4o"],
+    "chat_vision": ["gpt-4o", "gpt-4o-mini"],  # chat messages with a screenshot
+    "reply": ["gpt-4o-mini", "gpt-4o"],
+    "vision": ["gpt-4o-mini", "gpt-4o"],
+    "memory": ["gpt-4o-mini", "gpt-4o"],
+    "summary": ["gpt-4o-mini", "gpt-4o"],
+    "transcription": ["whisper-1"],
+}
+
+# USD per 1M tokens, for the cost estimates in /system/usage. Override with MODEL_PRICES.
+DEFAULT_MODEL_PRICES = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+}
+
+# Who shares one in-flight upstream call between identical concurrent requests, per endpoint:
+# "global" (every client), "client" (same X-Client-ID or address) or "off".
+# Override with SINGLE_FLIGHT_SCOPES, e.g. {"reply": "client"}
+DEFAULT_SINGLE_FLIGHT_SCOPES = {
+    "analyze": "global",  # identical screenshot and mode
+    "reply": "global",  # identical conversation context
+}
+
+
+def _model_routes() -> dict:
+    routes = {**DEFAULT_MODEL_ROUTES, **json.loads(os.getenv("MODEL_ROUTES", "{}"))}
+    for task, models in routes.items():
+        if not models:
+            raise ValueError(f"MODEL_ROUTES[{task!r}] lists no models")
+        if len(set(models)) != len(models):
+            # A fallback or hedge to the model that just failed or stalled buys nothing
+            raise ValueError(f"MODEL_ROUTES[{task!r}] lists a model more than once: {models}")
+    return routes
+
+
 class Settings:
     PROJECT_NAME: str = "AI Reply Strategist"
     API_V1_STR: str = "/api/v1"
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    # Point the client at an OpenAI-compatible server (e.g. the benchmark stand-in); unset = api.openai.com
+    OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL") or None
+
+    # Database (sqlite:// or postgresql:// URLs are mapped to aiosqlite / asyncpg)
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    # Apply schema migrations when the app starts; turn off when a release step runs
+    # `python manage.py migrate` once per deploy instead of every worker checking
+    MIGRATE_ON_STARTUP: bool = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+    # Shared async OpenAI client (connection pool, timeouts, retries)
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    OPENAI_KEEPALIVE_EXPIRY: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+    OPENAI_CONNECT_TIMEOUT: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+    # Model routing: fallback, circuit breaking and hedging
+    MODEL_ROUTES: dict = _model_routes()
+    CHAT_SHORT_MAX_CHARS: int = int(os.getenv("CHAT_SHORT_MAX_CHARS", "120"))
+    ROUTER_FALLBACK_MAX_RETRIES: int = int(os.getenv("ROUTER_FALLBACK_MAX_RETRIES", "1"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_SECONDS: float = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_MIN_DELAY: float = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_WINDOW: int = int(os.getenv("HEDGE_WINDOW", "200"))
+
+    # Token usage accounting
+    MODEL_PRICES: dict = {**DEFAULT_MODEL_PRICES, **json.loads(os.getenv("MODEL_PRICES", "{}"))}
+    USAGE_SESSION_LIMIT: int = int(os.getenv("USAGE_SESSION_LIMIT", "1000"))
+
+    # Logging: "json" (one object per line) or "text"
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+
+    # Per-call timeouts (seconds)
+    CHAT_TIMEOUT: float = float(os.getenv("CHAT_TIMEOUT", "60"))
+    REPLY_TIMEOUT: float = float(os.getenv("REPLY_TIMEOUT", "45"))
+    VISION_TIMEOUT: float = float(os.getenv("VISION_TIMEOUT", "90"))
+    TRANSCRIPTION_TIMEOUT: float = float(os.getenv("TRANSCRIPTION_TIMEOUT", "120"))
+    MEMORY_EXTRACTION_TIMEOUT: float = float(os.getenv("MEMORY_EXTRACTION_TIMEOUT", "30"))
+
+    # Upstream call scheduler: per-model concurrency and rate limits (0 = unlimited).
+    # MODEL_LIMITS overrides per model, e.g. {"gpt-4o": {"concurrency": 8, "rpm": 500, "tpm": 30000}}
+    MODEL_DEFAULT_CONCURRENCY: int = int(os.getenv("MODEL_DEFAULT_CONCURRENCY", "16"))
+    MODEL_DEFAULT_RPM: float = float(os.getenv("MODEL_DEFAULT_RPM", "500"))
+    MODEL_DEFAULT_TPM: float = float(os.getenv("MODEL_DEFAULT_TPM", "200000"))
+    MODEL_LIMITS: dict = json.loads(os.getenv("MODEL_LIMITS", "{}"))
+    SCHEDULER_QUEUE_TIMEOUT: float = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "60"))
+    SCHEDULER_DEFAULT_COMPLETION_TOKENS: int = int(os.getenv("SCHEDULER_DEFAULT_COMPLETION_TOKENS", "500"))
+
+    # Background memory extraction queue
+    MEMORY_QUEUE_MAXSIZE: int = int(os.getenv("MEMORY_QUEUE_MAXSIZE", "500"))
+    MEMORY_QUEUE_WORKERS: int = int(os.getenv("MEMORY_QUEUE_WORKERS", "2"))
+    MEMORY_QUEUE_BATCH_SIZE: int = int(os.getenv("MEMORY_QUEUE_BATCH_SIZE", "5"))
+    MEMORY_QUEUE_MAX_RETRIES: int = int(os.getenv("MEMORY_QUEUE_MAX_RETRIES", "3"))
+    MEMORY_QUEUE_RETRY_BACKOFF: float = float(os.getenv("MEMORY_QUEUE_RETRY_BACKOFF", "1.0"))
+    MEMORY_QUEUE_ENQUEUE_TIMEOUT: float = float(os.getenv("MEMORY_QUEUE_ENQUEUE_TIMEOUT", "0.5"))
+    # Contact analytics updates (one worker; the queue's retry/backoff settings are shared)
+    ANALYTICS_QUEUE_BATCH_SIZE: int = int(os.getenv("ANALYTICS_QUEUE_BATCH_SIZE", "20"))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+
+    # Contact memory retrieval
+    MEMORY_TOKEN_BUDGET: int = int(os.getenv("MEMORY_TOKEN_BUDGET", "600"))
+    MEMORY_CONTEXT_MESSAGES: int = int(os.getenv("MEMORY_CONTEXT_MESSAGES", "4"))
+    MEMORY_CONTACT_STICKY_TURNS: int = int(os.getenv("MEMORY_CONTACT_STICKY_TURNS", "6"))
+    MEMORY_RECENCY_HALF_LIFE_DAYS: float = float(os.getenv("MEMORY_RECENCY_HALF_LIFE_DAYS", "30"))
+    MEMORY_INDEX_REFRESH_SECONDS: float = float(os.getenv("MEMORY_INDEX_REFRESH_SECONDS", "30"))
+    MEMORY_INDEX_MAX_ENTRIES: int = int(os.getenv("MEMORY_INDEX_MAX_ENTRIES", "50000"))  # newest memories kept indexed
+    # Rows younger than this are re-read on every catch-up, in case a lower id commits late
+    MEMORY_INDEX_SETTLE_SECONDS: float = float(os.getenv("MEMORY_INDEX_SETTLE_SECONDS", "60"))
+    MEMORY_SESSION_CACHE_SIZE: int = int(os.getenv("MEMORY_SESSION_CACHE_SIZE", "1000"))
+
+    # Chat history window and rolling summary
+    HISTORY_WINDOW_MESSAGES: int = int(os.getenv("HISTORY_WINDOW_MESSAGES", "20"))
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+    HISTORY_PAGE_SIZE: int = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+    SUMMARY_MIN_MESSAGES: int = int(os.getenv("SUMMARY_MIN_MESSAGES", "10"))
+    SUMMARY_MAX_MESSAGES: int = int(os.getenv("SUMMARY_MAX_MESSAGES", "60"))
+    SUMMARY_MAX_TOKENS: int = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+    SUMMARY_TIMEOUT: float = float(os.getenv("SUMMARY_TIMEOUT", "30"))
+
+    # Screenshot preprocessing before vision calls
+    IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", "4"))
+    IMAGE_MAX_LONG_SIDE: int = int(os.getenv("IMAGE_MAX_LONG_SIDE", "2048"))
+    IMAGE_MAX_SHORT_SIDE: int = int(os.getenv("IMAGE_MAX_SHORT_SIDE", "768"))
+    IMAGE_FORMAT: str = os.getenv("IMAGE_FORMAT", "JPEG")  # JPEG, WEBP or PNG
+    IMAGE_QUALITY: int = int(os.getenv("IMAGE_QUALITY", "85"))
+    IMAGE_CROP_BARS: bool = os.getenv("IMAGE_CROP_BARS", "false").lower() == "true"
+    IMAGE_CROP_MIN_ASPECT: float = float(os.getenv("IMAGE_CROP_MIN_ASPECT", "1.6"))
+    IMAGE_STATUS_BAR_RATIO: float = float(os.getenv("IMAGE_STATUS_BAR_RATIO", "0.045"))
+    IMAGE_NAV_BAR_RATIO: float = float(os.getenv("IMAGE_NAV_BAR_RATIO", "0.04"))
+
+    # Result cache for screenshot analysis and reply generation
+    CACHE_DB_PATH: str = os.getenv("CACHE_DB_PATH", "./cache.db")
+    CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+    CACHE_PERSISTENT_MAX_ENTRIES: int = int(os.getenv("CACHE_PERSISTENT_MAX_ENTRIES", "10000"))
+    CACHE_NEAR_DUPLICATES: bool = os.getenv("CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+    CACHE_PHASH_MAX_DISTANCE: int = int(os.getenv("CACHE_PHASH_MAX_DISTANCE", "8"))
+
+    # Identical concurrent requests share one upstream call (see DEFAULT_SINGLE_FLIGHT_SCOPES)
+    SINGLE_FLIGHT_SCOPES: dict = {**DEFAULT_SINGLE_FLIGHT_SCOPES, **json.loads(os.getenv("SINGLE_FLIGHT_SCOPES", "{}"))}
+
+    # Multi-screenshot batch analysis
+    BATCH_MAX_IMAGES: int = int(os.getenv("BATCH_MAX_IMAGES", "10"))
+    BATCH_VISION_CONCURRENCY: int = int(os.getenv("BATCH_VISION_CONCURRENCY", "4"))
+
+    # Upload size limits (requests over the limit are rejected with 413 before parsing)
+    UPLOAD_MAX_IMAGE_BYTES: int = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+    UPLOAD_MAX_AUDIO_BYTES: int = int(os.getenv("UPLOAD_MAX_AUDIO_BYTES", str(50 * 1024 * 1024)))
+    UPLOAD_FORM_OVERHEAD_BYTES: int = int(os.getenv("UPLOAD_FORM_OVERHEAD_BYTES", str(64 * 1024)))
+    UPLOAD_MAX_IMPORT_BYTES: int = int(os.getenv("UPLOAD_MAX_IMPORT_BYTES", str(50 * 1024 * 1024)))
+
+    # Chat export import (WhatsApp, iMessage, Telegram) and pasted conversations
+    IMPORT_READ_CHUNK_BYTES: int = int(os.getenv("IMPORT_READ_CHUNK_BYTES", str(64 * 1024)))
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))  # messages per insert and commit
+    IMPORT_SENDER_SCAN_MESSAGES: int = int(os.getenv("IMPORT_SENDER_SCAN_MESSAGES", "5000"))  # read before picking the contact's sender
+    IMPORT_MEMORY_MESSAGES: int = int(os.getenv("IMPORT_MEMORY_MESSAGES", "200"))  # latest messages mined for memories
+    IMPORT_CONTEXT_MESSAGES: int = int(os.getenv("IMPORT_CONTEXT_MESSAGES", "30"))  # latest messages used as reply context
+
+    # Voice note transcription (long audio is split on silence with ffmpeg)
+    FFMPEG_PATH: str = os.getenv("FFMPEG_PATH", "ffmpeg")
+    TRANSCRIPTION_DIRECT_MAX_BYTES: int = int(os.getenv("TRANSCRIPTION_DIRECT_MAX_BYTES", str(1024 * 1024)))
+    TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS: float = float(os.getenv("TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS", "90"))
+    TRANSCRIPTION_CHUNK_SECONDS: float = float(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "60"))
+    TRANSCRIPTION_MAX_CHUNK_SECONDS: float = float(os.getenv("TRANSCRIPTION_MAX_CHUNK_SECONDS", "120"))
+    TRANSCRIPTION_SILENCE_DB: float = float(os.getenv("TRANSCRIPTION_SILENCE_DB", "-35"))
+    TRANSCRIPTION_MIN_SILENCE_SECONDS: float = float(os.getenv("TRANSCRIPTION_MIN_SILENCE_SECONDS", "0.4"))
+    TRANSCRIPTION_CONCURRENCY: int = int(os.getenv("TRANSCRIPTION_CONCURRENCY", "4"))
 
 settings = Settings()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from core.metrics import JOB_DURATION, JOB_QUEUE_DEPTH, JOBS_DROPPED
+from core.scheduler import Priority, current_priority
+from core.usage import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """In-process background job queue with bounded concurrency.
+
+    Jobs are handed to `handler` in batches: a worker takes one job, then
+    greedily collects whatever else is already waiting (up to `batch_size`),
+    so quiet periods process jobs one at a time and busy periods coalesce
+    them into fewer handler calls. Failed batches are retried with
+    exponential backoff before being dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[list[Any]], Awaitable[None]],
+        maxsize: int = 500,
+        workers: int = 2,
+        batch_size: int = 5,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        enqueue_timeout: float = 0.5,
+    ):
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.enqueue_timeout = enqueue_timeout
+
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.dropped = 0
+        self.failed = 0
+        JOB_QUEUE_DEPTH.labels(name).set_function(lambda: self.depth)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        """Spawn the worker tasks (needs a running event loop)."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def enqueue(self, job: Any) -> bool:
+        """Queue a job. Waits briefly when the queue is full (backpressure), then drops it."""
+        if not self.running:
+            self.start()
+        try:
+            await asyncio.wait_for(self._queue.put(job), timeout=self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            JOBS_DROPPED.labels(self.name).inc()
+            logger.warning("queue full, dropping job", extra={"queue": self.name})
+            return False
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait for queued jobs to finish (up to `timeout`), then stop the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("queue drain timed out", extra={"queue": self.name, "pending": self.depth})
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def _worker(self):
+        # Model calls made by background jobs queue behind interactive requests
+        current_priority.set(Priority.BACKGROUND)
+        current_endpoint.set(f"job:{self.name}")
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._run_with_retry(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _run_with_retry(self, batch: list[Any]):
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.handler(batch)
+                JOB_DURATION.labels(self.name, "success").observe(time.perf_counter() - started)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    JOB_DURATION.labels(self.name, "failure").observe(time.perf_counter() - started)
+                    logger.exception(
+                        "job failed", extra={"queue": self.name, "attempts": attempt + 1, "batch_size": len(batch)}
+                    )
+                    return
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
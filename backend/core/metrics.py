@@ -0,0 +1,144 @@
+import contextvars
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.logs import current_request_id
+
+logger = logging.getLogger(__name__)
+
+# Upstream model calls and whole requests run for seconds; stages can be sub-millisecond
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body",
+    ["method", "route", "status"], buckets=REQUEST_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests currently being handled", ["method"])
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds", "Time spent in one stage of handling a request or job",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+MODEL_CALL_DURATION = Histogram(
+    "model_call_duration_seconds", "Upstream model call latency (to the first chunk when streaming)",
+    ["task", "model", "outcome"], buckets=REQUEST_BUCKETS,
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "upstream_queue_wait_seconds", "Time a model call waited for a scheduler slot",
+    ["model", "priority"], buckets=STAGE_BUCKETS,
+)
+JOB_DURATION = Histogram(
+    "job_duration_seconds", "Background job batch handling time",
+    ["queue", "outcome"], buckets=REQUEST_BUCKETS,
+)
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Jobs waiting in a background queue", ["queue"])
+CHAT_CONNECTIONS = Gauge("chat_websocket_connections", "Open chat WebSocket connections")
+JOBS_DROPPED = Counter("jobs_dropped_total", "Jobs dropped because the queue was full", ["queue"])
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total", "Requests that started an upstream call (leader) or joined one (coalesced)",
+    ["flight", "role"],
+)
+
+# Per-request stage totals, reported in the request log line and the Server-Timing header
+_request_stages: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("request_stages", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_DURATION.labels(stage).observe(seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one `stage` (works in sync and async code)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records body serialization as its own stage."""
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+class TimingMiddleware:
+    """Times every request end to end, tags it with a request id, and logs one structured
+    line with the per-stage breakdown (also sent as a Server-Timing header when the stages
+    finish before the response starts)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        request_token = current_request_id.set(request_id)
+        stages: dict[str, float] = {}
+        stages_token = _request_stages.set(stages)
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(method).inc()
+
+        async def timed_receive() -> Message:
+            # Time spent waiting for the request body is the upload read
+            receive_started = time.perf_counter()
+            message = await receive()
+            if message["type"] == "http.request":
+                observe_stage("upload_read", time.perf_counter() - receive_started)
+            return message
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                server_timing = ", ".join(
+                    f"{stage.replace('.', '-')};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()
+                )
+                extra = [(b"x-request-id", request_id.encode("latin-1"))]
+                if server_timing:
+                    extra.append((b"server-timing", server_timing.encode("latin-1")))
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, send_with_timing)
+        finally:
+            duration = time.perf_counter() - started
+            REQUESTS_IN_PROGRESS.labels(method).dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_DURATION.labels(method, route, str(status)).observe(duration)
+            logger.info(
+                "request",
+                extra={
+                    "method": method,
+                    "route": route,
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 1),
+                    "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+                },
+            )
+            _request_stages.reset(stages_token)
+            current_request_id.reset(request_token)
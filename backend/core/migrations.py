@@ -0,0 +1,151 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from core.database import Base
+from models.conversation import fact_hash
+
+logger = logging.getLogger(__name__)
+
+# Schema changes to tables that already exist, applied in order and recorded in schema_version.
+# create_all() only creates missing tables, so existing databases are brought up to date here.
+# Every step must be safe to run against a freshly created table as well.
+
+
+def _add_columns(conn: Connection, table: str, columns: list[tuple[str, str]]):
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _chat_session_summary(conn: Connection):
+    _add_columns(conn, "chat_sessions", [
+        ("summary", "TEXT"),
+        ("summarized_until_id", "INTEGER DEFAULT 0"),
+    ])
+
+
+def _contact_memory_fact_hash(conn: Connection):
+    _add_columns(conn, "contact_memories", [("fact_hash", "VARCHAR(64)")])
+
+    rows = conn.execute(text("SELECT id, fact FROM contact_memories WHERE fact_hash IS NULL")).all()
+    if rows:
+        conn.execute(
+            text("UPDATE contact_memories SET fact_hash = :hash WHERE id = :id"),
+            [{"id": row.id, "hash": fact_hash(row.fact)} for row in rows],
+        )
+
+    # Keep the oldest copy of each duplicate before the unique index goes on
+    conn.execute(text(
+        """DELETE FROM contact_memories WHERE id NOT IN (
+            SELECT MIN(id) FROM contact_memories GROUP BY contact_name, fact_hash
+        )"""
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_contact_memories_contact_fact "
+        "ON contact_memories (contact_name, fact_hash)"
+    ))
+
+
+def _chat_sessions_scoped(conn: Connection):
+    _add_columns(conn, "chat_sessions", [("title", "VARCHAR")])
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_session_created ON chat_messages (session_id, created_at)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated_at ON chat_sessions (updated_at)"))
+
+
+# Full-text search over contacts and memory facts. On SQLite, one FTS5 table kept in sync
+# by triggers; rowids interleave the sources (contacts 2*id, memories 2*id + 1) so a row is
+# found by rowid on update and delete. Postgres searches GIN expression indexes instead,
+# which it maintains itself (the expressions must match services/contact_search.py).
+_SQLITE_SEARCH_SOURCES = [
+    # table, rowid offset, kind, name expression, body expression, columns that trigger a reindex
+    ("contacts", 0, "contact", "name", "trim(coalesce({row}.nickname, '') || ' ' || coalesce({row}.notes, ''))", "name, nickname, notes"),
+    ("contact_memories", 1, "memory", "contact_name", "{row}.fact", "contact_name, fact"),
+]
+POSTGRES_CONTACT_VECTOR = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(nickname, '') || ' ' || coalesce(notes, ''))"
+)
+POSTGRES_MEMORY_VECTOR = "to_tsvector('simple', contact_name || ' ' || fact)"
+
+
+def _search_index(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_contact_memories_contact_lower ON contact_memories (lower(contact_name))"
+    ))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_contacts_search ON contacts USING GIN (({POSTGRES_CONTACT_VECTOR}))"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_contact_memories_search ON contact_memories USING GIN (({POSTGRES_MEMORY_VECTOR}))"))
+        return
+
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS contact_search "
+        "USING fts5(kind UNINDEXED, name, body, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    for table, offset, kind, name, body, columns in _SQLITE_SEARCH_SOURCES:
+        def row_values(row: str) -> str:
+            return f"{row}.id * 2 + {offset}, '{kind}', {row}.{name}, {body.format(row=row)}"
+
+        insert = f"INSERT INTO contact_search (rowid, kind, name, body) VALUES ({row_values('new')});"
+        delete = f"DELETE FROM contact_search WHERE rowid = old.id * 2 + {offset};"
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END"))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table} "
+            f"BEGIN {delete} {insert} END"
+        ))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END"))
+        conn.execute(text(
+            f"INSERT INTO contact_search (rowid, kind, name, body) SELECT {row_values(table)} FROM {table}"
+        ))
+
+
+def _contact_message_key(conn: Connection):
+    # Rows stored before keys existed keep NULL, which the unique index doesn't compare
+    _add_columns(conn, "contact_messages", [("message_key", "VARCHAR(64)")])
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_contact_messages_contact_key "
+        "ON contact_messages (contact_id, message_key)"
+    ))
+
+
+MIGRATIONS = [
+    (1, _chat_session_summary),
+    (2, _contact_memory_fact_hash),
+    (3, _chat_sessions_scoped),
+    (4, _search_index),
+    (5, _contact_message_key),
+]
+
+
+def _schema_version(conn: Connection) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+# Serializes migrations between workers starting at the same time. Postgres only; with
+# SQLite, use a single worker or MIGRATE_ON_STARTUP=false and `python manage.py migrate`.
+_POSTGRES_MIGRATION_LOCK = 0x6D696772
+
+
+def _migrate(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _POSTGRES_MIGRATION_LOCK})
+    Base.metadata.create_all(bind=conn)
+
+    current = _schema_version(conn)
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        migration(conn)
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+        logger.info("applied schema migration", extra={"version": version, "migration": migration.__name__.lstrip("_")})
+
+
+async def run_migrations(engine: AsyncEngine):
+    """Create missing tables, then apply pending schema migrations in one transaction."""
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate)
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import cache
+
+from core.config import settings
+from core.metrics import MODEL_CALL_DURATION, observe_stage
+from core.openai_client import create_chat_completion, create_transcription
+from core.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@cache
+def fallback_errors() -> tuple[type[BaseException], ...]:
+    """Errors that say something about the model's health (as opposed to the request),
+    so they count against its circuit breaker and move the call on to the fallback.
+
+    Resolved on first use, after the client has imported the SDK.
+    """
+    import openai
+
+    return (
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        openai.RateLimitError,
+        openai.NotFoundError,  # model not available on this account
+        asyncio.TimeoutError,
+    )
+
+
+class CircuitBreaker:
+    """closed -> open after CIRCUIT_FAILURE_THRESHOLD consecutive failures; after
+    CIRCUIT_RESET_SECONDS one trial call is let through (half open), which closes
+    the breaker on success or re-opens it on failure.
+
+    available() claims the half-open trial in the same step that reports it free, so
+    concurrent requests can't all pass the check before one of them starts the call;
+    a claimed trial that ends up not being made must be given back with release()."""
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def available(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < settings.CIRCUIT_RESET_SECONDS:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def release(self):
+        """Give back a half-open trial that available() claimed but no call was made for."""
+        if self.state == "half_open":
+            self._trial_in_flight = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= settings.CIRCUIT_FAILURE_THRESHOLD:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def record_ignored(self):
+        """The call failed for a reason unrelated to model health (e.g. a bad request)."""
+        self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies (time to first chunk when streaming)."""
+
+    def __init__(self):
+        self._samples: deque[float] = deque(maxlen=settings.HEDGE_WINDOW)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    """Picks the model for each task and makes the call resilient.
+
+    Each task has an ordered list of models (MODEL_ROUTES). Models whose circuit breaker
+    is open are skipped; a call that fails with a health error falls back to the next
+    model. A call still running after the model's p95 latency for that task is hedged
+    with a second request (to the next model when there is one), and the first
+    successful response wins.
+    """
+
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latency: dict[tuple[str, str], LatencyTracker] = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def models(self, task: str) -> list[str]:
+        return settings.MODEL_ROUTES[task]
+
+    def chat_task(self, content: str, has_image: bool) -> str:
+        """Screenshots need the vision route; short text-only messages take the cheap one."""
+        if has_image:
+            return "chat_vision"
+        if len(content or "") <= settings.CHAT_SHORT_MAX_CHARS:
+            return "chat_short"
+        return "chat"
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker()
+        return self._breakers[model]
+
+    def _tracker(self, task: str, model: str) -> LatencyTracker:
+        key = (task, model)
+        if key not in self._latency:
+            self._latency[key] = LatencyTracker()
+        return self._latency[key]
+
+    def _candidates(self, task: str) -> list[str]:
+        models = self.models(task)
+        # Claims the half-open trial of each model returned; see _release_unused.
+        # With every breaker open, still try the primary rather than fail outright
+        return [model for model in models if self._breaker(model).available()] or models[:1]
+
+    def _release_unused(self, candidates: list[str], tried: set[str]):
+        for model in candidates:
+            if model not in tried:
+                self._breaker(model).release()
+
+    def _hedge_delay(self, task: str, model: str) -> float | None:
+        if not settings.HEDGE_ENABLED:
+            return None
+        p95 = self._tracker(task, model).quantile(0.95)
+        if p95 is None:
+            return None
+        return max(p95, settings.HEDGE_MIN_DELAY)
+
+    def _has_capacity(self, model: str) -> bool:
+        # A hedge that would only queue behind other calls adds load without cutting latency
+        limiter = scheduler.limiter(model)
+        return limiter.depth == 0 and limiter.in_flight < limiter.concurrency
+
+    async def _call(self, task: str, model: str, stream: bool, max_retries: int | None, kwargs: dict):
+        breaker = self._breaker(model)
+        started = time.monotonic()
+        try:
+            response = await create_chat_completion(model=model, stream=stream, max_retries=max_retries, **kwargs)
+            if stream:
+                # Hedging and latency for a stream are about the first chunk
+                try:
+                    first = await response.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                response = PrefetchedStream(first, response)
+        except fallback_errors():
+            breaker.record_failure()
+            self._observe(task, model, "failure", started)
+            raise
+        except asyncio.CancelledError:
+            breaker.record_ignored()
+            self._observe(task, model, "cancelled", started)
+            raise
+        except BaseException:
+            breaker.record_ignored()
+            self._observe(task, model, "error", started)
+            raise
+        breaker.record_success()
+        self._tracker(task, model).add(self._observe(task, model, "success", started))
+        return response
+
+    def _observe(self, task: str, model: str, outcome: str, started: float) -> float:
+        elapsed = time.monotonic() - started
+        MODEL_CALL_DURATION.labels(task, model, outcome).observe(elapsed)
+        observe_stage(f"model.{task}", elapsed)
+        return elapsed
+
+    async def _hedged_call(
+        self, task: str, model: str, hedge_model: str, stream: bool, max_retries: int | None, kwargs: dict,
+        tried: set[str],
+    ):
+        """Call `model`, hedged to `hedge_model` once it runs past its p95. Every model
+        called is added to `tried`."""
+        tried.add(model)
+        delay = self._hedge_delay(task, model)
+        primary = asyncio.create_task(self._call(task, model, stream, max_retries, kwargs))
+        if delay is None:
+            return await primary
+
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._has_capacity(hedge_model):
+                winner = primary
+                return await primary
+
+            self.hedged += 1
+            tried.add(hedge_model)
+            tasks.append(asyncio.create_task(self._call(task, hedge_model, stream, max_retries, kwargs)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    if finished.exception() is None:
+                        winner = finished
+                        if finished is not primary:
+                            self.hedge_wins += 1
+                        return finished.result()
+            raise primary.exception()
+        finally:
+            for loser in tasks:
+                if loser is winner:
+                    continue
+                if not loser.done():
+                    loser.cancel()
+                elif stream and not loser.cancelled() and loser.exception() is None:
+                    # Both streams opened: close the loser to free its connection and slot
+                    await loser.result().close()
+
+    async def chat_completion(self, task: str, *, stream: bool = False, timeout: float | None = None, **kwargs):
+        """Chat completion for `task` with circuit breaking, fallback and hedging."""
+        candidates = self._candidates(task)
+        tried: set[str] = set()
+        try:
+            return await self._chat_completion(task, candidates, tried, stream, timeout, kwargs)
+        finally:
+            self._release_unused(candidates, tried)
+
+    async def _chat_completion(
+        self, task: str, candidates: list[str], tried: set[str], stream: bool, timeout: float | None, kwargs: dict
+    ):
+        last_error = None
+        while True:
+            # A hedge that failed along with its primary is not a fallback worth retrying
+            remaining = [model for model in candidates if model not in tried]
+            if not remaining:
+                raise last_error
+            model = remaining[0]
+            is_last = len(remaining) == 1
+            hedge_model = model if is_last else remaining[1]
+            # With a fallback to go to, don't spend the SDK's full retry budget on this model
+            max_retries = None if is_last else settings.ROUTER_FALLBACK_MAX_RETRIES
+            try:
+                return await self._hedged_call(
+                    task, model, hedge_model, stream, max_retries, {**kwargs, "timeout": timeout}, tried
+                )
+            except fallback_errors() as e:
+                last_error = e
+                fallback = next((candidate for candidate in candidates if candidate not in tried), None)
+                if fallback is not None:
+                    self.fallbacks += 1
+                    logger.warning(
+                        "model call failed, falling back",
+                        extra={"task": task, "model": model, "error": e.__class__.__name__, "fallback": fallback},
+                    )
+
+    async def transcription(self, *, timeout: float | None = None, **kwargs):
+        """Audio transcription with circuit breaking and fallback (never hedged)."""
+        candidates = self._candidates("transcription")
+        tried: set[str] = set()
+        try:
+            return await self._transcription(candidates, tried, timeout, kwargs)
+        finally:
+            self._release_unused(candidates, tried)
+
+    async def _transcription(self, candidates: list[str], tried: set[str], timeout: float | None, kwargs: dict):
+        last_error = None
+        for model in candidates:
+            tried.add(model)
+            breaker = self._breaker(model)
+            started = time.monotonic()
+            try:
+                result = await create_transcription(model=model, timeout=timeout, **kwargs)
+            except fallback_errors() as e:
+                breaker.record_failure()
+                self._observe("transcription", model, "failure", started)
+                last_error = e
+                continue
+            except asyncio.CancelledError:
+                breaker.record_ignored()
+                self._observe("transcription", model, "cancelled", started)
+                raise
+            except BaseException:
+                breaker.record_ignored()
+                self._observe("transcription", model, "error", started)
+                raise
+            breaker.record_success()
+            self._observe("transcription", model, "success", started)
+            return result
+        raise last_error
+
+    def stats(self) -> dict:
+        latency = {}
+        for (task, model), tracker in self._latency.items():
+            p50, p95 = tracker.quantile(0.5), tracker.quantile(0.95)
+            latency.setdefault(task, {})[model] = {
+                "samples": len(tracker._samples),
+                "p50_ms": round(p50 * 1000) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            }
+        return {
+            "routes": settings.MODEL_ROUTES,
+            "breakers": {
+                model: {"state": breaker.state, "consecutive_failures": breaker.failures, "times_opened": breaker.opened}
+                for model, breaker in self._breakers.items()
+            },
+            "latency": latency,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+        }
+
+
+class PrefetchedStream:
+    """A stream whose first chunk has already been read."""
+
+    def __init__(self, first, stream):
+        self._first = first
+        self._stream = stream
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        return await self._stream.__anext__()
+
+    async def close(self):
+        await self._stream.close()
+
+
+model_router = ModelRouter()
@@ -0,0 +1,165 @@
+import asyncio
+import importlib
+from typing import TYPE_CHECKING
+
+import httpx
+from core.config import settings
+from core.scheduler import ModelLimiter, Reservation, scheduler
+from core.tokens import estimate_tokens
+from core.usage import usage_tracker
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# A high-detail image at the preprocessed size (2048x768 -> 8 tiles x 170 + 85)
+IMAGE_TOKENS = 1445
+
+# One async client (and one HTTP connection pool) shared by every service. The SDK takes
+# a third of the app's import time, so it is only imported when the client is first needed.
+_client: "AsyncOpenAI | None" = None
+
+
+def get_client() -> "AsyncOpenAI":
+    """Return the shared AsyncOpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        timeout = httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+        http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+        # The SDK retries connection errors, 408/409/429 and 5xx responses
+        # with exponential backoff and jitter (honouring Retry-After).
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=timeout,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            http_client=http_client,
+        )
+    return _client
+
+
+async def preload_sdk():
+    """Import the SDK in a worker thread, so the first model call doesn't pay for it."""
+    await asyncio.to_thread(importlib.import_module, "openai")
+
+
+async def close_client():
+    """Close the shared client and its connection pool."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def estimate_request_tokens(kwargs: dict) -> int:
+    """Prompt plus completion tokens a chat completion may use, for the TPM reservation."""
+    tokens = 0
+    for message in kwargs.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                tokens += estimate_tokens(part.get("text", "")) if part.get("type") == "text" else IMAGE_TOKENS
+    return tokens + (kwargs.get("max_tokens") or settings.SCHEDULER_DEFAULT_COMPLETION_TOKENS)
+
+
+class ScheduledStream:
+    """Wraps a streaming response so its scheduler slot is held until the stream ends."""
+
+    def __init__(self, stream, model: str, limiter: ModelLimiter, reservation: Reservation):
+        self._stream = stream
+        self._model = model
+        self._limiter = limiter
+        self._reservation = reservation
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except BaseException:
+            self._release()
+            raise
+        if getattr(chunk, "usage", None) is not None:
+            self._reservation.settle(chunk.usage.total_tokens)
+            usage_tracker.record(self._model, chunk.usage)
+        return chunk
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        # Consumer stopped iterating early (e.g. the client disconnected)
+        if not self._released:
+            try:
+                self._release()
+            except RuntimeError:
+                pass
+
+
+def _client_for(max_retries: int | None) -> "AsyncOpenAI":
+    client = get_client()
+    return client if max_retries is None else client.with_options(max_retries=max_retries)
+
+
+async def create_chat_completion(*, timeout: float | None = None, max_retries: int | None = None, **kwargs):
+    """Run a chat completion on the shared client with a per-call timeout.
+
+    The call waits for a slot from the shared scheduler (per-model concurrency and
+    RPM/TPM limits, interactive before background, fair between clients). A streaming
+    call holds its slot until the stream is consumed.
+    """
+    model = kwargs["model"]
+    tokens = estimate_request_tokens(kwargs)
+    if kwargs.get("stream"):
+        # Ask for a final usage chunk so streamed calls are accounted for too
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        limiter = scheduler.limiter(model)
+        await limiter.acquire(tokens)
+        try:
+            stream = await _client_for(max_retries).chat.completions.create(
+                timeout=timeout or settings.OPENAI_TIMEOUT,
+                **kwargs,
+            )
+        except BaseException:
+            limiter.release()
+            raise
+        return ScheduledStream(stream, model, limiter, Reservation(limiter, tokens))
+
+    async with scheduler.slot(model, tokens) as reservation:
+        response = await _client_for(max_retries).chat.completions.create(
+            timeout=timeout or settings.OPENAI_TIMEOUT,
+            **kwargs,
+        )
+        if response.usage is not None:
+            reservation.settle(response.usage.total_tokens)
+            usage_tracker.record(model, response.usage)
+        return response
+
+
+async def create_transcription(*, timeout: float | None = None, max_retries: int | None = None, **kwargs):
+    """Run an audio transcription on the shared client with a per-call timeout."""
+    async with scheduler.slot(kwargs["model"]):
+        return await _client_for(max_retries).audio.transcriptions.create(
+            timeout=timeout or settings.OPENAI_TIMEOUT,
+            **kwargs,
+        )
@@ -0,0 +1,262 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core.config import settings
+from core.metrics import UPSTREAM_QUEUE_WAIT, observe_stage
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # a user is waiting on the response (chat, analyze, reply)
+    BACKGROUND = 1  # memory extraction, summaries
+
+
+# Set per request by ClientContextMiddleware and per worker by JobQueue
+current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("current_priority", default=Priority.INTERACTIVE)
+current_client: contextvars.ContextVar[str] = contextvars.ContextVar("current_client", default="anonymous")
+
+
+class SchedulerTimeout(Exception):
+    """A call waited longer than SCHEDULER_QUEUE_TIMEOUT for an upstream slot."""
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` per second up to `per_minute`."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is now). Amounts above capacity
+        only need a full bucket, so one oversize request cannot block forever."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity) - self.available
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self._refill()
+            self.available -= amount
+
+    def give(self, amount: float):
+        """Return (or, when negative, charge) tokens after the real usage is known."""
+        if self.capacity > 0:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+
+@dataclass
+class _Waiter:
+    priority: Priority
+    client: str
+    tokens: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ModelLimiter:
+    """Concurrency limit plus requests- and tokens-per-minute buckets for one model.
+
+    Waiters are served strictly by priority; within a priority, clients take turns
+    (round robin over per-client FIFO queues) so one busy client cannot starve the rest.
+    """
+
+    def __init__(self, model: str, concurrency: int, rpm: float, tpm: float):
+        self.model = model
+        self.concurrency = concurrency
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self._queues: dict[Priority, OrderedDict[str, deque[_Waiter]]] = {p: OrderedDict() for p in Priority}
+        self._timer: asyncio.TimerHandle | None = None
+
+        self.dispatched = 0
+        self.throttled = 0  # dispatches delayed by a rate bucket
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        return sum(len(q) for clients in self._queues.values() for q in clients.values())
+
+    def _head(self) -> tuple[Priority, str, _Waiter] | None:
+        for priority in Priority:
+            clients = self._queues[priority]
+            for client, queue in clients.items():
+                return priority, client, queue[0]
+        return None
+
+    def _pop(self, priority: Priority, client: str) -> _Waiter:
+        clients = self._queues[priority]
+        queue = clients.pop(client)
+        waiter = queue.popleft()
+        if queue:
+            # Back of the rotation: the next dispatch at this priority goes to another client
+            clients[client] = queue
+        return waiter
+
+    def _remove(self, waiter: _Waiter):
+        clients = self._queues[waiter.priority]
+        queue = clients.get(waiter.client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del clients[waiter.client]
+
+    def dispatch(self):
+        self._timer = None
+        while self.in_flight < self.concurrency:
+            head = self._head()
+            if head is None:
+                return
+            priority, client, waiter = head
+            if waiter.future.done():
+                self._pop(priority, client)
+                continue
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens))
+            if delay > 0:
+                self.throttled += 1
+                self._timer = asyncio.get_running_loop().call_later(delay, self.dispatch)
+                return
+            self._pop(priority, client)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            self.dispatched += 1
+            wait = time.monotonic() - waiter.enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            waiter.future.set_result(None)
+
+    async def acquire(self, tokens: int):
+        waiter = _Waiter(
+            priority=current_priority.get(),
+            client=current_client.get(),
+            tokens=tokens,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._queues[waiter.priority].setdefault(waiter.client, deque()).append(waiter)
+        if self._timer is None:
+            self.dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=settings.SCHEDULER_QUEUE_TIMEOUT or None)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we gave up: hand the slot back
+                self.release()
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise SchedulerTimeout(f"Timed out waiting for a {self.model} slot ({self.depth} queued)") from None
+            raise
+        wait = time.monotonic() - waiter.enqueued_at
+        UPSTREAM_QUEUE_WAIT.labels(self.model, waiter.priority.name.lower()).observe(wait)
+        observe_stage("upstream_queue", wait)
+
+    def release(self):
+        self.in_flight -= 1
+        if self._timer is None:
+            self.dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": {p.name.lower(): sum(len(q) for q in self._queues[p].values()) for p in Priority},
+            "requests_available": round(self.requests.available, 1) if self.requests.capacity else None,
+            "tokens_available": round(self.tokens.available) if self.tokens.capacity else None,
+            "dispatched": self.dispatched,
+            "throttled": self.throttled,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(1000 * self.total_wait / self.dispatched, 1) if self.dispatched else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 1),
+        }
+
+
+class Scheduler:
+    """Shared gate for every upstream model call: queues, prioritizes and rate-limits per model."""
+
+    def __init__(self):
+        self._limiters: dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limits = settings.MODEL_LIMITS.get(model, {})
+            limiter = ModelLimiter(
+                model,
+                concurrency=limits.get("concurrency", settings.MODEL_DEFAULT_CONCURRENCY),
+                rpm=limits.get("rpm", settings.MODEL_DEFAULT_RPM),
+                tpm=limits.get("tpm", settings.MODEL_DEFAULT_TPM),
+            )
+            self._limiters[model] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int = 0) -> AsyncIterator["Reservation"]:
+        """Hold one upstream slot for `model`, reserving an estimated `tokens` against its TPM."""
+        limiter = self.limiter(model)
+        await limiter.acquire(tokens)
+        reservation = Reservation(limiter, tokens)
+        try:
+            yield reservation
+        finally:
+            limiter.release()
+
+    def stats(self) -> dict:
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
+
+
+class Reservation:
+    def __init__(self, limiter: ModelLimiter, tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: int | None):
+        """Correct the TPM bucket once the real token usage is known."""
+        if actual_tokens is not None:
+            self.limiter.tokens.give(self.tokens - actual_tokens)
+            self.tokens = actual_tokens
+
+
+scheduler = Scheduler()
+
+
+class ClientContextMiddleware:
+    """Tags each request with a client id (X-Client-ID header, else the peer address)
+    so the scheduler can share upstream capacity fairly between clients."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        client = dict(scope["headers"]).get(b"x-client-id", b"").decode("latin-1")[:64]
+        if not client and scope.get("client"):
+            client = scope["client"][0]
+        token = current_client.set(client or "anonymous")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
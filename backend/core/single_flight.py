@@ -0,0 +1,93 @@
+import asyncio
+import copy
+from typing import Awaitable, Callable, TypeVar
+
+from core.config import settings
+from core.metrics import SINGLE_FLIGHT_REQUESTS
+from core.scheduler import current_client
+
+T = TypeVar("T")
+
+SCOPES = ("global", "client", "off")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests onto one upstream call.
+
+    The first caller for a key starts the work as its own task; callers arriving while it
+    runs await the same task and get a copy of its result, or its exception. The task
+    outlives a caller that goes away and is only cancelled when nobody is waiting on it.
+    Who counts as identical is the endpoint's SINGLE_FLIGHT_SCOPES entry: "global" shares
+    between all clients, "client" only between requests of one client, "off" never.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    @property
+    def scope(self) -> str:
+        scope = settings.SINGLE_FLIGHT_SCOPES.get(self.name, "global")
+        return scope if scope in SCOPES else "global"
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        scope = self.scope
+        if scope == "off":
+            return await fn()
+        if scope == "client":
+            key = f"{current_client.get()}:{key}"
+
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(asyncio.create_task(fn()))
+            flight.task.add_done_callback(lambda task, key=key: self._finished(key, task))
+            self._flights[key] = flight
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        SINGLE_FLIGHT_REQUESTS.labels(self.name, "leader" if leader else "coalesced").inc()
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.cancelled() or flight.waiters > 1:
+                raise
+            # The last caller went away: nobody needs the result any more
+            flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+        # Callers may modify what they get back
+        return result if leader else copy.deepcopy(result)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is not None and self._flights[key].task is task:
+            del self._flights[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.coalesced
+        return {
+            "scope": self.scope,
+            "in_flight": len(self._flights),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "coalesced_rate": self.coalesced / calls if calls else 0.0,
+        }
+
+
+analyze_flight = SingleFlight("analyze")
+reply_flight = SingleFlight("reply")
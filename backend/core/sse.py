@@ -0,0 +1,26 @@
+import json
+from typing import Any, AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+from core.metrics import span
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one server-sent event frame."""
+    with span("serialize"):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events: AsyncIterator[tuple[str, Any]]) -> StreamingResponse:
+    """Wrap an async iterator of (event, data) pairs in a text/event-stream response."""
+    async def body():
+        async for event, data in events:
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Stop proxies (nginx, Railway edge) from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
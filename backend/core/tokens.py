@@ -0,0 +1,3 @@
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for budgeting prompt space."""
+    return max(1, len(text) // 4)
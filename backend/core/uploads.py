@@ -0,0 +1,165 @@
+import base64
+import io
+import resource
+from collections import defaultdict
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+# Multiple of 3 so every chunk base64-encodes without padding
+B64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def _endpoint_limits() -> dict[str, int]:
+    """Maximum request body size per upload endpoint (path under the API prefix -> bytes)."""
+    image = settings.UPLOAD_MAX_IMAGE_BYTES + settings.UPLOAD_FORM_OVERHEAD_BYTES
+    return {
+        "analyze/batch": settings.UPLOAD_MAX_IMAGE_BYTES * settings.BATCH_MAX_IMAGES + settings.UPLOAD_FORM_OVERHEAD_BYTES,
+        "analyze": image,
+        "chat": image,
+        "transcribe": settings.UPLOAD_MAX_AUDIO_BYTES + settings.UPLOAD_FORM_OVERHEAD_BYTES,
+        "contacts/import": settings.UPLOAD_MAX_IMPORT_BYTES + settings.UPLOAD_FORM_OVERHEAD_BYTES,
+    }
+
+
+ENDPOINT_LIMITS = _endpoint_limits()
+
+
+def limit_for_path(path: str) -> tuple[str, int] | None:
+    """The (endpoint, limit) with the longest prefix matching `path`, if any."""
+    best = None
+    for endpoint, limit in ENDPOINT_LIMITS.items():
+        prefix = f"{settings.API_V1_STR}/{endpoint}"
+        if path == prefix or path.startswith(prefix + "/"):
+            if best is None or len(endpoint) > len(best[0]):
+                best = (endpoint, limit)
+    return best
+
+
+class UploadStats:
+    """Per-endpoint upload counters plus process memory, exposed at /system/uploads."""
+
+    def __init__(self):
+        self._endpoints = defaultdict(lambda: {"files": 0, "bytes": 0, "largest": 0, "spooled_to_disk": 0, "rejected": 0})
+
+    def record(self, endpoint: str, size: int, on_disk: bool):
+        stats = self._endpoints[endpoint]
+        stats["files"] += 1
+        stats["bytes"] += size
+        stats["largest"] = max(stats["largest"], size)
+        stats["spooled_to_disk"] += on_disk
+
+    def reject(self, endpoint: str):
+        self._endpoints[endpoint]["rejected"] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "limits": ENDPOINT_LIMITS,
+            "endpoints": {endpoint: dict(stats) for endpoint, stats in self._endpoints.items()},
+            "memory": {"rss_bytes": _current_rss(), "peak_rss_bytes": _peak_rss()},
+        }
+
+
+def _current_rss() -> int | None:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+upload_stats = UploadStats()
+
+
+def _too_large(limit: int) -> str:
+    return f"Upload too large (limit {limit / (1024 * 1024):.1f} MB)"
+
+
+class UploadLimitMiddleware:
+    """Rejects oversize upload requests before the body is parsed.
+
+    A declared Content-Length over the endpoint's limit is answered with 413 without
+    reading the body; bodies without one (chunked) are counted as they stream in and
+    aborted with 413 once they pass the limit.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+        match = limit_for_path(scope["path"])
+        if match is None:
+            return await self.app(scope, receive, send)
+        endpoint, limit = match
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            upload_stats.reject(endpoint)
+            response = JSONResponse({"detail": _too_large(limit)}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    upload_stats.reject(endpoint)
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def spooled_upload(file: UploadFile, max_bytes: int, endpoint: str) -> BinaryIO:
+    """Check one uploaded file against its limit and return its spooled file, rewound.
+
+    The multipart parser already streams each file into a SpooledTemporaryFile (in memory
+    up to 1 MB, on disk beyond), so handing that object on avoids a full in-memory copy.
+    """
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, io.SEEK_END)
+    if size > max_bytes:
+        upload_stats.reject(endpoint)
+        raise HTTPException(status_code=413, detail=f"{file.filename or 'File'}: {_too_large(max_bytes)}")
+    upload_stats.record(endpoint, size, bool(getattr(file.file, "_rolled", False)))
+    file.file.seek(0)
+    return file.file
+
+
+async def read_upload(file: UploadFile, max_bytes: int, endpoint: str) -> bytes:
+    """Like spooled_upload, but for consumers that need the bytes (a single copy)."""
+    spooled_upload(file, max_bytes, endpoint)
+    return await file.read()
+
+
+def b64_data_url(mime_type: str, data: bytes | BinaryIO) -> str:
+    """Build a base64 data URL by encoding fixed-size slices of the input.
+
+    A file is encoded as it is read and never held whole. The encoded slices and the
+    joined string do coexist, so peak memory is still about twice the encoded size,
+    the same as `f"data:...,{b64encode(data).decode()}"`; a str result can't go lower.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        chunks = (view[i:i + B64_CHUNK_SIZE] for i in range(0, len(view), B64_CHUNK_SIZE))
+    else:
+        data.seek(0)
+        chunks = iter(lambda: data.read(B64_CHUNK_SIZE), b"")
+    parts = [f"data:{mime_type};base64,"]
+    parts.extend(base64.b64encode(chunk).decode("ascii") for chunk in chunks)
+    return "".join(parts)
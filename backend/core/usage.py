@@ -0,0 +1,99 @@
+import contextvars
+from collections import OrderedDict, defaultdict
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core.config import settings
+
+# What the tokens are attributed to: the request path (set by UsageContextMiddleware),
+# "job:<queue name>" inside background workers, and the chat session when there is one.
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="unknown")
+current_session: contextvars.ContextVar[int | None] = contextvars.ContextVar("current_session", default=None)
+
+
+def _counters() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+
+
+def _summarize(counters: dict) -> dict:
+    calls, prompt = counters["calls"], counters["prompt_tokens"]
+    return {
+        **counters,
+        "cost_usd": round(counters["cost_usd"], 6),
+        "cache_hit_rate": round(counters["cached_tokens"] / prompt, 4) if prompt else 0.0,
+        "cost_per_call_usd": round(counters["cost_usd"] / calls, 6) if calls else 0.0,
+    }
+
+
+class UsageTracker:
+    """Prompt, cached-prompt and completion tokens (and estimated cost) reported by the API,
+    aggregated per endpoint, per model and per chat session."""
+
+    def __init__(self):
+        self._endpoints: dict[str, dict] = defaultdict(_counters)
+        self._models: dict[str, dict] = defaultdict(_counters)
+        self._sessions: OrderedDict[int, dict] = OrderedDict()
+
+    def record(self, model: str, usage):
+        if usage is None:
+            return
+        prompt = usage.prompt_tokens or 0
+        completion = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+        prices = settings.MODEL_PRICES.get(model)
+        cost = 0.0
+        if prices:
+            cost = (
+                (prompt - cached) * prices["input"]
+                + cached * prices.get("cached_input", prices["input"])
+                + completion * prices["output"]
+            ) / 1_000_000
+
+        buckets = [self._endpoints[current_endpoint.get()], self._models[model]]
+        session_id = current_session.get()
+        if session_id is not None:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = _counters()
+                if len(self._sessions) > settings.USAGE_SESSION_LIMIT:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            buckets.append(self._sessions[session_id])
+
+        for bucket in buckets:
+            bucket["calls"] += 1
+            bucket["prompt_tokens"] += prompt
+            bucket["cached_tokens"] += cached
+            bucket["completion_tokens"] += completion
+            bucket["cost_usd"] += cost
+
+    def session(self, session_id: int) -> dict | None:
+        counters = self._sessions.get(session_id)
+        return _summarize(counters) if counters else None
+
+    def stats(self) -> dict:
+        return {
+            "endpoints": {name: _summarize(c) for name, c in self._endpoints.items()},
+            "models": {name: _summarize(c) for name, c in self._models.items()},
+            "sessions_tracked": len(self._sessions),
+        }
+
+
+usage_tracker = UsageTracker()
+
+
+class UsageContextMiddleware:
+    """Attributes the model calls made while handling a request to its path."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        token = current_endpoint.set(f"{scope.get('method', 'WS')} {scope['path']}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_endpoint.reset(token)
@@ -1,4 +1,10 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
 from core.config import settings
 from api.v1.endpoints import (
@@ -6,15 +12,62 @@ from api.v1.endpoints import (
     reply_router, 
     chat_router, 
     transcribe_router,
-    contacts_router
+    contacts_router,
+    system_router,
 )
-from core.database import engine, Base
+from core.database import engine
+from core.logs import configure_logging
+from core.metrics import TimedJSONResponse, TimingMiddleware, metrics_response
+from core.migrations import run_migrations
+from core.openai_client import close_client, preload_sdk
+from core.scheduler import ClientContextMiddleware
+from core.uploads import UploadLimitMiddleware
+from core.usage import UsageContextMiddleware
+from services.chat_service import chat_service
+from services.contact_analytics import contact_analytics
+from services.image_preprocessor import image_preprocessor
+from services.result_cache import cache_store
 from models import contact, conversation  # Import models to register them
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Importing this module only wires things up; the database, background workers and the
+    # OpenAI SDK are brought up here, and clients and pools are created on first use.
+    if settings.MIGRATE_ON_STARTUP:
+        await run_migrations(engine)
+    chat_service.memory_queue.start()
+    chat_service.summary_queue.start()
+    contact_analytics.queue.start()
+    preload = asyncio.create_task(preload_sdk())
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        preload.cancel()
+        await chat_service.memory_queue.drain(timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await chat_service.summary_queue.drain(timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        # After the memory queue, which feeds it emotions reported in chat
+        await contact_analytics.queue.drain(timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        image_preprocessor.shutdown()
+        cache_store.close()
+        await close_client()
+        await engine.dispose()
 
-app = FastAPI(title=settings.PROJECT_NAME)
+
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=TimedJSONResponse, lifespan=lifespan)
+app.state.ready = False
+
+# Reject oversize uploads before their body is read (added first so CORS headers wrap the 413)
+app.add_middleware(UploadLimitMiddleware)
+# Identify the caller so upstream model capacity is shared fairly between clients
+app.add_middleware(ClientContextMiddleware)
+# Attribute model token usage to the endpoint that made the call
+app.add_middleware(UsageContextMiddleware)
 
 # Set all CORS enabled origins
 app.add_middleware(
@@ -23,7 +76,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID", "X-Next-Cursor"],
 )
+# Request timing, per-stage breakdown and the per-request log line (outermost, so it sees everything)
+app.add_middleware(TimingMiddleware)
 
 # Register routes
 app.include_router(analyze_router, prefix=f"{settings.API_V1_STR}/analyze", tags=["analyze"])
@@ -31,14 +87,25 @@ app.include_router(reply_router, prefix=f"{settings.API_V1_STR}/reply", tags=["r
 app.include_router(chat_router, prefix=f"{settings.API_V1_STR}/chat", tags=["chat"])
 app.include_router(transcribe_router, prefix=f"{settings.API_V1_STR}/transcribe", tags=["transcribe"])
 app.include_router(contacts_router, prefix=f"{settings.API_V1_STR}/contacts", tags=["contacts"])
+app.include_router(system_router, prefix=f"{settings.API_V1_STR}/system", tags=["system"])
 
 @app.get("/")
 async def root():
     return {"message": "AI Reply Strategist API is running"}
 
-# Print registered routes for debugging
-@app.on_event("startup")
-async def startup_event():
-    print("Registered routes:")
-    for route in app.routes:
-        print(f"Path: {route.path}")
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: startup (migrations, workers) has finished and the database answers."""
+    if not app.state.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception:
+        logger.exception("readiness check failed")
+        return JSONResponse({"status": "database unavailable"}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
@@ -0,0 +1,52 @@
+"""Maintenance commands, run from the backend directory.
+
+    python manage.py migrate                              # create tables, apply migrations
+    python manage.py recompute-analytics                  # every contact
+    python manage.py recompute-analytics --contact-id 3   # selected contacts
+"""
+import argparse
+import asyncio
+
+from core.database import SessionLocal, engine
+from core.logs import configure_logging
+from core.migrations import run_migrations
+from models import contact, conversation  # Import models to register them
+from services.contact_analytics import contact_analytics
+
+
+async def migrate():
+    try:
+        await run_migrations(engine)
+    finally:
+        await engine.dispose()
+
+
+async def recompute_analytics(contact_ids: list[int] | None):
+    await run_migrations(engine)
+    try:
+        async with SessionLocal() as db:
+            count = await contact_analytics.recompute(db, contact_ids)
+        print(f"recomputed analytics for {count} contact(s)")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Backend maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="create missing tables and apply pending schema migrations")
+    recompute = commands.add_parser(
+        "recompute-analytics", help="rebuild contact analytics and scores from the stored messages"
+    )
+    recompute.add_argument("--contact-id", type=int, action="append", help="only this contact (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        asyncio.run(migrate())
+    elif args.command == "recompute-analytics":
+        asyncio.run(recompute_analytics(args.contact_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, ForeignKey, Index, JSON, Text
+from sqlalchemy.orm import relationship
 from core.database import Base
-from datetime import date
+from datetime import date, datetime
 
 class Contact(Base):
     __tablename__ = "contacts"
@@ -12,6 +13,54 @@ class Contact(Base):
     first_interaction_date = Column(Date, default=date.today)
     notes = Column(Text, nullable=True)
     
-    # Emotional data
+    # Emotional data (kept up to date from ContactStats by the analytics engine)
     emotional_volatility = Column(Integer, default=0) # Index
     responsiveness_score = Column(Integer, default=50) 
+
+    # Memories name their contact rather than referencing it; only loaded when asked for
+    memories = relationship(
+        "ContactMemory",
+        primaryjoin="func.lower(foreign(ContactMemory.contact_name)) == func.lower(Contact.name)",
+        order_by="ContactMemory.id",
+        viewonly=True,
+        lazy="raise",
+    )
+
+
+class ContactMessage(Base):
+    """One message (or reported observation) of a conversation with a contact, as analyzed."""
+    __tablename__ = "contact_messages"
+
+    id = Column(Integer, primary_key=True)
+    contact_id = Column(Integer, ForeignKey("contacts.id"), nullable=False)
+    conversation_key = Column(String(32), nullable=False)  # messages analyzed together; reply gaps stay within one
+    sender = Column(String, nullable=False)  # "contact" or "user"
+    text = Column(Text, nullable=True)
+    emotion = Column(String, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    source = Column(String, nullable=False)  # analyze, chat, import
+    message_key = Column(String(64), nullable=True)  # services.contact_analytics.MessageKeys; one row per key
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_contact_messages_contact_id", "contact_id", "id"),
+        Index("ux_contact_messages_contact_key", "contact_id", "message_key", unique=True),
+    )
+
+
+class ContactStats(Base):
+    """Running aggregates behind a contact's scores, updated online (Welford) as messages arrive."""
+    __tablename__ = "contact_stats"
+
+    contact_id = Column(Integer, ForeignKey("contacts.id"), primary_key=True)
+    message_count = Column(Integer, default=0, nullable=False)  # contact's messages
+    emotion_counts = Column(JSON, default=dict, nullable=False)  # emotion label -> count
+    valence_n = Column(Integer, default=0, nullable=False)
+    valence_mean = Column(Float, default=0.0, nullable=False)
+    valence_m2 = Column(Float, default=0.0, nullable=False)
+    gap_n = Column(Integer, default=0, nullable=False)  # reply gaps, as log1p(minutes)
+    gap_mean = Column(Float, default=0.0, nullable=False)
+    gap_m2 = Column(Float, default=0.0, nullable=False)
+    gap_min_minutes = Column(Float, nullable=True)
+    gap_max_minutes = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,15 +1,32 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index, func
 from sqlalchemy.orm import relationship
 from core.database import Base
 from datetime import datetime
+import hashlib
+import re
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_fact(fact: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a fact, used for deduplication."""
+    return _SPACE_RE.sub(" ", _NON_WORD_RE.sub("", (fact or "").lower())).strip()
+
+
+def fact_hash(fact: str) -> str:
+    return hashlib.sha256(normalize_fact(fact).encode("utf-8")).hexdigest()
 
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
 
     id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # bumped on every exchange
+    summary = Column(Text, nullable=True)  # rolling summary of messages older than the history window
+    summarized_until_id = Column(Integer, default=0)  # last ChatMessage.id folded into summary
     
     messages = relationship("ChatMessage", back_populates="session", order_by="ChatMessage.created_at")
 
@@ -27,6 +44,11 @@ class ChatMessage(Base):
 
     session = relationship("ChatSession", back_populates="messages")
 
+    __table_args__ = (
+        # Every chat query reads one session's messages in time order
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
+
 
 class ContactMemory(Base):
     __tablename__ = "contact_memories"
@@ -34,5 +56,12 @@ class ContactMemory(Base):
     id = Column(Integer, primary_key=True, index=True)
     contact_name = Column(String, index=True, nullable=False)
     fact = Column(Text, nullable=False)  # e.g. "Gets anxious when left on read"
+    fact_hash = Column(String(64), nullable=False)  # fact_hash(fact); one row per contact and normalized fact
     category = Column(String, nullable=True)  # personality, pattern, preference, history
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ux_contact_memories_contact_fact", "contact_name", "fact_hash", unique=True),
+        # Memories are matched to contacts by case-insensitive name
+        Index("ix_contact_memories_contact_lower", func.lower(contact_name)),
+    )
@@ -0,0 +1,455 @@
+from core.config import settings
+from core.metrics import span
+from core.tokens import estimate_tokens
+from models.contact import Contact
+from services.chat_service import chat_service
+from services.contact_analytics import MessageKeys, contact_analytics
+from services.result_cache import file_hash
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import AsyncIterator, BinaryIO, Literal
+import asyncio
+import codecs
+import json
+import logging
+import re
+import uuid
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ExportFormat = Literal["auto", "whatsapp", "imessage", "telegram", "plain"]
+
+# WhatsApp, Android: "31/12/2023, 21:41 - Sam: text"; iOS: "[31/12/2023, 21:41:05] Sam: text".
+# Day/month order and 12/24-hour clocks follow the exporting phone's locale.
+_WHATSAPP_RE = re.compile(
+    r"^\[?(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2,4}),?\s+(\d{1,2})[:.](\d{2})(?:[:.](\d{2}))?"
+    r"\s*([AaPp]\.?\s?[Mm]\.?)?\]?\s*(?:-\s)?(.*)$"
+)
+_WHATSAPP_SENDER_RE = re.compile(r"^([^:]{1,80}?):\s(.*)$")
+_WHATSAPP_FILENAME_RE = re.compile(r"WhatsApp Chat (?:with|-)\s*(.+?)(?:\.txt|\.zip)?$", re.IGNORECASE)
+# imessage-exporter text output: a timestamp line, the sender ("Me" for the user), then the text
+_IMESSAGE_TIME_RE = re.compile(r"^([A-Z][a-z]{2} \d{1,2}, \d{4})\s+(\d{1,2}:\d{2}:\d{2}\s?[AP]M)")
+# Pasted text: "Name: message"
+_PLAIN_SENDER_RE = re.compile(r"^([^:\n]{1,40}):\s*(.*)$")
+_TELEGRAM_NAME_RE = re.compile(r'"name"\s*:\s*("(?:[^"\\]|\\.)*")')
+_TELEGRAM_MESSAGES_RE = re.compile(r'"messages"\s*:\s*\[')
+# Invisible direction marks WhatsApp puts around names and attachments
+_MARKS_RE = re.compile("[\u200e\u200f\u202a-\u202e\ufeff]")
+
+USER_ALIASES = {"me", "you", "user"}
+# How closely a sender label must match the contact's name to be taken as the contact
+NAME_MATCH_THRESHOLD = 0.6
+_NAME_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class ImportedMessage:
+    sender: str
+    text: str
+    sent_at: datetime | None = None
+
+
+def _whatsapp_time(match: re.Match, day_first: bool) -> datetime | None:
+    first, second, year, hour, minute, second_of_minute, meridiem = match.groups()[:7]
+    day, month = (int(first), int(second)) if day_first else (int(second), int(first))
+    year = int(year) + (2000 if len(year) == 2 else 0)
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower().startswith("p") else 0)
+    try:
+        return datetime(year, month, day, hour, int(minute), int(second_of_minute or 0))
+    except ValueError:
+        return None
+
+
+async def _lines(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    pending = ""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield _MARKS_RE.sub("", line.rstrip("\r"))
+    if pending:
+        yield _MARKS_RE.sub("", pending.rstrip("\r"))
+
+
+async def parse_whatsapp(chunks: AsyncIterator[str], day_first: bool | None = None) -> AsyncIterator[ImportedMessage]:
+    """Messages of a WhatsApp .txt export; multi-line messages are joined and system notices skipped.
+
+    Without `day_first`, dates are read month first when the export uses AM/PM and day first
+    otherwise, switching for good as soon as a date only makes sense the other way round.
+    """
+    current = None
+    async for line in _lines(chunks):
+        match = _WHATSAPP_RE.match(line)
+        sender = _WHATSAPP_SENDER_RE.match(match.group(8)) if match else None
+        if match is None:
+            if current is not None:
+                current.text += "\n" + line
+            continue
+        if current is not None:
+            yield current
+            current = None
+        if sender is None:
+            continue  # "Messages and calls are end-to-end encrypted", group notices, ...
+        if day_first is None and int(match.group(1)) > 12:
+            day_first = True
+        elif day_first is None and int(match.group(2)) > 12:
+            day_first = False
+        read_day_first = day_first if day_first is not None else not match.group(7)
+        current = ImportedMessage(sender.group(1).strip(), sender.group(2), _whatsapp_time(match, read_day_first))
+    if current is not None:
+        yield current
+
+
+async def parse_imessage(chunks: AsyncIterator[str]) -> AsyncIterator[ImportedMessage]:
+    """Messages of an imessage-exporter .txt file (timestamp line, sender line, text lines)."""
+    sent_at, sender, text = None, None, []
+    async for line in _lines(chunks):
+        match = _IMESSAGE_TIME_RE.match(line)
+        if match:
+            if sender is not None:
+                yield ImportedMessage(sender, "\n".join(text).strip(), sent_at)
+            try:
+                sent_at = datetime.strptime(f"{match.group(1)} {match.group(2).replace(' ', '')}", "%b %d, %Y %I:%M:%S%p")
+            except ValueError:
+                sent_at = None
+            sender, text = "", []
+        elif sender == "":
+            sender = line.strip()
+        elif sender is not None:
+            text.append(line)
+    if sender:
+        yield ImportedMessage(sender, "\n".join(text).strip(), sent_at)
+
+
+async def parse_plain(chunks: AsyncIterator[str]) -> AsyncIterator[ImportedMessage]:
+    """Pasted "Name: message" lines; other lines continue the previous message."""
+    current = None
+    async for line in _lines(chunks):
+        match = _PLAIN_SENDER_RE.match(line.strip())
+        if match:
+            if current is not None:
+                yield current
+            current = ImportedMessage(match.group(1).strip(), match.group(2))
+        elif current is not None and line.strip():
+            current.text += "\n" + line.strip()
+    if current is not None:
+        yield current
+
+
+def _telegram_text(text) -> str:
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+    return text or ""
+
+
+class TelegramParser:
+    """Messages of a Telegram Desktop result.json, decoded one message object at a time so
+    the export is never held in memory whole. `chat_name` is known once messages start."""
+
+    def __init__(self):
+        self.chat_name: str | None = None
+
+    async def parse(self, chunks: AsyncIterator[str]) -> AsyncIterator[ImportedMessage]:
+        decoder = json.JSONDecoder()
+        buffer = ""
+        in_messages = False
+        async for chunk in chunks:
+            buffer += chunk
+            if not in_messages:
+                start = _TELEGRAM_MESSAGES_RE.search(buffer)
+                if start is None:
+                    continue
+                name = _TELEGRAM_NAME_RE.search(buffer, 0, start.start())
+                self.chat_name = json.loads(name.group(1)) if name else None
+                buffer = buffer[start.end():]
+                in_messages = True
+            while True:
+                buffer = buffer.lstrip(" \t\r\n,")
+                if not buffer or buffer[0] == "]":
+                    break
+                try:
+                    message, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break  # incomplete object: read more
+                buffer = buffer[end:]
+                if message.get("type") != "message" or not message.get("from"):
+                    continue
+                text = _telegram_text(message.get("text"))
+                if not text:
+                    continue
+                try:
+                    sent_at = datetime.fromisoformat(message["date"])
+                except (KeyError, ValueError):
+                    sent_at = None
+                yield ImportedMessage(message["from"], text, sent_at)
+            if buffer.startswith("]"):
+                return
+
+
+def detect_format(head: str) -> ExportFormat:
+    """Guess the export format from the start of the file."""
+    stripped = _MARKS_RE.sub("", head).lstrip()
+    if stripped.startswith("{"):
+        return "telegram"
+    for line in stripped.splitlines()[:20]:
+        if _WHATSAPP_RE.match(line) and _WHATSAPP_SENDER_RE.match(_WHATSAPP_RE.match(line).group(8) or ""):
+            return "whatsapp"
+        if _IMESSAGE_TIME_RE.match(line):
+            return "imessage"
+    return "plain"
+
+
+async def _text_chunks(file: BinaryIO, chunk_size: int) -> AsyncIterator[str]:
+    """Decode a binary file incrementally (UTF-8, BOM dropped), reading off the event loop."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    while True:
+        data = await asyncio.to_thread(file.read, chunk_size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _chained(first: str, rest: AsyncIterator[str]) -> AsyncIterator[str]:
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def _single(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+def _open_export(file: BinaryIO, filename: str) -> tuple[BinaryIO, str]:
+    """The chat file inside a zipped export (WhatsApp "_chat.txt", Telegram "result.json"), or
+    the upload itself; plus the name to guess the contact from."""
+    if not zipfile.is_zipfile(file):
+        file.seek(0)
+        return file, filename
+    archive = zipfile.ZipFile(file)
+    names = [name for name in archive.namelist() if name.lower().endswith((".txt", ".json"))]
+    if not names:
+        raise ValueError("The archive contains no .txt or .json chat export")
+    member = min(names, key=lambda name: (not name.endswith(("_chat.txt", "result.json")), len(name)))
+    return archive.open(member), filename
+
+
+def _conversation_item(message: ImportedMessage, contact_sender: str | None) -> dict:
+    """A message in the schema VisionService extracts from screenshots."""
+    return {
+        "sender": "Partner" if _is_contact(message.sender, contact_sender) else "User",
+        "text": message.text,
+        "emotion": None,
+        "time": message.sent_at.strftime("%H:%M") if message.sent_at else None,
+    }
+
+
+def _is_contact(sender: str, contact_sender: str | None) -> bool:
+    return contact_sender is not None and sender.casefold() == contact_sender.casefold()
+
+
+def _name_match(sender: str, name: str) -> float:
+    """0-1: how well a sender label matches a contact name ("Sam" and "Sam Smith" match fully)."""
+    sender, name = sender.casefold(), name.casefold()
+    if sender == name:
+        return 1.0
+    sender_words, name_words = set(_NAME_WORD_RE.findall(sender)), set(_NAME_WORD_RE.findall(name))
+    shared = len(sender_words & name_words) / max(1, min(len(sender_words), len(name_words)))
+    return max(0.9 * shared, SequenceMatcher(None, sender, name).ratio())
+
+
+def resolve_contact_sender(senders: Counter, name: str | None, user_name: str | None) -> str | None:
+    """Which of the export's senders is the contact: the one that best matches `name` (given,
+    or taken from the export), else the most frequent sender who isn't the user."""
+    user = {*USER_ALIASES, *([user_name.casefold()] if user_name else [])}
+    candidates = Counter({sender: count for sender, count in senders.items() if sender.casefold() not in user})
+    if not candidates:
+        return None
+    if name:
+        best = max(candidates, key=lambda sender: (_name_match(sender, name), candidates[sender]))
+        if _name_match(best, name) >= NAME_MATCH_THRESHOLD:
+            return best
+    return candidates.most_common(1)[0][0]
+
+
+class ChatImporter:
+    """Imports exported one-to-one chats into ContactMessage rows without a vision call.
+
+    The export is parsed as it is read, and messages are written and folded into the
+    contact's analytics IMPORT_BATCH_SIZE at a time, so memory stays bounded however long
+    the chat is. The contact is the `contact_name` given, else the one named by the export
+    (WhatsApp file name, Telegram chat), else the most frequent sender who isn't the user.
+    Which sender that is gets decided from the first IMPORT_SENDER_SCAN_MESSAGES messages
+    (see resolve_contact_sender); every other sender counts as the user. Messages already
+    imported are skipped, so importing the same or a longer export again is safe (for
+    messages without timestamps, as in pasted text, only the same file; see MessageKeys).
+    """
+
+    def _parser(self, export_format: ExportFormat, chunks: AsyncIterator[str], day_first: bool | None):
+        if export_format == "whatsapp":
+            return None, parse_whatsapp(chunks, day_first)
+        if export_format == "imessage":
+            return None, parse_imessage(chunks)
+        if export_format == "telegram":
+            telegram = TelegramParser()
+            return telegram, telegram.parse(chunks)
+        return None, parse_plain(chunks)
+
+    async def _messages(
+        self, chunks: AsyncIterator[str], export_format: ExportFormat, day_first: bool | None
+    ) -> tuple[ExportFormat, TelegramParser | None, AsyncIterator[ImportedMessage]]:
+        head = ""
+        async for chunk in chunks:
+            head = chunk
+            if head.strip():
+                break
+        if export_format == "auto":
+            export_format = detect_format(head)
+        telegram, messages = self._parser(export_format, _chained(head, chunks), day_first)
+        return export_format, telegram, messages
+
+    async def import_export(
+        self,
+        db: AsyncSession,
+        file: BinaryIO,
+        filename: str = "",
+        contact_name: str | None = None,
+        user_name: str | None = None,
+        export_format: ExportFormat = "auto",
+        day_first: bool | None = None,
+    ) -> dict:
+        """Import one exported chat. Raises ValueError when no messages or contact are found."""
+        # Messages without a timestamp are only recognized again in the same upload
+        message_keys = MessageKeys(f"import:{await asyncio.to_thread(file_hash, file)}")
+        source, filename = await asyncio.to_thread(_open_export, file, filename)
+        export_format, telegram, messages = await self._messages(
+            _text_chunks(source, settings.IMPORT_READ_CHUNK_BYTES), export_format, day_first
+        )
+        if not contact_name:
+            match = _WHATSAPP_FILENAME_RE.search(filename or "")
+            contact_name = match.group(1).strip() if match else None
+
+        key = uuid.uuid4().hex
+        pending: dict[str, datetime] = {}
+        tail: deque[ImportedMessage] = deque(maxlen=max(settings.IMPORT_MEMORY_MESSAGES, settings.IMPORT_CONTEXT_MESSAGES))
+        contact: Contact | None = None
+        contact_sender: str | None = None
+        batch: list[ImportedMessage] = []
+        count = added = 0
+        first_sent = last_sent = None
+
+        async def flush():
+            nonlocal contact, contact_sender, added
+            if contact is None:
+                name = contact_name or (telegram.chat_name if telegram else None)
+                contact_sender = resolve_contact_sender(Counter(message.sender for message in batch), name, user_name)
+                if not (name or contact_sender):
+                    raise ValueError("Could not tell who the contact is; pass contact_name")
+                contact = await contact_analytics.find_contact(db, name or contact_sender, create=True)
+            for start in range(0, len(batch), settings.IMPORT_BATCH_SIZE):
+                rows = [
+                    {
+                        "sender": "contact" if _is_contact(message.sender, contact_sender) else "user",
+                        "text": message.text,
+                        "emotion": None,
+                        "sent_at": message.sent_at,
+                    }
+                    for message in batch[start:start + settings.IMPORT_BATCH_SIZE]
+                ]
+                added += await contact_analytics.record(
+                    db, contact, rows, "import", key=key, pending=pending, message_keys=message_keys
+                )
+                await db.commit()
+            batch.clear()
+
+        with span("chat_import"):
+            async for message in messages:
+                batch.append(message)
+                tail.append(message)
+                count += 1
+                if message.sent_at is not None:
+                    first_sent = min(first_sent or message.sent_at, message.sent_at)
+                    last_sent = max(last_sent or message.sent_at, message.sent_at)
+                # The first flush waits for a longer prefix, to tell who the contact is
+                if len(batch) >= (settings.IMPORT_BATCH_SIZE if contact else settings.IMPORT_SENDER_SCAN_MESSAGES):
+                    await flush()
+            if batch:
+                await flush()
+        if contact is None:
+            raise ValueError("No messages found in the export")
+
+        if first_sent and (contact.first_interaction_date is None or first_sent.date() < contact.first_interaction_date):
+            contact.first_interaction_date = first_sent.date()
+            await db.commit()
+
+        # Nothing new to learn from an export imported before
+        memories_queued = added > 0 and await chat_service.seed_memories(
+            contact.name, self._transcript(list(tail), contact_sender, contact.name)
+        )
+        stats = await contact_analytics.stats(db, contact.id)
+        logger.info(
+            "chat export imported",
+            extra={"format": export_format, "messages": count, "new_messages": added, "contact_id": contact.id},
+        )
+        return {
+            "contact_id": contact.id,
+            "contact_name": contact.name,
+            "contact_sender": contact_sender,
+            "format": export_format,
+            "messages": count,
+            "new_messages": added,
+            "first_message_at": first_sent,
+            "last_message_at": last_sent,
+            "memory_extraction_queued": memories_queued,
+            "analytics": stats,
+            **self._context(list(tail)[-settings.IMPORT_CONTEXT_MESSAGES:], contact_sender, contact.name),
+        }
+
+    def _transcript(self, messages: list[ImportedMessage], contact_sender: str | None, contact_name: str) -> str:
+        """The latest messages as "Name: text" lines, within the memory extraction budget."""
+        lines = []
+        budget = settings.HISTORY_TOKEN_BUDGET
+        for message in reversed(messages):
+            line = f"{contact_name if _is_contact(message.sender, contact_sender) else 'Me'}: {message.text}"
+            budget -= estimate_tokens(line)
+            if budget < 0:
+                break
+            lines.append(line)
+        return "\n".join(reversed(lines))
+
+    def _context(self, messages: list[ImportedMessage], contact_sender: str | None, contact_name: str) -> dict:
+        """A conversation context shaped like VisionService's extraction, ready for reply generation."""
+        return {
+            "conversation": [_conversation_item(message, contact_sender) for message in messages],
+            "summary": f"Imported text conversation with {contact_name}.",
+            "overall_mood": "Unknown",
+            "participant_name": contact_name,
+        }
+
+    async def context_from_text(
+        self, text: str, contact_name: str | None = None, user_name: str | None = None
+    ) -> dict:
+        """Parse pasted conversation text (any supported format) into a reply context."""
+        with span("text_parse"):
+            _, telegram, parsed = await self._messages(_single(text), "auto", None)
+            messages = deque(maxlen=settings.IMPORT_CONTEXT_MESSAGES)
+            senders = Counter()
+            async for message in parsed:
+                messages.append(message)
+                senders[message.sender] += 1
+        if not messages:
+            raise ValueError("No messages found in the text")
+        name = contact_name or (telegram.chat_name if telegram else None)
+        contact_sender = resolve_contact_sender(senders, name, user_name)
+        return self._context(list(messages), contact_sender, name or contact_sender or "Partner")
+
+
+chat_importer = ChatImporter()
@@ -1,11 +1,26 @@
-from openai import OpenAI
 from core.config import settings
-from sqlalchemy.orm import Session
-from models.conversation import ChatMessage, ChatSession, ContactMemory
+from core.model_router import model_router
+from core.database import SessionLocal, insert_ignoring_duplicates
+from core.job_queue import JobQueue
+from core.metrics import span
+from core.tokens import estimate_tokens
+from core.usage import current_session
+from services.contact_analytics import contact_analytics
+from services.image_preprocessor import PreparedImage
+from services.memory_retriever import memory_retriever
+from services.result_cache import content_hash
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from models.conversation import ChatMessage, ChatSession, ContactMemory, fact_hash
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator
+import asyncio
 import json
-import base64
+import logging
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = """You are RIZZA — an expert AI relationship and messaging strategist. You help people navigate their conversations, relationships, and social dynamics.
 
@@ -29,69 +44,181 @@ Always respond in a conversational, friendly tone. You're like a smart best frie
 If the user asks for reply suggestions, provide 2-3 options with different tones (warm, playful, direct) and explain the strategy behind each."""
 
 
+# Static instructions go in the system message and the per-call input in the user
+# message, so the instruction prefix is identical on every call.
+MEMORY_EXTRACTION_PROMPT = """From the conversation exchanges you are given, extract any new facts about specific people (contacts) being discussed.
+Only extract if there are concrete, memorable facts about a named person.
+
+Also note how each named person came across emotionally in what the user reported, if it is clear
+(one word such as happy, anxious, angry, distant, affectionate, with the words that show it as evidence).
+
+If there are facts to extract, return JSON:
+{"memories": [{"contact_name": "...", "fact": "...", "category": "personality|pattern|preference|history"}],
+ "observations": [{"contact_name": "...", "emotion": "...", "evidence": "..."}]}
+
+If there's nothing to extract, return:
+{"memories": [], "observations": []}"""
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and RIZZA, their messaging strategist.
+Keep the people involved, key facts, advice already given and open questions. Be concise.
+You are given the current summary and the new messages to fold in.
+
+Return only the updated summary."""
+
+
+class SessionNotFound(LookupError):
+    """No chat session with the requested id."""
+
+
+def session_dict(chat_session: ChatSession) -> dict:
+    return {
+        "id": chat_session.id,
+        "title": chat_session.title,
+        "created_at": chat_session.created_at.isoformat(),
+        "updated_at": chat_session.updated_at.isoformat(),
+    }
+
+
+def fit_history_window(messages: list[ChatMessage]) -> list[ChatMessage]:
+    """The newest of `messages` (in chronological order) that fit the history window and token budget."""
+    window = []
+    budget = settings.HISTORY_TOKEN_BUDGET
+    for msg in reversed(messages[-settings.HISTORY_WINDOW_MESSAGES:]):
+        budget -= estimate_tokens(msg.content)
+        if budget < 0:
+            break
+        window.append(msg)
+    window.reverse()
+    return window
+
+
+def message_dict(msg: ChatMessage) -> dict:
+    return {
+        "id": msg.id,
+        "role": msg.role,
+        "content": msg.content,
+        "is_voice": msg.is_voice,
+        "created_at": msg.created_at.isoformat(),
+    }
+
+
 class ChatService:
     def __init__(self):
-        self.model = "gpt-4o"
-        self.text_model = "gpt-4o-mini"
-
-    def _get_or_create_session(self, db: Session) -> ChatSession:
-        """Get the most recent session or create a new one."""
-        session = db.query(ChatSession).order_by(ChatSession.updated_at.desc()).first()
-        if not session:
-            session = ChatSession()
-            db.add(session)
-            db.commit()
-            db.refresh(session)
-        return session
-
-    def _get_memory_context(self, db: Session) -> str:
-        """Load all contact memories into a context string."""
-        memories = db.query(ContactMemory).all()
-        if not memories:
-            return ""
-        
-        memory_lines = []
-        contacts = {}
-        for m in memories:
-            if m.contact_name not in contacts:
-                contacts[m.contact_name] = []
-            contacts[m.contact_name].append(m.fact)
-        
-        for name, facts in contacts.items():
-            memory_lines.append(f"\n{name}:")
-            for fact in facts:
-                memory_lines.append(f"  - {fact}")
-        
-        return "\n\n[CONTACT MEMORIES — things you remember about people the user has discussed:]\n" + "\n".join(memory_lines)
-
-    def _build_messages(self, db: Session, chat_session: ChatSession, new_content: str, image_bytes: bytes | None = None):
-        """Build the OpenAI messages array from history + new message."""
-        memory_context = self._get_memory_context(db)
-        system_content = SYSTEM_PROMPT
-        if memory_context:
-            system_content += memory_context
-
-        messages = [{"role": "system", "content": system_content}]
+        self.memory_queue = JobQueue(
+            "memory-extraction",
+            self._extract_memories,
+            maxsize=settings.MEMORY_QUEUE_MAXSIZE,
+            workers=settings.MEMORY_QUEUE_WORKERS,
+            batch_size=settings.MEMORY_QUEUE_BATCH_SIZE,
+            max_retries=settings.MEMORY_QUEUE_MAX_RETRIES,
+            retry_backoff=settings.MEMORY_QUEUE_RETRY_BACKOFF,
+            enqueue_timeout=settings.MEMORY_QUEUE_ENQUEUE_TIMEOUT,
+        )
+        self.summary_queue = JobQueue(
+            "history-summary",
+            self._summarize_sessions,
+            workers=1,
+            batch_size=settings.MEMORY_QUEUE_BATCH_SIZE,
+            max_retries=settings.MEMORY_QUEUE_MAX_RETRIES,
+            retry_backoff=settings.MEMORY_QUEUE_RETRY_BACKOFF,
+            enqueue_timeout=settings.MEMORY_QUEUE_ENQUEUE_TIMEOUT,
+        )
+        # Open WebSocket connections per session, told about changes made outside them
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, session_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers[session_id].add(queue)
+        return queue
+
+    def unsubscribe(self, session_id: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def _publish(self, session_id: int, event: str, data: Any, origin: Any = None):
+        for queue in self._subscribers.get(session_id, ()):
+            queue.put_nowait((event, data, origin))
+
+    async def create_session(self, db: AsyncSession, title: str | None = None) -> ChatSession:
+        chat_session = ChatSession(title=title)
+        db.add(chat_session)
+        await db.commit()
+        await db.refresh(chat_session)
+        return chat_session
+
+    async def list_sessions(self, db: AsyncSession, skip: int = 0, limit: int = 50) -> list[ChatSession]:
+        """Sessions, most recently active first."""
+        return list((await db.scalars(
+            select(ChatSession).order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).offset(skip).limit(limit)
+        )).all())
+
+    async def get_session(self, db: AsyncSession, session_id: int | None) -> ChatSession | None:
+        """The given session (SessionNotFound if it doesn't exist), or without an id the most
+        recently active one (None if there are none yet)."""
+        if session_id is None:
+            return await db.scalar(
+                select(ChatSession).order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).limit(1)
+            )
+        chat_session = await db.get(ChatSession, session_id)
+        if chat_session is None:
+            raise SessionNotFound(f"Chat session {session_id} not found")
+        return chat_session
+
+    async def _get_or_create_session(self, db: AsyncSession, session_id: int | None) -> ChatSession:
+        """The requested session; without an id, the most recent session or a new one."""
+        chat_session = await self.get_session(db, session_id)
+        if chat_session is None:
+            chat_session = await self.create_session(db)
+        return chat_session
+
+    async def _get_memory_context(self, db: AsyncSession, chat_session: ChatSession, new_content: str, history: list[ChatMessage]) -> str:
+        """Select the contact memories relevant to the new message and recent history."""
+        recent = history[-settings.MEMORY_CONTEXT_MESSAGES:] if settings.MEMORY_CONTEXT_MESSAGES else []
+        query_text = "\n".join([msg.content for msg in recent] + [new_content or ""])
+        return await memory_retriever.get_context(db, chat_session.id, query_text)
+
+    async def _load_history_window(self, db: AsyncSession, chat_session: ChatSession) -> list[ChatMessage]:
+        """Load only the most recent messages of the session that fit the history window and token budget."""
+        history = (await db.scalars(
+            select(ChatMessage)
+            .where(ChatMessage.session_id == chat_session.id)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(settings.HISTORY_WINDOW_MESSAGES)
+        )).all()
+        return fit_history_window(list(reversed(history)))
+
+    async def _build_messages(self, db: AsyncSession, chat_session: ChatSession, recent_history: list[ChatMessage], new_content: str, image: PreparedImage | None = None):
+        """Build the OpenAI messages array from summary + history window + memories + new message.
+
+        Ordered from most to least stable so the provider's prompt cache can reuse the prefix:
+        the static system prompt (byte-identical on every call), the rolling summary (changes
+        only when it is re-folded), the history window, then this turn's contact memories.
+        """
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if chat_session.summary:
+            messages.append({
+                "role": "system",
+                "content": f"[CONVERSATION SO FAR — summary of earlier messages in this chat:]\n{chat_session.summary}",
+            })
 
-        # Add history (last 20 messages for context window management)
-        history = db.query(ChatMessage).filter(
-            ChatMessage.session_id == chat_session.id
-        ).order_by(ChatMessage.created_at).all()
-        
-        recent_history = history[-20:] if len(history) > 20 else history
-        
         for msg in recent_history:
             messages.append({"role": msg.role, "content": msg.content})
 
+        memory_context = await self._get_memory_context(db, chat_session, new_content, recent_history)
+        if memory_context:
+            messages.append({"role": "system", "content": memory_context.strip()})
+
         # Build the new user message
-        if image_bytes:
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
+        if image:
             content_parts = []
             if new_content:
                 content_parts.append({"type": "text", "text": new_content})
             content_parts.append({
                 "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{base64_image}"}
+                "image_url": {"url": image.to_data_url()}
             })
             messages.append({"role": "user", "content": content_parts})
         else:
@@ -99,125 +226,397 @@ class ChatService:
 
         return messages
 
-    async def send_message(self, db: Session, content: str, image_bytes: bytes | None = None) -> dict:
-        """Send a message and get AI response."""
+    async def _save_exchange(self, db: AsyncSession, chat_session: ChatSession, content: str, assistant_text: str) -> list[ChatMessage]:
+        """Persist the user message and the assistant reply, and mark the session active."""
+        user_msg = ChatMessage(
+            session_id=chat_session.id,
+            role="user",
+            content=content or "[Sent an image]",
+            image_path=None,
+            is_voice=False,
+        )
+        db.add(user_msg)
+
+        assistant_msg = ChatMessage(
+            session_id=chat_session.id,
+            role="assistant",
+            content=assistant_text,
+        )
+        db.add(assistant_msg)
+        chat_session.updated_at = datetime.utcnow()
+        if not chat_session.title and content:
+            chat_session.title = content[:80]
+        await db.commit()
+        return [user_msg, assistant_msg]
+
+    async def _schedule_summary(self, db: AsyncSession, chat_session: ChatSession, window: list[ChatMessage]):
+        """Queue a summary update once enough messages have left the history window unsummarized.
+
+        `window` is the history window after the new exchange. Messages the count or the token
+        budget pushed out of it are in neither the prompt nor the summary until they are folded in.
+        """
+        unsummarized = select(func.count(ChatMessage.id)).where(
+            ChatMessage.session_id == chat_session.id,
+            ChatMessage.id > (chat_session.summarized_until_id or 0),
+        )
+        if window:
+            unsummarized = unsummarized.where(ChatMessage.id < window[0].id)
+        if await db.scalar(unsummarized) >= settings.SUMMARY_MIN_MESSAGES:
+            await self.summary_queue.enqueue(chat_session.id)
+
+    async def _finish_turn(self, db: AsyncSession, chat_session: ChatSession, recent_history: list[ChatMessage], content: str, assistant_text: str, origin: Any = None) -> list[ChatMessage]:
+        """Save the exchange, tell the session's other connections, and queue the background work."""
+        saved = await self._save_exchange(db, chat_session, content, assistant_text)
+        self._publish(chat_session.id, "exchange", saved, origin)
+        await self._schedule_summary(db, chat_session, fit_history_window(recent_history + saved))
+        # Extract contact memories in the background, off the request path
+        await self.memory_queue.enqueue((chat_session.id, content, assistant_text))
+        return saved
+
+    async def _stream_reply(self, messages: list[dict], content: str, has_image: bool) -> AsyncIterator[str]:
+        """Yield the reply's text deltas as they arrive."""
+        stream = await model_router.chat_completion(
+            model_router.chat_task(content, has_image),
+            messages=messages,
+            max_tokens=1024,
+            stream=True,
+            timeout=settings.CHAT_TIMEOUT,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    async def send_message(self, db: AsyncSession, content: str, image: PreparedImage | None = None, session_id: int | None = None) -> dict:
+        """Send a message and get AI response.
+
+        Raises SessionNotFound for an unknown `session_id`; without one the most recent
+        session is continued (or a first one created).
+        """
         try:
-            chat_session = self._get_or_create_session(db)
+            chat_session = await self._get_or_create_session(db, session_id)
+            current_session.set(chat_session.id)
             
             # Build messages for OpenAI
-            messages = self._build_messages(db, chat_session, content, image_bytes)
+            recent_history = await self._load_history_window(db, chat_session)
+            messages = await self._build_messages(db, chat_session, recent_history, content, image)
             
-            # Choose model based on whether there's an image
-            model = self.model if image_bytes else self.text_model
-
-            # Call OpenAI
-            response = client.chat.completions.create(
-                model=model,
+            # Call OpenAI (the route depends on the image and message length)
+            response = await model_router.chat_completion(
+                model_router.chat_task(content, image is not None),
                 messages=messages,
                 max_tokens=1024,
+                timeout=settings.CHAT_TIMEOUT,
             )
 
             assistant_text = response.choices[0].message.content
 
-            # Save user message
-            user_msg = ChatMessage(
-                session_id=chat_session.id,
-                role="user",
-                content=content or "[Sent an image]",
-                image_path=None,
-                is_voice=False,
-            )
-            db.add(user_msg)
-
-            # Save assistant message
-            assistant_msg = ChatMessage(
-                session_id=chat_session.id,
-                role="assistant",
-                content=assistant_text,
-            )
-            db.add(assistant_msg)
-            db.commit()
-
-            # Try to extract contact memories in background
-            await self._extract_memories(db, content, assistant_text)
+            await self._finish_turn(db, chat_session, recent_history, content, assistant_text)
 
             return {
                 "response": assistant_text,
                 "session_id": chat_session.id,
             }
 
+        except SessionNotFound:
+            raise
         except Exception as e:
-            print(f"Chat error: {e}")
+            logger.exception("chat failed")
             return {"error": str(e)}
 
-    async def _extract_memories(self, db: Session, user_message: str, ai_response: str):
-        """Auto-extract contact facts from the conversation."""
+    async def stream_message(self, content: str, image: PreparedImage | None = None, session_id: int | None = None) -> AsyncIterator[tuple[str, dict]]:
+        """Send a message and yield ("token" | "done" | "error", data) events as the reply streams in.
+
+        Runs after the request's dependencies have exited, so it owns its DB session.
+        The assistant message is saved once the stream has finished.
+        """
+        db = SessionLocal()
         try:
-            extraction_prompt = f"""From this conversation exchange, extract any new facts about specific people (contacts) being discussed. 
-Only extract if there are concrete, memorable facts about a named person.
+            chat_session = await self._get_or_create_session(db, session_id)
+            current_session.set(chat_session.id)
+            recent_history = await self._load_history_window(db, chat_session)
+            messages = await self._build_messages(db, chat_session, recent_history, content, image)
 
-User said: {user_message}
-AI responded: {ai_response}
+            parts = []
+            async for delta in self._stream_reply(messages, content, image is not None):
+                parts.append(delta)
+                yield "token", {"content": delta}
 
-If there are facts to extract, return JSON:
-{{"memories": [{{"contact_name": "...", "fact": "...", "category": "personality|pattern|preference|history"}}]}}
+            assistant_text = "".join(parts)
+            await self._finish_turn(db, chat_session, recent_history, content, assistant_text)
 
-If there's nothing to extract, return:
-{{"memories": []}}"""
+            yield "done", {"response": assistant_text, "session_id": chat_session.id}
+
+        except Exception as e:
+            logger.exception("chat stream failed")
+            yield "error", {"error": str(e)}
+        finally:
+            await db.close()
+
+    async def seed_memories(self, contact_name: str, transcript: str) -> bool:
+        """Queue memory extraction for a conversation that didn't happen in a chat session
+        (an imported export); its facts are stored but pushed to no session."""
+        return await self.memory_queue.enqueue(
+            (None, f"Here is my conversation with {contact_name}:\n{transcript}", "")
+        )
+
+    async def _extract_memories(self, exchanges: list[tuple[int | None, str, str]]):
+        """Auto-extract contact facts from one or more (session id, user message, AI response) exchanges.
+
+        Runs on the background memory queue; errors propagate so the queue can retry.
+        New facts are pushed to the WebSocket connections of the sessions they came from.
+        """
+        with span("memory_extraction"):
+            transcript = "\n\n".join(
+                f"User said: {user_message}" + (f"\nAI responded: {ai_response}" if ai_response else "")
+                for _, user_message, ai_response in exchanges
+            )
 
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": extraction_prompt}],
+            response = await model_router.chat_completion(
+                "memory",
+                messages=[
+                    {"role": "system", "content": MEMORY_EXTRACTION_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
                 response_format={"type": "json_object"},
-                max_tokens=300,
+                max_tokens=300 * len(exchanges),
+                timeout=settings.MEMORY_EXTRACTION_TIMEOUT,
             )
 
             result = json.loads(response.choices[0].message.content)
-            
+
+            rows = {}
             for memory in result.get("memories", []):
-                existing = db.query(ContactMemory).filter(
-                    ContactMemory.contact_name == memory["contact_name"],
-                    ContactMemory.fact == memory["fact"],
-                ).first()
-                
-                if not existing:
-                    new_memory = ContactMemory(
-                        contact_name=memory["contact_name"],
-                        fact=memory["fact"],
-                        category=memory.get("category", "general"),
+                contact_name = (memory.get("contact_name") or "").strip()
+                fact = (memory.get("fact") or "").strip()
+                if not contact_name or not fact:
+                    continue
+                row = {
+                    "contact_name": contact_name,
+                    "fact": fact,
+                    "fact_hash": fact_hash(fact),
+                    "category": memory.get("category", "general"),
+                }
+                rows.setdefault((contact_name, row["fact_hash"]), row)
+            if rows:
+                await self._store_memories(exchanges, list(rows.values()))
+
+            # Reported emotions feed the analytics of contacts the user already has. Queued
+            # last, so a batch retried after a failed insert doesn't count them twice.
+            # Scoped to the exchanges they came from: the same evidence in a later chat counts again
+            scope = f"chat:{content_hash(transcript.encode('utf-8'))}"
+            for observation in result.get("observations") or []:
+                emotion = (observation.get("emotion") or "").strip().lower()
+                if emotion:
+                    await contact_analytics.observe(
+                        observation.get("contact_name"),
+                        [{"sender": "contact", "text": observation.get("evidence"), "emotion": emotion}],
+                        "chat",
+                        scope=scope,
                     )
-                    db.add(new_memory)
-            
-            db.commit()
-        except Exception as e:
-            print(f"Memory extraction error (non-critical): {e}")
 
-    def get_history(self, db: Session) -> list:
-        """Get chat history."""
-        chat_session = db.query(ChatSession).order_by(ChatSession.updated_at.desc()).first()
+    async def _store_memories(self, exchanges: list[tuple[int, str, str]], rows: list[dict]):
+        # One statement for the whole batch; the unique (contact_name, fact_hash) index
+        # drops facts that are already stored, including ones a concurrent worker just wrote.
+        async with SessionLocal() as db:
+            new_memories = (await db.scalars(
+                insert_ignoring_duplicates(ContactMemory, ["contact_name", "fact_hash"])
+                .values(rows)
+                .returning(ContactMemory)
+            )).all()
+            await db.commit()
+            for new_memory in new_memories:
+                memory_retriever.add(new_memory)
+        if new_memories:
+            self._publish_memories(exchanges, new_memories)
+
+    def _publish_memories(self, exchanges: list[tuple[int, str, str]], memories: list[ContactMemory]):
+        """Send each session the facts about contacts its exchanges mention (all of them when
+        the batch came from a single session, since the model may resolve names itself)."""
+        texts = defaultdict(str)
+        for session_id, user_message, ai_response in exchanges:
+            texts[session_id] += f"\n{user_message}\n{ai_response}".lower()
+        for session_id, text in texts.items():
+            relevant = [
+                {"contact_name": memory.contact_name, "fact": memory.fact, "category": memory.category}
+                for memory in memories
+                if len(texts) == 1 or memory.contact_name.lower() in text
+            ]
+            if relevant:
+                self._publish(session_id, "memories", {"memories": relevant})
+
+    async def _summarize_sessions(self, session_ids: list[int]):
+        """Fold messages that have left the history window into each session's rolling summary.
+
+        Runs on the background summary queue. Only messages newer than `summarized_until_id`
+        are sent, together with the previous summary, so each update is incremental.
+        """
+        async with SessionLocal() as db:
+            for session_id in set(session_ids):
+                chat_session = await db.get(ChatSession, session_id)
+                if not chat_session:
+                    continue
+                current_session.set(chat_session.id)
+
+                # Everything older than the window the loader builds (message count and token budget)
+                window = await self._load_history_window(db, chat_session)
+                folded_query = (
+                    select(ChatMessage)
+                    .where(
+                        ChatMessage.session_id == session_id,
+                        ChatMessage.id > (chat_session.summarized_until_id or 0),
+                    )
+                    .order_by(ChatMessage.id)
+                    .limit(settings.SUMMARY_MAX_MESSAGES)
+                )
+                if window:
+                    folded_query = folded_query.where(ChatMessage.id < window[0].id)
+                folded = (await db.scalars(folded_query)).all()
+                if len(folded) < settings.SUMMARY_MIN_MESSAGES:
+                    continue
+
+                transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in folded)
+                summary_input = f"""Current summary:
+{chat_session.summary or "(none yet)"}
+
+New messages to fold in:
+{transcript}"""
+
+                response = await model_router.chat_completion(
+                    "summary",
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": summary_input},
+                    ],
+                    max_tokens=settings.SUMMARY_MAX_TOKENS,
+                    timeout=settings.SUMMARY_TIMEOUT,
+                )
+
+                chat_session.summary = response.choices[0].message.content
+                chat_session.summarized_until_id = folded[-1].id
+                await db.commit()
+                self._publish(session_id, "summary", {
+                    "summary": chat_session.summary,
+                    "summarized_until_id": chat_session.summarized_until_id,
+                })
+
+    async def connect(self, session_id: int | None = None) -> "ChatConnection":
+        """Load a session (see get_session; created if there is none) and its history window
+        for a WebSocket connection, which owns its DB session from here on."""
+        db = SessionLocal()
+        try:
+            chat_session = await self._get_or_create_session(db, session_id)
+            history = await self._load_history_window(db, chat_session)
+            await db.commit()
+        except BaseException:
+            await db.close()
+            raise
+        return ChatConnection(self, db, chat_session, history)
+
+    async def get_history(self, db: AsyncSession, session_id: int | None = None, before_id: int | None = None, limit: int = 50) -> dict:
+        """Get one page of a session's history, newest page first, messages in chronological order.
+
+        Pass the returned `next_before_id` as `before_id` to fetch the previous page.
+        """
+        chat_session = await self.get_session(db, session_id)
         if not chat_session:
-            return []
-        
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == chat_session.id
-        ).order_by(ChatMessage.created_at).all()
-
-        return [
-            {
-                "id": msg.id,
-                "role": msg.role,
-                "content": msg.content,
-                "is_voice": msg.is_voice,
-                "created_at": msg.created_at.isoformat(),
-            }
-            for msg in messages
-        ]
-
-    def clear_history(self, db: Session):
-        """Clear all chat history (start fresh)."""
-        db.query(ChatMessage).delete()
-        db.query(ChatSession).delete()
-        db.commit()
+            return {"session_id": None, "messages": [], "next_before_id": None}
+
+        query = select(ChatMessage).where(ChatMessage.session_id == chat_session.id)
+        if before_id is not None:
+            # Seek from the cursor message's position in (created_at, id) order
+            cursor = select(ChatMessage.created_at).where(ChatMessage.id == before_id).scalar_subquery()
+            query = query.where(tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(cursor, before_id))
+        messages = list((await db.scalars(
+            query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1)
+        )).all())
+
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        messages.reverse()
+
+        return {
+            "session_id": chat_session.id,
+            "messages": [message_dict(msg) for msg in messages],
+            "next_before_id": messages[0].id if has_more else None,
+        }
+
+    async def clear_history(self, db: AsyncSession, session_id: int | None = None) -> int | None:
+        """Delete one session and its messages (the most recent one without an id).
+
+        Returns the deleted session's id, or None if there was nothing to delete.
+        """
+        chat_session = await self.get_session(db, session_id)
+        if not chat_session:
+            return None
+        await db.execute(delete(ChatMessage).where(ChatMessage.session_id == chat_session.id))
+        await db.execute(delete(ChatSession).where(ChatSession.id == chat_session.id))
+        await db.commit()
+        memory_retriever.forget_session(chat_session.id)
+        return chat_session.id
+
+
+class ChatConnection:
+    """Conversation state kept for the life of one WebSocket connection.
+
+    The session row, rolling summary and history window are loaded once; each turn appends
+    its exchange to the window in memory instead of re-querying, so the only per-turn DB
+    work is the memory index refresh (when due) and saving the exchange. Exchanges and
+    summaries written elsewhere for the same session arrive through `updates()`.
+    """
+
+    def __init__(self, service: "ChatService", db: AsyncSession, chat_session: ChatSession, history: list[ChatMessage]):
+        self.service = service
+        self.db = db
+        self.chat_session = chat_session
+        self.history = history
+        self._updates = service.subscribe(chat_session.id)
+
+    async def turn(self, content: str, image: PreparedImage | None = None) -> AsyncIterator[tuple[str, dict]]:
+        """Yield ("token" | "done" | "error", data) events for one message, like stream_message."""
+        current_session.set(self.chat_session.id)
+        try:
+            messages = await self.service._build_messages(self.db, self.chat_session, self.history, content, image)
+            # Don't hold a pooled connection (opened by a memory index refresh) while the model streams
+            await self.db.commit()
+
+            parts = []
+            async for delta in self.service._stream_reply(messages, content, image is not None):
+                parts.append(delta)
+                yield "token", {"content": delta}
+
+            assistant_text = "".join(parts)
+            saved = await self.service._finish_turn(self.db, self.chat_session, self.history, content, assistant_text, origin=self)
+            self.history = fit_history_window(self.history + saved)
+            yield "done", {"response": assistant_text, "session_id": self.chat_session.id}
+
+        except Exception as e:
+            await self.db.rollback()
+            logger.exception("chat turn failed")
+            yield "error", {"error": str(e)}
+
+    async def updates(self) -> AsyncIterator[tuple[str, dict]]:
+        """Apply changes made outside this connection to its state, yielding those the client should see."""
+        while True:
+            event, data, origin = await self._updates.get()
+            if event == "summary":
+                # Not a pending change of ours: keep the next commit from writing it back
+                set_committed_value(self.chat_session, "summary", data["summary"])
+                set_committed_value(self.chat_session, "summarized_until_id", data["summarized_until_id"])
+            elif event == "exchange":
+                if origin is self:
+                    continue
+                self.history = fit_history_window(self.history + data)
+                for msg in data:
+                    yield "message", message_dict(msg)
+            else:
+                yield event, data
+
+    async def close(self):
+        self.service.unsubscribe(self.chat_session.id, self._updates)
+        await self.db.close()
 
 
 chat_service = ChatService()
@@ -0,0 +1,399 @@
+from core.config import settings
+from core.database import SessionLocal, insert_ignoring_duplicates
+from core.job_queue import JobQueue
+from models.contact import Contact, ContactMessage, ContactStats
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as clock_time, timedelta
+from typing import Any, Iterable
+import hashlib
+import math
+import re
+import uuid
+
+# Valence (-1 negative .. 1 positive) of the emotion labels the extraction prompts produce.
+# Labels not listed still count in the distribution but don't move the volatility score.
+EMOTION_VALENCE = {
+    "excited": 0.9, "joyful": 0.9, "loving": 0.9, "happy": 0.8, "affectionate": 0.8,
+    "grateful": 0.7, "flirty": 0.6, "playful": 0.6, "amused": 0.6, "content": 0.5,
+    "hopeful": 0.4, "curious": 0.2, "calm": 0.2, "surprised": 0.1, "neutral": 0.0,
+    "confused": -0.2, "bored": -0.3, "tired": -0.3, "distant": -0.3, "sarcastic": -0.3,
+    "nervous": -0.4, "defensive": -0.4, "cold": -0.4, "anxious": -0.5, "worried": -0.5,
+    "annoyed": -0.5, "irritated": -0.5, "disappointed": -0.6, "frustrated": -0.6, "jealous": -0.6,
+    "sad": -0.7, "hurt": -0.7, "angry": -0.8, "furious": -0.9,
+}
+# Typical reply gap (minutes) that scores 50 responsiveness
+RESPONSIVENESS_HALF_MINUTES = 30.0
+
+_CLOCK_RE = re.compile(r"^\s*(\d{1,2})[:.](\d{2})\s*([ap]\.?m\.?)?\s*$", re.IGNORECASE)
+_USER_SENDERS = {"user", "me", "you"}
+
+
+def parse_clock(value: Any) -> clock_time | None:
+    """'14:05', '2:05 pm', '2.05am' -> time; anything else -> None."""
+    match = _CLOCK_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower().startswith("p") else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return clock_time(hour, minute)
+
+
+def conversation_messages(conversation: list[dict]) -> list[dict]:
+    """Normalize extracted messages ({sender, text, emotion, time}) for `ContactAnalytics.observe`.
+
+    Screenshot timestamps carry no date, so they are laid out on one nominal day, rolling
+    over midnight whenever the clock goes backwards; only the gaps between them matter.
+    """
+    messages = []
+    day = date(2000, 1, 1)
+    previous = None
+    for message in conversation:
+        sent_at = None
+        clock = parse_clock(message.get("time"))
+        if clock is not None:
+            sent_at = datetime.combine(day, clock)
+            if previous is not None and sent_at < previous:
+                day += timedelta(days=1)
+                sent_at += timedelta(days=1)
+            previous = sent_at
+        sender = (message.get("sender") or "").strip().lower()
+        messages.append({
+            "sender": "user" if sender in _USER_SENDERS else "contact",
+            "text": message.get("text"),
+            "emotion": (message.get("emotion") or "").strip().lower() or None,
+            "sent_at": sent_at,
+        })
+    return messages
+
+
+class MessageKeys:
+    """Identity of each message in its contact's history, so a message seen again is stored
+    and counted once.
+
+    A message with a real timestamp is identified by sender, time and text, plus which
+    repeat of those it is (a second "haha" in the same minute is a new message), so the
+    same message in a re-imported or longer export gets the same key. Messages without
+    one (screenshot times carry no date, chat observations no time at all) only match
+    within `scope`, the source they came from: the same screenshot re-uploaded, not
+    another conversation that also has an "ok" in it. Pass `dated=False` when the
+    messages' `sent_at` is not a real timestamp. Messages come in time order, so dated
+    repeats are only tracked for the latest time; a conversation keyed in several calls
+    uses one instance throughout.
+    """
+
+    def __init__(self, scope: str | None = None, dated: bool = True):
+        self.scope = scope or uuid.uuid4().hex
+        self.dated = dated
+        self._sent_at: datetime | None = None
+        self._repeats: dict[tuple, int] = {}
+        self._scoped_repeats: dict[tuple, int] = {}
+
+    def __call__(self, message: dict) -> str:
+        sent_at = message.get("sent_at")
+        if self.dated and sent_at is not None:
+            if sent_at != self._sent_at:
+                self._sent_at = sent_at
+                self._repeats.clear()
+            identity = ("dated", message["sender"], sent_at.isoformat(), message.get("text") or "")
+            repeats = self._repeats
+        else:
+            identity = ("scope", self.scope, message["sender"], message.get("text") or "")
+            repeats = self._scoped_repeats
+        repeat = repeats.get(identity, 0)
+        repeats[identity] = repeat + 1
+        return hashlib.sha256("\x1f".join((*identity, str(repeat))).encode()).hexdigest()
+
+
+@dataclass
+class RunningStats:
+    """Welford's online mean and variance."""
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+
+@dataclass
+class Aggregates:
+    """In-memory form of a ContactStats row; `add` folds in one message in O(1)."""
+    message_count: int = 0
+    emotion_counts: dict[str, int] = field(default_factory=dict)
+    valence: RunningStats = field(default_factory=RunningStats)
+    gaps: RunningStats = field(default_factory=RunningStats)
+    gap_min: float | None = None
+    gap_max: float | None = None
+
+    @classmethod
+    def from_row(cls, row: ContactStats) -> "Aggregates":
+        return cls(
+            message_count=row.message_count or 0,
+            emotion_counts=dict(row.emotion_counts or {}),
+            valence=RunningStats(row.valence_n or 0, row.valence_mean or 0.0, row.valence_m2 or 0.0),
+            gaps=RunningStats(row.gap_n or 0, row.gap_mean or 0.0, row.gap_m2 or 0.0),
+            gap_min=row.gap_min_minutes,
+            gap_max=row.gap_max_minutes,
+        )
+
+    def to_row(self, row: ContactStats):
+        row.message_count = self.message_count
+        row.emotion_counts = dict(self.emotion_counts)  # a new object, so the JSON change is flushed
+        row.valence_n, row.valence_mean, row.valence_m2 = self.valence.n, self.valence.mean, self.valence.m2
+        row.gap_n, row.gap_mean, row.gap_m2 = self.gaps.n, self.gaps.mean, self.gaps.m2
+        row.gap_min_minutes, row.gap_max_minutes = self.gap_min, self.gap_max
+
+    def add(
+        self,
+        sender: str,
+        emotion: str | None,
+        sent_at: datetime | None,
+        key: str,
+        pending: dict[str, datetime],
+        counted: bool = True,
+    ):
+        """Fold in one message. `pending` maps conversation key -> time of the user message
+        still waiting for the contact's reply (the reply gap is measured to the first one).
+        A message already counted before (`counted` false) only moves that bookkeeping along."""
+        if sender == "user":
+            if sent_at is not None:
+                pending.setdefault(key, sent_at)
+            return
+
+        asked_at = pending.pop(key, None)
+        if not counted:
+            return
+        self.message_count += 1
+        if emotion:
+            self.emotion_counts[emotion] = self.emotion_counts.get(emotion, 0) + 1
+            if emotion in EMOTION_VALENCE:
+                self.valence.add(EMOTION_VALENCE[emotion])
+        if asked_at is not None and sent_at is not None and sent_at >= asked_at:
+            minutes = (sent_at - asked_at).total_seconds() / 60
+            self.gaps.add(math.log1p(minutes))
+            self.gap_min = minutes if self.gap_min is None else min(self.gap_min, minutes)
+            self.gap_max = minutes if self.gap_max is None else max(self.gap_max, minutes)
+
+    @property
+    def volatility(self) -> int:
+        """0-100: standard deviation of the contact's emotional valence."""
+        return round(100 * min(1.0, math.sqrt(self.valence.variance)))
+
+    @property
+    def typical_gap_minutes(self) -> float | None:
+        # Mean in log space: a geometric mean, so one reply after a week doesn't swamp the rest
+        return math.expm1(self.gaps.mean) if self.gaps.n else None
+
+    @property
+    def responsiveness(self) -> int:
+        """0-100: 100 for instant replies, 50 at RESPONSIVENESS_HALF_MINUTES; 50 until a gap is seen."""
+        typical = self.typical_gap_minutes
+        if typical is None:
+            return 50
+        return round(100 / (1 + typical / RESPONSIVENESS_HALF_MINUTES))
+
+    def summary(self) -> dict:
+        total = sum(self.emotion_counts.values())
+        return {
+            "message_count": self.message_count,
+            "emotions": {
+                label: round(count / total, 4)
+                for label, count in sorted(self.emotion_counts.items(), key=lambda item: -item[1])
+            } if total else {},
+            "valence_mean": round(self.valence.mean, 4),
+            "valence_stddev": round(math.sqrt(self.valence.variance), 4),
+            "reply_gaps": self.gaps.n,
+            "typical_reply_minutes": round(self.typical_gap_minutes, 1) if self.gaps.n else None,
+            "fastest_reply_minutes": self.gap_min,
+            "slowest_reply_minutes": self.gap_max,
+            "emotional_volatility": self.volatility,
+            "responsiveness_score": self.responsiveness,
+        }
+
+
+class ContactAnalytics:
+    """Per-contact emotion and reply-gap aggregates, updated incrementally.
+
+    Every analyzed conversation is stored as ContactMessage rows and folded into the
+    contact's ContactStats row with online formulas, and the derived scores are written
+    to the Contact columns, so reading a contact costs nothing extra. Each message is stored
+    and counted once (see MessageKeys), and the stats row is read for update, so writers
+    in other workers or processes (the queue, imports) don't lose each other's updates.
+    """
+
+    def __init__(self):
+        self.queue = JobQueue(
+            "contact-analytics",
+            self._apply_batch,
+            workers=1,
+            batch_size=settings.ANALYTICS_QUEUE_BATCH_SIZE,
+            max_retries=settings.MEMORY_QUEUE_MAX_RETRIES,
+            retry_backoff=settings.MEMORY_QUEUE_RETRY_BACKOFF,
+            enqueue_timeout=settings.MEMORY_QUEUE_ENQUEUE_TIMEOUT,
+        )
+
+    async def observe(
+        self,
+        contact_name: str | None,
+        messages: list[dict],
+        source: str,
+        scope: str | None = None,
+        create_contact: bool = False,
+    ) -> bool:
+        """Queue messages ({sender: "user"|"contact", text, emotion, sent_at}) of one conversation.
+
+        Their `sent_at`, if any, is only relative, so a message is skipped as already seen
+        only when it was observed before under the same `scope` (see MessageKeys); without
+        one, every call counts. Unknown contacts are created when `create_contact` is set
+        and skipped otherwise.
+        """
+        name = (contact_name or "").strip()
+        if not name or name.lower() == "partner" or not messages:
+            return False
+        return await self.queue.enqueue((name, messages, source, scope, create_contact))
+
+    async def observe_analysis(self, analysis: dict, scope: str | None = None, source: str = "analyze") -> bool:
+        """Queue a screenshot analysis (participant_name + conversation) for its contact, if
+        that contact exists; a name the vision model misread doesn't become a contact.
+        `scope` identifies the screenshot (its normalized image hash)."""
+        return await self.observe(
+            analysis.get("participant_name"),
+            conversation_messages(analysis.get("conversation") or []),
+            source,
+            scope=scope,
+        )
+
+    async def find_contact(self, db: AsyncSession, name: str, create: bool) -> Contact | None:
+        contact = await db.scalar(
+            select(Contact).where(func.lower(Contact.name) == name.lower()).order_by(Contact.id).limit(1)
+        )
+        if contact is None and create:
+            contact = Contact(name=name)
+            db.add(contact)
+            await db.flush()
+        return contact
+
+    async def record(
+        self,
+        db: AsyncSession,
+        contact: Contact,
+        messages: list[dict],
+        source: str,
+        key: str | None = None,
+        pending: dict[str, datetime] | None = None,
+        message_keys: MessageKeys | None = None,
+    ) -> int:
+        """Store one conversation's messages and fold the new ones into the contact's aggregates
+        (no commit). Returns how many were new.
+
+        Messages already stored for the contact (same MessageKeys key) are skipped. A
+        conversation written in several calls passes the same `key`, `pending` and
+        `message_keys` to each, so reply gaps and repeats spanning two calls still count.
+        """
+        if not messages:
+            return 0
+        key = key or uuid.uuid4().hex
+        message_keys = message_keys or MessageKeys()
+        keys = [message_keys(message) for message in messages]
+        new_keys = set((await db.scalars(
+            insert_ignoring_duplicates(ContactMessage, ["contact_id", "message_key"]).returning(ContactMessage.message_key),
+            [
+                {
+                    "contact_id": contact.id,
+                    "conversation_key": key,
+                    "sender": message["sender"],
+                    "text": message.get("text"),
+                    "emotion": message.get("emotion"),
+                    "sent_at": message.get("sent_at"),
+                    "source": source,
+                    "message_key": identity,
+                }
+                for message, identity in zip(messages, keys)
+            ],
+        )).all())
+
+        # Create the row if needed, then lock it: concurrent writers apply their updates in turn.
+        # The re-read overwrites the loaded row, so an earlier call's update in this session
+        # (a queue batch with several conversations for one contact) is flushed first.
+        await db.flush()
+        await db.execute(insert_ignoring_duplicates(ContactStats, ["contact_id"]).values(contact_id=contact.id))
+        stats = await db.scalar(
+            select(ContactStats)
+            .where(ContactStats.contact_id == contact.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        aggregates = Aggregates.from_row(stats)
+        pending = {} if pending is None else pending
+        added = 0
+        for message, identity in zip(messages, keys):
+            counted = identity in new_keys
+            new_keys.discard(identity)  # a repeat within the batch counts once too
+            added += counted
+            aggregates.add(message["sender"], message.get("emotion"), message.get("sent_at"), key, pending, counted)
+        self._store(aggregates, stats, contact)
+        return added
+
+    def _store(self, aggregates: Aggregates, stats: ContactStats, contact: Contact):
+        aggregates.to_row(stats)
+        contact.emotional_volatility = aggregates.volatility
+        contact.responsiveness_score = aggregates.responsiveness
+
+    async def _apply_batch(self, batch: list[tuple[str, list[dict], str, str | None, bool]]):
+        async with SessionLocal() as db:
+            contacts: dict[str, Contact | None] = {}
+            for name, messages, source, scope, create in batch:
+                if name.lower() not in contacts or (contacts[name.lower()] is None and create):
+                    contacts[name.lower()] = await self.find_contact(db, name, create)
+                contact = contacts[name.lower()]
+                if contact is not None:
+                    await self.record(db, contact, messages, source, message_keys=MessageKeys(scope, dated=False))
+            await db.commit()
+
+    async def stats(self, db: AsyncSession, contact_id: int) -> dict | None:
+        row = await db.get(ContactStats, contact_id)
+        return Aggregates.from_row(row).summary() if row else None
+
+    async def recompute(self, db: AsyncSession, contact_ids: Iterable[int] | None = None) -> int:
+        """Rebuild aggregates and scores from the stored messages in one streamed pass per
+        contact (backfill, or after changing the scoring). Returns the number of contacts."""
+        if contact_ids is None:
+            contact_ids = (await db.scalars(select(Contact.id).order_by(Contact.id))).all()
+        count = 0
+        for contact_id in contact_ids:
+            contact = await db.get(Contact, contact_id)
+            if contact is None:
+                continue
+            aggregates = Aggregates()
+            pending: dict[str, datetime] = {}
+            messages = await db.stream_scalars(
+                select(ContactMessage)
+                .where(ContactMessage.contact_id == contact_id)
+                .order_by(ContactMessage.id)
+                .execution_options(yield_per=1000)
+            )
+            async for message in messages:
+                aggregates.add(message.sender, message.emotion, message.sent_at, message.conversation_key, pending)
+            stats = await db.get(ContactStats, contact_id)
+            if stats is None:
+                stats = ContactStats(contact_id=contact_id)
+                db.add(stats)
+            self._store(aggregates, stats, contact)
+            await db.commit()
+            count += 1
+        return count
+
+
+contact_analytics = ContactAnalytics()
@@ -0,0 +1,74 @@
+from core.database import IS_SQLITE
+from core.migrations import POSTGRES_CONTACT_VECTOR, POSTGRES_MEMORY_VECTOR
+from models.contact import Contact
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+import re
+
+_TERM_RE = re.compile(r"\w+")
+MAX_TERMS = 8
+
+_SQLITE_SEARCH = text(
+    """SELECT rowid, kind, name, snippet(contact_search, -1, '', '', '…', 12) AS snippet
+    FROM contact_search WHERE contact_search MATCH :query
+    ORDER BY bm25(contact_search, 0, 5.0, 1.0) LIMIT :limit"""
+)
+_POSTGRES_SEARCH = text(
+    f"""SELECT kind, id, name, snippet FROM (
+        SELECT 'contact' AS kind, id, name,
+            ts_headline('simple', coalesce(nickname, '') || ' ' || coalesce(notes, ''), q, 'StartSel="",StopSel="",MaxWords=12') AS snippet,
+            ts_rank({POSTGRES_CONTACT_VECTOR}, q) AS rank
+        FROM contacts, to_tsquery('simple', :query) AS q WHERE {POSTGRES_CONTACT_VECTOR} @@ q
+        UNION ALL
+        SELECT 'memory', id, contact_name,
+            ts_headline('simple', fact, q, 'StartSel="",StopSel="",MaxWords=12'),
+            ts_rank({POSTGRES_MEMORY_VECTOR}, q)
+        FROM contact_memories, to_tsquery('simple', :query) AS q WHERE {POSTGRES_MEMORY_VECTOR} @@ q
+    ) AS hits ORDER BY rank DESC LIMIT :limit"""
+)
+
+
+def search_terms(query: str) -> list[str]:
+    """Words of a user query; punctuation is dropped so it can't be read as query syntax."""
+    return _TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class ContactSearch:
+    """Full-text search over contact names, nicknames, notes and memory facts.
+
+    Every word must match as a word prefix, so results narrow as the user types.
+    Backed by the FTS5 table / GIN indexes created in migration 4.
+    """
+
+    async def search(self, db: AsyncSession, query: str, limit: int = 20) -> list[dict]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        if IS_SQLITE:
+            match = " ".join(f'"{term}"*' for term in terms)
+            rows = (await db.execute(_SQLITE_SEARCH, {"query": match, "limit": limit})).all()
+            hits = [
+                {"type": row.kind, "id": row.rowid // 2, "name": row.name, "snippet": row.snippet}
+                for row in rows
+            ]
+        else:
+            match = " & ".join(f"{term}:*" for term in terms)
+            rows = (await db.execute(_POSTGRES_SEARCH, {"query": match, "limit": limit})).all()
+            hits = [{"type": row.kind, "id": row.id, "name": row.name, "snippet": row.snippet} for row in rows]
+
+        # Memories name their contact; link them to the contact record where there is one.
+        # Contact names are nullable: a nameless contact can still match on its notes.
+        names = {hit["name"].lower() for hit in hits if hit["type"] == "memory" and hit["name"]}
+        contact_ids = {}
+        if names:
+            contact_ids = dict((await db.execute(
+                select(func.lower(Contact.name), func.min(Contact.id))
+                .where(func.lower(Contact.name).in_(names))
+                .group_by(func.lower(Contact.name))
+            )).all())
+        for hit in hits:
+            hit["contact_id"] = hit["id"] if hit["type"] == "contact" else contact_ids.get((hit["name"] or "").lower())
+        return hits
+
+
+contact_search = ContactSearch()
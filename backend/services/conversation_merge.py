@@ -0,0 +1,84 @@
+from collections import Counter
+from difflib import SequenceMatcher
+import re
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+# OCR of the same bubble on two screenshots can differ slightly
+SIMILARITY_THRESHOLD = 0.9
+
+
+def _normalize(text: str) -> str:
+    return _SPACE_RE.sub(" ", _NON_WORD_RE.sub("", (text or "").lower())).strip()
+
+
+def _same_message(a: dict, b: dict) -> bool:
+    if (a.get("sender") or "").lower() != (b.get("sender") or "").lower():
+        return False
+    left, right = _normalize(a.get("text", "")), _normalize(b.get("text", ""))
+    if left == right:
+        return True
+    return SequenceMatcher(None, left, right).ratio() >= SIMILARITY_THRESHOLD
+
+
+def _overlap(head: list[dict], tail: list[dict]) -> int:
+    """Length of the longest suffix of `head` that matches a prefix of `tail`."""
+    for size in range(min(len(head), len(tail)), 0, -1):
+        if all(_same_message(head[len(head) - size + i], tail[i]) for i in range(size)):
+            return size
+    return 0
+
+
+def _contains(haystack: list[dict], needle: list[dict]) -> bool:
+    for start in range(len(haystack) - len(needle) + 1):
+        if all(_same_message(haystack[start + i], needle[i]) for i in range(len(needle))):
+            return True
+    return False
+
+
+def merge_message_lists(conversations: list[list[dict]]) -> list[dict]:
+    """Stitch the messages extracted from consecutive screenshots into one ordered list.
+
+    Screenshots are expected in upload order, but an overlap in the other direction
+    (a later screenshot scrolled further up) is detected and prepended instead.
+    Screenshots that add nothing new are skipped.
+    """
+    merged: list[dict] = []
+    for messages in conversations:
+        if not messages:
+            continue
+        if not merged:
+            merged = list(messages)
+            continue
+        if len(messages) <= len(merged) and _contains(merged, messages):
+            continue
+
+        forward = _overlap(merged, messages)
+        backward = _overlap(messages, merged)
+        if backward > forward:
+            merged = list(messages) + merged[backward:]
+        else:
+            merged = merged + list(messages[forward:])
+    return merged
+
+
+def merge_analyses(analyses: list[dict]) -> dict:
+    """Combine per-screenshot vision results into one conversation context."""
+    names = [
+        a.get("participant_name") for a in analyses
+        if a.get("participant_name") and a.get("participant_name") != "Partner"
+    ]
+    summaries = []
+    for analysis in analyses:
+        summary = analysis.get("summary")
+        if summary and summary not in summaries:
+            summaries.append(summary)
+
+    return {
+        "conversation": merge_message_lists([a.get("conversation", []) for a in analyses]),
+        "summary": " ".join(summaries),
+        # The latest screenshot best reflects where the conversation is now
+        "overall_mood": analyses[-1].get("overall_mood", "") if analyses else "",
+        "participant_name": Counter(names).most_common(1)[0][0] if names else "Partner",
+    }
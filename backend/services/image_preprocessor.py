@@ -0,0 +1,152 @@
+from core.config import settings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from core.metrics import span
+from core.uploads import b64_data_url
+from PIL import Image, ImageOps, UnidentifiedImageError
+from typing import BinaryIO
+import asyncio
+import io
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+PHASH_SIZE = 16
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_size: int
+    phash: str  # 256-bit difference hash (hex) for near-duplicate matching
+
+    def to_data_url(self) -> str:
+        return b64_data_url(self.mime_type, self.data)
+
+
+class ImagePreprocessor:
+    """Decodes, normalizes and shrinks uploaded screenshots before they are sent to a vision model.
+
+    The image is decoded once, EXIF-rotated, optionally cropped, downscaled to what the model
+    actually uses in high-detail mode, and re-encoded without metadata. The CPU work runs on a
+    thread pool (Pillow releases the GIL while decoding, resizing and encoding) so it never
+    blocks the event loop.
+    """
+
+    def __init__(self):
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image-preprocess"
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def prepare(self, image: bytes | BinaryIO, crop_bars: bool | None = None) -> PreparedImage:
+        """Preprocess an uploaded image (bytes or a seekable file such as a spooled upload).
+        Raises ValueError if it cannot be decoded."""
+        if crop_bars is None:
+            crop_bars = settings.IMAGE_CROP_BARS
+        loop = asyncio.get_running_loop()
+        with span("image_preprocess"):
+            return await loop.run_in_executor(self.executor, self._prepare_sync, image, crop_bars)
+
+    def _prepare_sync(self, image: bytes | BinaryIO, crop_bars: bool) -> PreparedImage:
+        if isinstance(image, (bytes, bytearray)):
+            source, size = io.BytesIO(image), len(image)
+        else:
+            # Pillow reads the file incrementally, so the upload is never copied whole into memory
+            size = image.seek(0, io.SEEK_END)
+            image.seek(0)
+            source = image
+        try:
+            return self._normalize(Image.open(source), crop_bars, size)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            raise ValueError("Unsupported or corrupt image") from e
+
+    def _normalize(self, img: Image.Image, crop_bars: bool, original_size: int) -> PreparedImage:
+        with img:
+            # Let the JPEG decoder skip detail we are going to throw away anyway
+            img.draft("RGB", (settings.IMAGE_MAX_SHORT_SIDE, settings.IMAGE_MAX_LONG_SIDE))
+            img = ImageOps.exif_transpose(img)
+
+            if crop_bars:
+                img = self._crop_system_bars(img)
+
+            img = self._to_rgb(img)
+            img = self._downscale(img)
+
+            fmt = settings.IMAGE_FORMAT.upper()
+            if fmt not in MIME_TYPES:
+                fmt = "JPEG"
+            out = io.BytesIO()
+            # Saving without exif/icc arguments drops all metadata
+            if fmt == "PNG":
+                img.save(out, format=fmt, optimize=True)
+            else:
+                img.save(out, format=fmt, quality=settings.IMAGE_QUALITY)
+
+            return PreparedImage(
+                data=out.getvalue(),
+                mime_type=MIME_TYPES[fmt],
+                width=img.width,
+                height=img.height,
+                original_size=original_size,
+                phash=self._difference_hash(img),
+            )
+
+    def _difference_hash(self, img: Image.Image) -> str:
+        """dHash: compare neighbouring pixels of a 17x16 grayscale thumbnail."""
+        size = PHASH_SIZE
+        pixels = list(img.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+        bits = 0
+        for row in range(size):
+            for col in range(size):
+                left = pixels[row * (size + 1) + col]
+                right = pixels[row * (size + 1) + col + 1]
+                bits = (bits << 1) | (left > right)
+        return f"{bits:0{size * size // 4}x}"
+
+    def _crop_system_bars(self, img: Image.Image) -> Image.Image:
+        """Trim the phone status bar and navigation bar from tall (portrait phone) screenshots."""
+        width, height = img.size
+        if height < width * settings.IMAGE_CROP_MIN_ASPECT:
+            return img
+        top = int(height * settings.IMAGE_STATUS_BAR_RATIO)
+        bottom = height - int(height * settings.IMAGE_NAV_BAR_RATIO)
+        return img.crop((0, top, width, bottom))
+
+    def _to_rgb(self, img: Image.Image) -> Image.Image:
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            return background
+        if img.mode != "RGB":
+            return img.convert("RGB")
+        return img
+
+    def _downscale(self, img: Image.Image) -> Image.Image:
+        """Fit within the model's high-detail limits (long side and short side caps)."""
+        width, height = img.size
+        long_side, short_side = max(width, height), min(width, height)
+        scale = min(
+            1.0,
+            settings.IMAGE_MAX_LONG_SIDE / long_side,
+            settings.IMAGE_MAX_SHORT_SIDE / short_side,
+        )
+        if scale >= 1.0:
+            return img
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return img.resize(size, Image.Resampling.LANCZOS)
+
+
+image_preprocessor = ImagePreprocessor()
@@ -1,52 +1,234 @@
-from openai import OpenAI
 from core.config import settings
+from core.model_router import model_router
+from services.result_cache import reply_cache, context_hash
+from core.single_flight import reply_flight
+from typing import AsyncIterator
+import asyncio
 import json
+import logging
 
-# Configure OpenAI
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
 
-class LLMService:
-    def __init__(self):
-        self.model = "gpt-4o-mini"
+_decoder = json.JSONDecoder()
 
-    async def generate_replies(self, conversation_context: dict) -> dict:
-        """
-        Generates 3-tone replies based on conversation context.
-        """
+# Reply tones, in the order they are presented, with the style each should aim for
+TONES = {
+    "Warm & Supportive": "empathetic, reassuring and emotionally validating",
+    "Playful & Light": "teasing, humorous and low-pressure",
+    "Direct & Confident": "clear, self-assured and to the point",
+}
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _is_complete(result: dict) -> bool:
+    """Whether a reply result has an option for every tone (only those are cached)."""
+    replies = result.get("replies") if isinstance(result, dict) else None
+    return (
+        isinstance(replies, list)
+        and len(replies) == len(TONES)
+        and all(isinstance(reply, dict) and reply.get("text") for reply in replies)
+    )
+
+
+def _parse_complete_replies(buffer: str, pos: int | None) -> tuple[list, int | None]:
+    """Pull every fully-received reply object out of a partial `{"replies": [...]}` buffer.
+
+    `pos` is where parsing stopped last time (None until the array has opened).
+    Returns the new reply objects and the position to resume from.
+    """
+    if pos is None:
+        key = buffer.find('"replies"')
+        if key == -1:
+            return [], None
+        bracket = buffer.find("[", key)
+        if bracket == -1:
+            return [], None
+        pos = bracket + 1
+
+    replies = []
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer) or buffer[pos] == "]":
+            return replies, pos
         try:
-            prompt = f"""
+            reply, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Object still arriving
+            return replies, pos
+        replies.append(reply)
+        pos = end
+
+
+REPLIES_PROMPT = """
             You are an expert relationship strategist.
-            
-            Context:
-            {json.dumps(conversation_context, indent=2)}
-            
+            You are given the conversation context as JSON.
+
             Task:
             Generate 3 distinct reply options for the USER to send back.
             1. Warm / Supportive
             2. Playful / Light
             3. Direct / Confident
-            
+
             Output JSON format:
-            {{
+            {
                 "replies": [
-                    {{ "tone": "Warm & Supportive", "text": "...", "reasoning": "..." }},
-                    {{ "tone": "Playful & Light", "text": "...", "reasoning": "..." }},
-                    {{ "tone": "Direct & Confident", "text": "...", "reasoning": "..." }}
+                    { "tone": "Warm & Supportive", "text": "...", "reasoning": "..." },
+                    { "tone": "Playful & Light", "text": "...", "reasoning": "..." },
+                    { "tone": "Direct & Confident", "text": "...", "reasoning": "..." }
                 ]
-            }}
+            }
             """
-            
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(response.choices[0].message.content)
+
+
+def _tone_prompt(tone: str) -> str:
+    return f"""
+            You are an expert relationship strategist.
+            You are given the conversation context as JSON.
+
+            Task:
+            Write ONE reply for the USER to send back in a "{tone}" tone ({TONES[tone]}).
+
+            Output JSON format:
+            {{ "tone": "{tone}", "text": "...", "reasoning": "..." }}
+            """
+
+
+# One fixed instruction prefix per tone, so it is byte-identical across calls
+TONE_PROMPTS = {tone: _tone_prompt(tone) for tone in TONES}
+
+
+class LLMService:
+    def _build_messages(self, conversation_context: dict, instructions: str = REPLIES_PROMPT) -> list[dict]:
+        """Static instructions first, the volatile conversation context last."""
+        return [
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": f"Context:\n{compact_json(conversation_context)}"},
+        ]
+
+    async def generate_replies(self, conversation_context: dict) -> dict:
+        """
+        Generates 3-tone replies based on conversation context.
+        """
+        try:
+            cache_key = context_hash(conversation_context)
+            cached = await reply_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            # Identical contexts in flight at the same time share one call
+            return await reply_flight.do(cache_key, lambda: self._generate_replies(conversation_context, cache_key))
         except Exception as e:
-            print(f"Error generating replies: {e}")
+            logger.exception("reply generation failed")
             return {"error": str(e)}
 
+    async def _generate_replies(self, conversation_context: dict, cache_key: str) -> dict:
+        response = await model_router.chat_completion(
+            "reply",
+            messages=self._build_messages(conversation_context),
+            response_format={"type": "json_object"},
+            timeout=settings.REPLY_TIMEOUT,
+        )
+        result = json.loads(response.choices[0].message.content)
+        # A truncated or malformed answer is returned, but not served to every later caller
+        if _is_complete(result):
+            await reply_cache.set(cache_key, result)
+        return result
+
+    async def stream_replies(self, conversation_context: dict) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Streams the 3-tone replies, yielding a ("reply", option) event as soon as
+        each option is complete, then ("done", {"replies": [...]}).
+        """
+        try:
+            cache_key = context_hash(conversation_context)
+            cached = await reply_cache.get(cache_key)
+            if cached is not None:
+                for reply in cached.get("replies", []):
+                    yield "reply", reply
+                yield "done", cached
+                return
+
+            stream = await model_router.chat_completion(
+                "reply",
+                messages=self._build_messages(conversation_context),
+                response_format={"type": "json_object"},
+                stream=True,
+                timeout=settings.REPLY_TIMEOUT,
+            )
+
+            buffer = ""
+            pos = None
+            replies = []
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                buffer += chunk.choices[0].delta.content
+                completed, pos = _parse_complete_replies(buffer, pos)
+                for reply in completed:
+                    replies.append(reply)
+                    yield "reply", reply
+
+            result = {"replies": replies}
+            # A stream cut short yields what arrived, but only a full set is cached
+            if _is_complete(result):
+                await reply_cache.set(cache_key, result)
+            yield "done", result
+        except Exception as e:
+            logger.exception("reply streaming failed")
+            yield "error", {"error": str(e)}
+
+    async def generate_reply_for_tone(self, conversation_context: dict, tone: str) -> dict:
+        """Generates a single reply option in the given tone. Raises on failure."""
+        response = await model_router.chat_completion(
+            "reply",
+            messages=self._build_messages(conversation_context, TONE_PROMPTS[tone]),
+            response_format={"type": "json_object"},
+            timeout=settings.REPLY_TIMEOUT,
+        )
+        reply = json.loads(response.choices[0].message.content)
+        reply["tone"] = tone
+        return reply
+
+    async def stream_replies_parallel(self, conversation_context: dict) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Generates each tone with its own concurrent call and yields ("reply", option)
+        in completion order, then ("done", {"replies": [...]}) in tone order.
+        A failed tone is reported as ("error", ...) without stopping the others.
+        """
+        cache_key = context_hash(conversation_context)
+        cached = await reply_cache.get(cache_key)
+        if cached is not None:
+            for reply in cached.get("replies", []):
+                yield "reply", reply
+            yield "done", cached
+            return
+
+        tasks = [
+            asyncio.create_task(self.generate_reply_for_tone(conversation_context, tone))
+            for tone in TONES
+        ]
+        replies = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    reply = await next_done
+                except Exception as e:
+                    logger.exception("tone reply generation failed")
+                    yield "error", {"error": str(e)}
+                    continue
+                replies[reply["tone"]] = reply
+                yield "reply", reply
+        finally:
+            # Client went away mid-stream: don't leave calls running
+            for task in tasks:
+                task.cancel()
+
+        result = {"replies": [replies[tone] for tone in TONES if tone in replies]}
+        if _is_complete(result):
+            await reply_cache.set(cache_key, result)
+        yield "done", result
+
 llm_service = LLMService()
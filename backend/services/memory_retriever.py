@@ -0,0 +1,265 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.tokens import estimate_tokens
+from models.conversation import ContactMemory
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+_STOPWORDS = {
+    "a", "about", "after", "again", "all", "also", "am", "an", "and", "any", "are", "as",
+    "at", "be", "been", "but", "by", "can", "could", "did", "do", "does", "don't", "for",
+    "from", "get", "gets", "got", "had", "has", "have", "he", "her", "him", "his", "how",
+    "i", "i'm", "if", "in", "into", "is", "it", "it's", "its", "just", "like", "me",
+    "more", "my", "no", "not", "now", "of", "on", "or", "our", "out", "really", "say",
+    "said", "she", "should", "so", "some", "than", "that", "the", "their", "them", "then",
+    "there", "they", "this", "to", "too", "up", "very", "was", "we", "were", "what",
+    "when", "which", "who", "why", "will", "with", "would", "you", "your",
+}
+
+CATEGORY_WEIGHTS = {
+    "personality": 1.0,
+    "pattern": 0.9,
+    "preference": 0.8,
+    "history": 0.7,
+}
+DEFAULT_CATEGORY_WEIGHT = 0.6
+
+# Weight of a contact-name mention relative to a single keyword match
+NAME_MATCH_WEIGHT = 3.0
+RECENCY_WEIGHT = 0.5
+# Keywords found in more than this share of all memories carry no signal
+MAX_TERM_SHARE = 0.2
+MIN_MEMORIES_FOR_TERM_SHARE = 20
+
+
+def tokenize(text: str) -> set[str]:
+    return {t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1}
+
+
+@dataclass
+class _Entry:
+    id: int
+    contact_name: str
+    fact: str
+    category: str
+    created_at: datetime
+    terms: set[str]
+
+
+@dataclass
+class _SessionState:
+    # contact key -> turn it was last mentioned in
+    contacts: dict[str, int] = field(default_factory=dict)
+    turn: int = 0
+    signature: tuple | None = None
+    context: str = ""
+
+
+class MemoryRetriever:
+    """Picks the contact memories relevant to the current message within a token budget.
+
+    Memories are held in a local inverted index (term -> memory ids, contact -> memory ids)
+    of at most MEMORY_INDEX_MAX_ENTRIES, the newest, that is loaded once and then kept
+    current incrementally: `add` is called when new memories are written, and rows written
+    by other workers are picked up by a periodic `id > watermark` catch-up query. Only the
+    catch-up advances the watermark, and only past rows older than MEMORY_INDEX_SETTLE_SECONDS,
+    so a row another worker commits after a higher id is still read on a later pass.
+    Selections are cached per chat session and only recomputed when the query or the
+    memories behind it change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[int, _Entry] = {}
+        self._by_term: dict[str, set[int]] = defaultdict(set)
+        self._by_contact: dict[str, set[int]] = defaultdict(set)
+        self._contact_terms: dict[str, set[str]] = {}
+        self._synced_id = 0
+        self._last_sync = 0.0
+        self._loaded = False
+        self._sessions: OrderedDict[int, _SessionState] = OrderedDict()
+
+    def add(self, memory: ContactMemory):
+        """Index a newly written memory and invalidate cached selections it affects."""
+        with self._lock:
+            self._index(memory)
+
+    def _index(self, memory: ContactMemory):
+        if memory.id in self._entries:
+            return
+        contact_key = memory.contact_name.strip().lower()
+        entry = _Entry(
+            id=memory.id,
+            contact_name=memory.contact_name,
+            fact=memory.fact,
+            category=(memory.category or "general").lower(),
+            created_at=memory.created_at or datetime.utcnow(),
+            terms=tokenize(memory.fact),
+        )
+        self._entries[entry.id] = entry
+        for term in entry.terms:
+            self._by_term[term].add(entry.id)
+        self._by_contact[contact_key].add(entry.id)
+        self._contact_terms.setdefault(contact_key, tokenize(memory.contact_name))
+        self._invalidate(contact_key, entry.terms)
+
+        # Entries are indexed roughly oldest first, so the first one is the one to drop
+        while len(self._entries) > settings.MEMORY_INDEX_MAX_ENTRIES:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, memory_id: int):
+        entry = self._entries.pop(memory_id)
+        contact_key = entry.contact_name.strip().lower()
+        for term in entry.terms:
+            ids = self._by_term[term]
+            ids.discard(memory_id)
+            if not ids:
+                del self._by_term[term]
+        ids = self._by_contact[contact_key]
+        ids.discard(memory_id)
+        if not ids:
+            del self._by_contact[contact_key]
+            self._contact_terms.pop(contact_key, None)
+        self._invalidate(contact_key, entry.terms)
+
+    def _invalidate(self, contact_key: str, entry_terms: set[str]):
+        # Only sessions that could have selected this memory need recomputing
+        for state in self._sessions.values():
+            if state.signature is None:
+                continue
+            contacts, terms = state.signature
+            if contact_key in contacts or terms & entry_terms:
+                state.signature = None
+
+    async def _sync(self, db: AsyncSession):
+        now = time.monotonic()
+        if self._loaded and now - self._last_sync < settings.MEMORY_INDEX_REFRESH_SECONDS:
+            return
+        if self._loaded:
+            query = select(ContactMemory).where(ContactMemory.id > self._synced_id).order_by(ContactMemory.id)
+            memories = (await db.scalars(query)).all()
+        else:
+            query = select(ContactMemory).order_by(ContactMemory.id.desc()).limit(settings.MEMORY_INDEX_MAX_ENTRIES)
+            memories = list(reversed((await db.scalars(query)).all()))
+        settled = datetime.utcnow() - timedelta(seconds=settings.MEMORY_INDEX_SETTLE_SECONDS)
+        with self._lock:
+            for memory in memories:
+                self._index(memory)
+                if memory.created_at is None or memory.created_at <= settled:
+                    self._synced_id = max(self._synced_id, memory.id)
+            self._loaded = True
+            self._last_sync = now
+
+    def _session_state(self, session_id: int) -> _SessionState:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = _SessionState()
+            self._sessions[session_id] = state
+            if len(self._sessions) > settings.MEMORY_SESSION_CACHE_SIZE:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return state
+
+    def forget_session(self, session_id: int):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _mentioned_contacts(self, terms: set[str]) -> set[str]:
+        return {
+            key for key, name_terms in self._contact_terms.items()
+            if name_terms and name_terms & terms
+        }
+
+    async def get_context(self, db: AsyncSession, session_id: int, text: str) -> str:
+        """Return the memory block for the system prompt, or "" if nothing is relevant.
+
+        `text` is the new message plus recent history. Contacts mentioned earlier in the
+        session stay in scope for `MEMORY_CONTACT_STICKY_TURNS` turns.
+        """
+        await self._sync(db)
+        terms = tokenize(text)
+
+        with self._lock:
+            state = self._session_state(session_id)
+            state.turn += 1
+            for key in self._mentioned_contacts(terms):
+                state.contacts[key] = state.turn
+            state.contacts = {
+                key: turn for key, turn in state.contacts.items()
+                if state.turn - turn <= settings.MEMORY_CONTACT_STICKY_TURNS
+            }
+
+            signature = (frozenset(state.contacts), frozenset(terms))
+            if signature == state.signature:
+                return state.context
+
+            state.context = self._select(set(state.contacts), terms)
+            state.signature = signature
+            return state.context
+
+    def _select(self, contacts: set[str], terms: set[str]) -> str:
+        total = len(self._entries) or 1
+        scores: dict[int, float] = defaultdict(float)
+
+        for key in contacts:
+            for memory_id in self._by_contact.get(key, ()):
+                scores[memory_id] += NAME_MATCH_WEIGHT
+        for term in terms:
+            ids = self._by_term.get(term)
+            if not ids:
+                continue
+            if total >= MIN_MEMORIES_FOR_TERM_SHARE and len(ids) / total > MAX_TERM_SHARE:
+                continue
+            idf = math.log(1 + total / len(ids))
+            for memory_id in ids:
+                scores[memory_id] += idf
+
+        if not scores:
+            return ""
+
+        now = datetime.utcnow()
+        half_life = settings.MEMORY_RECENCY_HALF_LIFE_DAYS
+        ranked = []
+        for memory_id, score in scores.items():
+            entry = self._entries[memory_id]
+            age_days = max(0.0, (now - entry.created_at).total_seconds() / 86400)
+            recency = math.exp(-math.log(2) * age_days / half_life)
+            weight = CATEGORY_WEIGHTS.get(entry.category, DEFAULT_CATEGORY_WEIGHT)
+            ranked.append((score * weight + RECENCY_WEIGHT * recency, entry))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+
+        budget = settings.MEMORY_TOKEN_BUDGET
+        selected: dict[str, list[str]] = {}
+        for _, entry in ranked:
+            line = f"  - {entry.fact}"
+            cost = estimate_tokens(line)
+            if entry.contact_name not in selected:
+                cost += estimate_tokens(entry.contact_name) + 1
+            if cost > budget:
+                continue
+            budget -= cost
+            selected.setdefault(entry.contact_name, []).append(line)
+
+        if not selected:
+            return ""
+
+        memory_lines = []
+        for name, lines in selected.items():
+            memory_lines.append(f"\n{name}:")
+            memory_lines.extend(lines)
+
+        return "\n\n[CONTACT MEMORIES — things you remember about people the user has discussed:]\n" + "\n".join(memory_lines)
+
+
+memory_retriever = MemoryRetriever()
@@ -0,0 +1,236 @@
+from core.config import settings
+from collections import OrderedDict
+from typing import Any, BinaryIO
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRUNE_EVERY_WRITES = 100
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file: BinaryIO) -> str:
+    """content_hash of a seekable file, read in slices so it is never copied whole; rewinds it."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def context_hash(context: Any) -> str:
+    """Stable hash of a JSON-serializable value (key order and whitespace independent)."""
+    return content_hash(json.dumps(context, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+class PersistentStore:
+    """SQLite-backed tier shared by all caches, so cached results survive restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS result_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    phash TEXT,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_result_cache_expires ON result_cache (namespace, expires_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> tuple[Any, str | None, float] | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, phash, expires_at FROM result_cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def find_near(self, namespace: str, phash: str, max_distance: int) -> tuple[str, Any, str, float] | None:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, phash FROM result_cache WHERE namespace = ? AND phash IS NOT NULL AND expires_at > ?",
+                (namespace, time.time()),
+            ).fetchall()
+        best = min(rows, key=lambda row: hamming_distance(phash, row[1]), default=None)
+        if best is None or hamming_distance(phash, best[1]) > max_distance:
+            return None
+        found = self.get(namespace, best[0])
+        if found is None:
+            return None
+        return best[0], *found
+
+    def set(self, namespace: str, key: str, value: Any, phash: str | None, expires_at: float):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO result_cache (namespace, key, value, phash, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), phash, expires_at),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY_WRITES == 0:
+                # Drop expired rows, then the oldest rows beyond the size cap
+                self.conn.execute(
+                    "DELETE FROM result_cache WHERE namespace = ? AND expires_at <= ?", (namespace, time.time())
+                )
+                self.conn.execute(
+                    """DELETE FROM result_cache WHERE namespace = ? AND key NOT IN (
+                        SELECT key FROM result_cache WHERE namespace = ? ORDER BY expires_at DESC LIMIT ?
+                    )""",
+                    (namespace, namespace, settings.CACHE_PERSISTENT_MAX_ENTRIES),
+                )
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ResultCache:
+    """Two-tier (in-memory LRU + SQLite) TTL cache for model results, keyed by content hash.
+
+    When a perceptual hash is supplied and near-duplicate matching is enabled, a miss on the
+    exact key falls back to the closest cached entry within `CACHE_PHASH_MAX_DISTANCE` bits.
+    """
+
+    def __init__(self, namespace: str, store: PersistentStore, ttl: float, max_entries: int):
+        self.namespace = namespace
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any, str | None]] = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, value: Any, phash: str | None, expires_at: float):
+        self._entries[key] = (expires_at, value, phash)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_memory(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        # Callers may mutate what they get back
+        return copy.deepcopy(value)
+
+    def _find_near_memory(self, phash: str) -> Any | None:
+        now = time.time()
+        best, best_distance = None, settings.CACHE_PHASH_MAX_DISTANCE + 1
+        for key, (expires_at, _, entry_phash) in self._entries.items():
+            if entry_phash is None or expires_at <= now:
+                continue
+            distance = hamming_distance(phash, entry_phash)
+            if distance < best_distance:
+                best, best_distance = key, distance
+        return self._get_memory(best) if best is not None else None
+
+    async def get(self, key: str, phash: str | None = None, count_miss: bool = True) -> Any | None:
+        """The cached value, or None. A lookup that is followed by another for the same
+        request passes `count_miss=False`, so a miss is counted once."""
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        try:
+            found = await asyncio.to_thread(self.store.get, self.namespace, key)
+        except sqlite3.Error as e:
+            logger.warning("result cache read failed", extra={"error": str(e)})
+            found = None
+        if found is not None:
+            value, stored_phash, expires_at = found
+            self._remember(key, copy.deepcopy(value), stored_phash, expires_at)
+            self.hits += 1
+            self.persistent_hits += 1
+            return value
+
+        if phash and settings.CACHE_NEAR_DUPLICATES:
+            value = self._find_near_memory(phash)
+            if value is None:
+                try:
+                    near = await asyncio.to_thread(
+                        self.store.find_near, self.namespace, phash, settings.CACHE_PHASH_MAX_DISTANCE
+                    )
+                except sqlite3.Error as e:
+                    logger.warning("result cache read failed", extra={"error": str(e)})
+                    near = None
+                if near is not None:
+                    near_key, value, stored_phash, expires_at = near
+                    self._remember(near_key, copy.deepcopy(value), stored_phash, expires_at)
+                    self.persistent_hits += 1
+            if value is not None:
+                self.hits += 1
+                self.near_hits += 1
+                return value
+
+        if count_miss:
+            self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, phash: str | None = None):
+        expires_at = time.time() + self.ttl
+        self._remember(key, copy.deepcopy(value), phash, expires_at)
+        try:
+            await asyncio.to_thread(self.store.set, self.namespace, key, value, phash, expires_at)
+        except sqlite3.Error as e:
+            logger.warning("result cache write failed", extra={"error": str(e)})
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+cache_store = PersistentStore(settings.CACHE_DB_PATH)
+analysis_cache = ResultCache("analysis", cache_store, settings.CACHE_TTL_SECONDS, settings.CACHE_MAX_ENTRIES)
+reply_cache = ResultCache("reply", cache_store, settings.CACHE_TTL_SECONDS, settings.CACHE_MAX_ENTRIES)
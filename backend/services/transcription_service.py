@@ -1,39 +1,237 @@
-from openai import OpenAI
 from core.config import settings
-import tempfile
+from core.model_router import model_router
+from dataclasses import dataclass
+from typing import AsyncIterator
+import asyncio
+import logging
+import mimetypes
 import os
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+_SILENCE_START_RE = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END_RE = re.compile(r"silence_end: (-?[\d.]+)")
+_TIME_RE = re.compile(r"time=(\d+):(\d+):([\d.]+)")
+_EXTENSION_RE = re.compile(r"^\.[A-Za-z0-9]{1,8}$")
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    start: float
+    end: float
+    data: bytes
+
+
+def plan_chunks(duration: float, silences: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """Split [0, duration] into spans of about TRANSCRIPTION_CHUNK_SECONDS, cutting in the
+    middle of a silence where one is close enough, and hard-cutting at the maximum otherwise."""
+    cuts = sorted((start + end) / 2 for start, end in silences)
+    spans = []
+    start = 0.0
+    while duration - start > settings.TRANSCRIPTION_MAX_CHUNK_SECONDS:
+        target = start + settings.TRANSCRIPTION_CHUNK_SECONDS
+        latest = start + settings.TRANSCRIPTION_MAX_CHUNK_SECONDS
+        candidates = [cut for cut in cuts if start + settings.TRANSCRIPTION_CHUNK_SECONDS / 2 < cut <= latest]
+        cut = min(candidates, key=lambda c: abs(c - target)) if candidates else latest
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, duration))
+    return spans
+
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+async def _run_ffmpeg(source: str, args: list[str]) -> tuple[bytes, str]:
+    """Run ffmpeg on an audio file; returns (stdout, stderr).
+
+    The input is a file, not a pipe, so ffmpeg can seek: MP4/M4A audio with its index at
+    the end can't be demuxed from stdin.
+    """
+    process = await asyncio.create_subprocess_exec(
+        settings.FFMPEG_PATH, "-hide_banner", "-i", source, *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    log = stderr.decode("utf-8", errors="replace")
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {log.strip().splitlines()[-1] if log.strip() else process.returncode}")
+    return stdout, log
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
 
 
 class TranscriptionService:
-    def __init__(self):
-        self.model = "whisper-1"
+    async def _transcribe(self, audio_bytes: bytes, filename: str, content_type: str | None) -> str:
+        """One Whisper call on an in-memory buffer."""
+        content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        transcript = await model_router.transcription(
+            file=(filename, audio_bytes, content_type),
+            timeout=settings.TRANSCRIPTION_TIMEOUT,
+        )
+        return transcript.text.strip()
+
+    async def _detect_silences(self, source: str) -> tuple[float, list[tuple[float, float]]]:
+        """Decode once with ffmpeg's silencedetect; returns (duration, [(start, end), ...])."""
+        _, log = await _run_ffmpeg(
+            source,
+            [
+                "-vn",
+                "-af", f"silencedetect=noise={settings.TRANSCRIPTION_SILENCE_DB}dB:d={settings.TRANSCRIPTION_MIN_SILENCE_SECONDS}",
+                "-f", "null", "-",
+            ],
+        )
+        times = _TIME_RE.findall(log)
+        duration = 0.0
+        if times:
+            hours, minutes, seconds = times[-1]
+            duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+        starts = [float(value) for value in _SILENCE_START_RE.findall(log)]
+        ends = [float(value) for value in _SILENCE_END_RE.findall(log)]
+        # A trailing silence runs to the end of the file without a silence_end
+        ends += [duration] * (len(starts) - len(ends))
+        return duration, list(zip(starts, ends))
+
+    async def _extract_chunks(self, source: str, workdir: str, spans: list[tuple[float, float]]) -> list[AudioChunk]:
+        """Cut every span in one decoding pass (ffmpeg's segment muxer), each re-encoded as
+        small mono MP3, well under the upload limit."""
+        pattern = os.path.join(workdir, "chunk-%04d.mp3")
+        await _run_ffmpeg(
+            source,
+            [
+                "-vn", "-ac", "1", "-ar", "16000",
+                "-c:a", "libmp3lame", "-b:a", "48k",
+                "-f", "segment", "-segment_times", ",".join(f"{end:.3f}" for _, end in spans[:-1]),
+                "-reset_timestamps", "1",
+                pattern,
+            ],
+        )
+        paths = sorted(name for name in os.listdir(workdir) if name.startswith("chunk-"))
+        if len(paths) != len(spans):
+            raise RuntimeError(f"ffmpeg wrote {len(paths)} chunks, expected {len(spans)}")
+        return [
+            AudioChunk(index=index, start=start, end=end, data=await asyncio.to_thread(_read_file, os.path.join(workdir, path)))
+            for index, ((start, end), path) in enumerate(zip(spans, paths))
+        ]
 
-    async def transcribe_audio(self, audio_bytes: bytes, filename: str = "audio.webm") -> dict:
-        """Transcribe audio bytes using OpenAI Whisper."""
+    async def _split(self, audio_bytes: bytes, filename: str) -> list[AudioChunk] | None:
+        """Chunks of long audio, or None when it should be sent in one call: short audio, or
+        audio ffmpeg can't split (not installed, a format it can't read), which Whisper may
+        still accept whole."""
+        if len(audio_bytes) <= settings.TRANSCRIPTION_DIRECT_MAX_BYTES:
+            return None
         try:
-            # Determine file extension from filename
-            ext = os.path.splitext(filename)[1] or ".webm"
-            
-            # Write to temp file (Whisper API needs a file)
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                tmp.write(audio_bytes)
-                tmp_path = tmp.name
+            with tempfile.TemporaryDirectory(prefix="transcribe-") as workdir:
+                # Keep the extension: some containers are only recognised by it
+                extension = os.path.splitext(filename)[1]
+                source = os.path.join(workdir, "input" + (extension if _EXTENSION_RE.match(extension) else ""))
+                await asyncio.to_thread(_write_file, source, audio_bytes)
+                duration, silences = await self._detect_silences(source)
+                if duration <= settings.TRANSCRIPTION_CHUNK_THRESHOLD_SECONDS:
+                    return None
+                return await self._extract_chunks(source, workdir, plan_chunks(duration, silences))
+        except (OSError, RuntimeError) as e:
+            logger.warning("could not split audio; transcribing in one call", extra={"error": str(e)})
+            return None
 
-            try:
-                with open(tmp_path, "rb") as audio_file:
-                    transcript = client.audio.transcriptions.create(
-                        model=self.model,
-                        file=audio_file,
-                    )
-                return {"text": transcript.text}
-            finally:
-                os.unlink(tmp_path)
+    async def _transcribe_chunks(self, chunks: list[AudioChunk]) -> AsyncIterator[asyncio.Future]:
+        """Start every chunk (bounded by TRANSCRIPTION_CONCURRENCY) and yield them as they finish."""
+        semaphore = asyncio.Semaphore(settings.TRANSCRIPTION_CONCURRENCY)
+
+        async def run(chunk: AudioChunk) -> tuple[AudioChunk, str]:
+            async with semaphore:
+                return chunk, await self._transcribe(chunk.data, f"chunk-{chunk.index}.mp3", "audio/mpeg")
+
+        tasks = [asyncio.create_task(run(chunk)) for chunk in chunks]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield next_done
+        finally:
+            # Client went away mid-stream: don't leave calls running
+            for task in tasks:
+                task.cancel()
+
+    async def transcribe_audio(self, audio_bytes: bytes, filename: str = "audio.webm", content_type: str | None = None) -> dict:
+        """Transcribe audio bytes using OpenAI Whisper.
+
+        Long audio is split on silence and the chunks are transcribed concurrently,
+        then stitched back together in order.
+        """
+        try:
+            chunks = await self._split(audio_bytes, filename)
+            if chunks is None:
+                return {"text": await self._transcribe(audio_bytes, filename, content_type)}
+
+            texts = {}
+            async for next_done in self._transcribe_chunks(chunks):
+                chunk, text = await next_done
+                texts[chunk.index] = text
+            return {"text": " ".join(texts[i] for i in range(len(chunks)) if texts[i])}
 
         except Exception as e:
-            print(f"Transcription error: {e}")
+            logger.exception("transcription failed")
             return {"error": str(e)}
 
+    async def stream_transcription(self, audio_bytes: bytes, filename: str = "audio.webm", content_type: str | None = None) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Yields ("chunks", {"count", "duration"}) once the audio is split, then
+        ("chunk", {"index", "start", "end", "text", "transcript"}) as each chunk finishes,
+        where `transcript` is the in-order text of every chunk finished so far without gaps,
+        then ("done", {"text": ...}). A failed chunk is reported as ("error", ...) without
+        stopping the others.
+        """
+        try:
+            chunks = await self._split(audio_bytes, filename)
+        except Exception as e:
+            logger.exception("transcription failed")
+            yield "error", {"error": str(e)}
+            return
+
+        if chunks is None:
+            try:
+                text = await self._transcribe(audio_bytes, filename, content_type)
+            except Exception as e:
+                logger.exception("transcription failed")
+                yield "error", {"error": str(e)}
+                return
+            yield "chunks", {"count": 1, "duration": None}
+            yield "chunk", {"index": 0, "start": 0.0, "end": None, "text": text, "transcript": text}
+            yield "done", {"text": text}
+            return
+
+        yield "chunks", {"count": len(chunks), "duration": chunks[-1].end}
+        texts = {}
+        contiguous = 0
+        async for next_done in self._transcribe_chunks(chunks):
+            try:
+                chunk, text = await next_done
+            except Exception as e:
+                logger.exception("transcription failed")
+                yield "error", {"error": str(e)}
+                continue
+            texts[chunk.index] = text
+            while contiguous in texts:
+                contiguous += 1
+            yield "chunk", {
+                "index": chunk.index,
+                "start": chunk.start,
+                "end": chunk.end,
+                "text": text,
+                "transcript": " ".join(texts[i] for i in range(contiguous) if texts[i]),
+            }
+
+        yield "done", {"text": " ".join(texts[i] for i in sorted(texts) if texts[i])}
+
 
 transcription_service = TranscriptionService()
@@ -1,57 +1,71 @@
-from openai import OpenAI
 from core.config import settings
-from PIL import Image
-import io
-import base64
+from core.model_router import model_router
+from services.image_preprocessor import PreparedImage
+import json
+import logging
 
-# Configure OpenAI
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
 
-class VisionService:
-    def __init__(self):
-        self.model = "gpt-4o-mini"
-
-    async def analyze_chat_screenshot(self, image_bytes: bytes) -> dict:
-        """
-        Analyzes a chat screenshot to extract conversation, emotion, and tone.
-        """
-        try:
-            # Convert image bytes to base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            prompt = """
+EXTRACTION_PROMPT = """
             Analyze this chat screenshot. Extract the following in JSON format:
-            1. "conversation": A list of message objects with "sender" (string, use 'User' or 'Partner'), "text" (string), and "emotion" (string, e.g., happy, angry, neutral).
+            1. "conversation": A list of message objects with "sender" (string, use 'User' or 'Partner'), "text" (string), "emotion" (string, e.g., happy, angry, neutral), and "time" (the message's timestamp as shown, e.g. "14:05", or null if none is visible).
             2. "summary": A brief summary of the conversation context.
             3. "overall_mood": The overall emotional tone of the conversation (e.g., Flirty, Tense, Casual).
             4. "participant_name": The name of the other person if visible, else "Partner".
-            
-            Ensure the JSON is raw and valid.
             """
-            
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
+
+FUSED_REPLIES_PROMPT = """
+            5. "replies": As an expert relationship strategist, 3 distinct reply options for the USER to send back,
+               each an object with "tone", "text" and "reasoning", using the tones
+               "Warm & Supportive", "Playful & Light" and "Direct & Confident".
+            """
+
+class VisionService:
+    async def _analyze(self, image: PreparedImage, prompt: str) -> dict:
+        response = await model_router.chat_completion(
+            "vision",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image.to_data_url()
                             }
-                        ]
-                    }
-                ],
-                response_format={"type": "json_object"}
+                        }
+                    ]
+                }
+            ],
+            response_format={"type": "json_object"},
+            timeout=settings.VISION_TIMEOUT,
+        )
+        return json.loads(response.choices[0].message.content)
+
+    async def analyze_chat_screenshot(self, image: PreparedImage) -> dict:
+        """
+        Analyzes a preprocessed chat screenshot to extract conversation, emotion, and tone.
+        """
+        try:
+            return await self._analyze(image, EXTRACTION_PROMPT + "\n            Ensure the JSON is raw and valid.\n")
+        except Exception as e:
+            logger.exception("image analysis failed")
+            return {"error": str(e)}
+
+    async def analyze_with_replies(self, image: PreparedImage) -> dict:
+        """
+        Single fused call: extracts the conversation and drafts the 3-tone replies
+        from the screenshot in one round trip.
+        """
+        try:
+            result = await self._analyze(
+                image, EXTRACTION_PROMPT + FUSED_REPLIES_PROMPT + "\n            Ensure the JSON is raw and valid.\n"
             )
-            
-            import json
-            return json.loads(response.choices[0].message.content)
+            result.setdefault("replies", [])
+            return result
         except Exception as e:
-            print(f"Error analyzing image: {e}")
+            logger.exception("image analysis failed")
             return {"error": str(e)}
 
 vision_service = VisionService()
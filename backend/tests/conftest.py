@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+# Settings are read when core.config is imported: point the app at a throwaway database
+# and cache before any test module imports it
+_TMP = tempfile.mkdtemp(prefix="backend-tests-")
+_DB_PATH = os.path.join(_TMP, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_PATH}"
+os.environ["CACHE_DB_PATH"] = os.path.join(_TMP, "cache.db")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+
+from core.database import SessionLocal, engine
+from core.migrations import run_migrations
+from models import contact, conversation  # Import models to register them
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    """A session on a freshly migrated, empty database."""
+    await engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(_DB_PATH + suffix):
+            os.remove(_DB_PATH + suffix)
+    try:
+        await run_migrations(engine)
+        async with SessionLocal() as session:
+            yield session
+    finally:
+        # Pooled connections belong to this test's event loop
+        await engine.dispose()
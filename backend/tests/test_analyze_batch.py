@@ -0,0 +1,89 @@
+import uuid
+
+import pytest
+from fastapi import UploadFile
+
+from api.v1.endpoints import analyze
+from services.image_preprocessor import PreparedImage
+
+pytestmark = pytest.mark.anyio
+
+
+def image(tag: str) -> PreparedImage:
+    return PreparedImage(data=tag.encode(), mime_type="image/jpeg", width=1, height=1, original_size=1, phash=tag)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Vision extracts two messages per image (the second repeated by the next image);
+    observations and vision calls are recorded."""
+    calls, observed = [], []
+
+    async def analyze_chat_screenshot(prepared: PreparedImage) -> dict:
+        calls.append(prepared.data)
+        n = int(prepared.data.decode().rsplit("-", 1)[1])
+        return {
+            "conversation": [
+                {"sender": "Partner", "text": f"message {n}", "time": None},
+                {"sender": "Partner", "text": f"message {n + 1}", "time": None},
+            ],
+            "participant_name": "Sam",
+            "summary": "",
+            "overall_mood": "Calm",
+        }
+
+    async def generate_replies(context: dict) -> dict:
+        return {"replies": []}
+
+    async def observe_analysis(analysis: dict, scope: str | None = None, source: str = "analyze") -> bool:
+        observed.append(([m["text"] for m in analysis["conversation"]], scope))
+        return True
+
+    monkeypatch.setattr(analyze.vision_service, "analyze_chat_screenshot", analyze_chat_screenshot)
+    monkeypatch.setattr(analyze.llm_service, "generate_replies", generate_replies)
+    monkeypatch.setattr(analyze.contact_analytics, "observe_analysis", observe_analysis)
+    return calls, observed
+
+
+def uploads(count: int) -> list[UploadFile]:
+    return [UploadFile(file=None, filename=f"{i}.jpg") for i in range(count)]
+
+
+async def test_resubmitted_batch_makes_no_vision_calls_and_observes_nothing(upstream):
+    calls, observed = upstream
+    batch = uuid.uuid4().hex
+    images = [image(f"{batch}-1"), image(f"{batch}-2")]
+
+    first = await analyze._analyze_batch(uploads(2), images)
+    assert [m["text"] for m in first["conversation"]] == ["message 1", "message 2", "message 3"]
+    assert len(calls) == 2
+    assert [texts for texts, _ in observed] == [["message 1", "message 2", "message 3"]]
+
+    again = await analyze._analyze_batch(uploads(2), images)
+    assert again["conversation"] == first["conversation"]
+    assert len(calls) == 2 and len(observed) == 1
+
+
+async def test_only_the_new_images_are_observed(upstream):
+    calls, observed = upstream
+    batch = uuid.uuid4().hex
+    await analyze._analyze_batch(uploads(1), [image(f"{batch}-1")])
+    observed.clear()
+
+    result = await analyze._analyze_batch(uploads(2), [image(f"{batch}-1"), image(f"{batch}-3")])
+    assert [m["text"] for m in result["conversation"]] == ["message 1", "message 2", "message 3", "message 4"]
+    assert [texts for texts, _ in observed] == [["message 3", "message 4"]]
+    assert len(calls) == 2
+
+
+async def test_image_analyzed_alone_is_reused_by_a_batch(upstream):
+    calls, observed = upstream
+    batch = uuid.uuid4().hex
+    single = image(f"{batch}-1")
+    cached = {**await analyze.vision_service.analyze_chat_screenshot(single), "replies": [{"text": "hi"}]}
+    await analyze.analysis_cache.set(analyze.content_hash(single.data), cached, phash=single.phash)
+    calls.clear()
+
+    result = await analyze._analyze_batch(uploads(1), [single])
+    assert calls == [] and observed == []
+    assert [m["text"] for m in result["conversation"]] == ["message 1", "message 2"]
@@ -0,0 +1,173 @@
+import io
+import json
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from models.contact import ContactMessage
+from services.chat_import import (
+    TelegramParser,
+    chat_importer,
+    detect_format,
+    parse_imessage,
+    parse_whatsapp,
+    resolve_contact_sender,
+)
+from services.chat_service import chat_service
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunked(text: str, size: int = 7):
+    """The text in small pieces, so lines and JSON objects straddle chunk boundaries."""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+async def collect(messages) -> list:
+    return [message async for message in messages]
+
+
+WHATSAPP_ANDROID = """31/12/2023, 21:41 - Messages and calls are end-to-end encrypted.
+31/12/2023, 21:41 - Sam: happy new year!
+31/12/2023, 21:42 - Alex: you too
+see you tomorrow?
+01/01/2024, 09:05 - Sam: yes
+"""
+
+# iOS exports put a left-to-right mark before some lines
+WHATSAPP_IOS = """\u200e[1/2/24, 9:05:10 PM] Sam: hi
+[1/2/24, 9:06:00 PM] Alex: hey
+"""
+
+
+async def test_whatsapp_android_joins_lines_and_skips_notices():
+    messages = await collect(parse_whatsapp(chunked(WHATSAPP_ANDROID)))
+    assert [(m.sender, m.text) for m in messages] == [
+        ("Sam", "happy new year!"),
+        ("Alex", "you too\nsee you tomorrow?"),
+        ("Sam", "yes"),
+    ]
+    assert messages[0].sent_at == datetime(2023, 12, 31, 21, 41)
+    assert messages[2].sent_at == datetime(2024, 1, 1, 9, 5)
+
+
+async def test_whatsapp_am_pm_reads_month_first():
+    messages = await collect(parse_whatsapp(chunked(WHATSAPP_IOS)))
+    assert [(m.sender, m.text) for m in messages] == [("Sam", "hi"), ("Alex", "hey")]
+    assert messages[0].sent_at == datetime(2024, 1, 2, 21, 5, 10)
+
+
+async def test_whatsapp_day_first_can_be_forced():
+    messages = await collect(parse_whatsapp(chunked(WHATSAPP_IOS), day_first=True))
+    assert messages[0].sent_at == datetime(2024, 2, 1, 21, 5, 10)
+
+
+async def test_imessage():
+    export = """Jan 02, 2024  9:05:10 PM
+Sam
+hi there
+how are you?
+
+Jan 02, 2024  9:06:00 PM
+Me
+good!
+"""
+    messages = await collect(parse_imessage(chunked(export)))
+    assert [(m.sender, m.text) for m in messages] == [("Sam", "hi there\nhow are you?"), ("Me", "good!")]
+    assert messages[0].sent_at == datetime(2024, 1, 2, 21, 5, 10)
+
+
+async def test_telegram_streams_messages_and_finds_the_chat_name():
+    export = json.dumps({
+        "name": "Sam \"S\" Smith",
+        "type": "personal_chat",
+        "messages": [
+            {"id": 1, "type": "service", "date": "2024-01-02T21:00:00", "action": "phone_call"},
+            {"id": 2, "type": "message", "date": "2024-01-02T21:05:10", "from": "Sam", "text": "hi"},
+            {"id": 3, "type": "message", "date": "2024-01-02T21:06:00", "from": "Alex",
+             "text": ["look at ", {"type": "link", "text": "this"}]},
+            {"id": 4, "type": "message", "date": "2024-01-02T21:07:00", "from": "Alex", "text": ""},
+        ],
+    }, indent=1)
+    parser = TelegramParser()
+    messages = await collect(parser.parse(chunked(export)))
+    assert parser.chat_name == 'Sam "S" Smith'
+    assert [(m.sender, m.text) for m in messages] == [("Sam", "hi"), ("Alex", "look at this")]
+    assert messages[1].sent_at == datetime(2024, 1, 2, 21, 6)
+
+
+@pytest.mark.parametrize("head, expected", [
+    (WHATSAPP_ANDROID, "whatsapp"),
+    (WHATSAPP_IOS, "whatsapp"),
+    ("Jan 02, 2024  9:05:10 PM\nSam\nhi\n", "imessage"),
+    ('\ufeff  {"name": "Sam", "messages": []}', "telegram"),
+    ("Sam: hi\nMe: hey\n", "plain"),
+])
+def test_detect_format(head, expected):
+    assert detect_format(head) == expected
+
+
+def test_resolve_contact_sender_matches_the_name_over_frequency():
+    senders = Counter({"Alex": 50, "Sam Smith": 10, "Jo": 20})
+    assert resolve_contact_sender(senders, "Sam", "Alex") == "Sam Smith"
+
+
+def test_resolve_contact_sender_without_a_name_takes_the_busiest_non_user():
+    senders = Counter({"Me": 50, "Jo": 20, "Sam": 10})
+    assert resolve_contact_sender(senders, None, None) == "Jo"
+    # A name nobody in the export resembles falls back the same way
+    assert resolve_contact_sender(senders, "Taylor", None) == "Jo"
+    assert resolve_contact_sender(Counter({"Me": 3}), "Sam", None) is None
+
+
+def whatsapp_export(contact: str, user: str, exchanges: int) -> bytes:
+    lines = []
+    for i in range(exchanges):
+        minute = i % 50
+        lines.append(f"02/01/2024, 10:{minute:02d} - {user}: question {i}")
+        lines.append(f"02/01/2024, 10:{minute:02d} - {user}: follow-up {i}")
+        lines.append(f"02/01/2024, 10:{minute + 1:02d} - {contact}: answer {i}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+@pytest.fixture
+def no_memory_extraction(monkeypatch):
+    async def seed_memories(contact_name: str, transcript: str) -> bool:
+        return True
+
+    monkeypatch.setattr(chat_service, "seed_memories", seed_memories)
+
+
+async def test_import_attributes_messages_to_the_named_contact(db, monkeypatch, no_memory_extraction):
+    # The user writes more than the contact, and the file name is not the contact's sender label
+    monkeypatch.setattr("core.config.settings.IMPORT_BATCH_SIZE", 7)
+    monkeypatch.setattr("core.config.settings.IMPORT_SENDER_SCAN_MESSAGES", 10)
+    export = whatsapp_export("Sam Smith", "Alex", exchanges=20)
+    result = await chat_importer.import_export(db, io.BytesIO(export), "WhatsApp Chat with Sam.txt")
+
+    assert result["contact_name"] == "Sam"
+    assert result["contact_sender"] == "Sam Smith"
+    assert result["messages"] == result["new_messages"] == 60
+    rows = (await db.scalars(select(ContactMessage).order_by(ContactMessage.id))).all()
+    assert Counter(row.sender for row in rows) == {"user": 40, "contact": 20}
+    assert all(row.sender == "contact" for row in rows if row.text.startswith("answer"))
+    assert result["analytics"]["message_count"] == 20
+    assert all(item["sender"] == "Partner" for item in result["conversation"] if item["text"].startswith("answer"))
+
+
+async def test_reimport_adds_nothing_and_a_longer_export_adds_the_rest(db, no_memory_extraction):
+    full = whatsapp_export("Sam Smith", "Alex", exchanges=20)
+    partial = full[:full.index(b"question 10")].rsplit(b"\n", 1)[0] + b"\n"
+
+    first = await chat_importer.import_export(db, io.BytesIO(partial), "WhatsApp Chat with Sam.txt")
+    again = await chat_importer.import_export(db, io.BytesIO(partial), "WhatsApp Chat with Sam.txt")
+    longer = await chat_importer.import_export(db, io.BytesIO(full), "WhatsApp Chat with Sam.txt")
+
+    assert first["new_messages"] == 30
+    assert again["new_messages"] == 0
+    assert longer["new_messages"] == 30
+    assert longer["analytics"]["message_count"] == 20
+    assert len((await db.scalars(select(ContactMessage))).all()) == 60
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from core.config import settings
+from models.conversation import ChatMessage, ChatSession
+from services import chat_service as chat_service_module
+from services.chat_service import chat_service
+
+pytestmark = pytest.mark.anyio
+
+# About 400 tokens: a typical long assistant reply
+LONG = "x" * 1600
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Session ids queued for a summary; memory extraction is not run."""
+    monkeypatch.setattr(settings, "HISTORY_WINDOW_MESSAGES", 20)
+    monkeypatch.setattr(settings, "HISTORY_TOKEN_BUDGET", 3000)
+    monkeypatch.setattr(settings, "SUMMARY_MIN_MESSAGES", 10)
+    monkeypatch.setattr(settings, "SUMMARY_MAX_MESSAGES", 60)
+    sessions = []
+
+    async def enqueue_summary(session_id):
+        sessions.append(session_id)
+        return True
+
+    async def enqueue_memory(job):
+        return True
+
+    monkeypatch.setattr(chat_service.summary_queue, "enqueue", enqueue_summary)
+    monkeypatch.setattr(chat_service.memory_queue, "enqueue", enqueue_memory)
+    return sessions
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """The summary model call, returning a fixed summary and keeping the prompts it got."""
+    prompts = []
+
+    async def chat_completion(task, messages, **kwargs):
+        prompts.append(messages[-1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="the summary"))])
+
+    monkeypatch.setattr(chat_service_module.model_router, "chat_completion", chat_completion)
+    return prompts
+
+
+async def long_session(db, exchanges: int) -> ChatSession:
+    chat_session = ChatSession()
+    db.add(chat_session)
+    await db.flush()
+    start = datetime.utcnow() - timedelta(hours=1)
+    for i in range(exchanges * 2):
+        db.add(ChatMessage(
+            session_id=chat_session.id,
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"{i} {LONG}",
+            created_at=start + timedelta(seconds=i),
+        ))
+    await db.commit()
+    return chat_session
+
+
+async def turn(db, chat_session: ChatSession):
+    window = await chat_service._load_history_window(db, chat_session)
+    await chat_service._finish_turn(db, chat_session, window, "next question", LONG)
+
+
+async def test_messages_pushed_out_by_the_token_budget_trigger_a_summary(db, queued):
+    # 22 messages, well under the 20-message window plus SUMMARY_MIN_MESSAGES, but only
+    # about 7 fit the token budget, so 15 are in neither the prompt nor a summary
+    chat_session = await long_session(db, exchanges=10)
+    await turn(db, chat_session)
+    assert queued == [chat_session.id]
+
+
+async def test_short_sessions_are_not_summarized(db, queued):
+    chat_session = await long_session(db, exchanges=2)
+    await turn(db, chat_session)
+    assert queued == []
+
+
+async def test_summary_folds_everything_before_the_window(db, queued, summarizer):
+    chat_session = await long_session(db, exchanges=10)
+    await turn(db, chat_session)
+    window = await chat_service._load_history_window(db, chat_session)
+
+    await chat_service._summarize_sessions([chat_session.id])
+    await db.refresh(chat_session)
+    assert chat_session.summary == "the summary"
+    assert chat_session.summarized_until_id == window[0].id - 1
+    assert summarizer[0].count(LONG) == window[0].id - 1
+
+    # Folded messages don't count again
+    queued.clear()
+    await turn(db, chat_session)
+    assert queued == []
@@ -0,0 +1,197 @@
+import math
+import random
+import statistics
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from models.contact import Contact, ContactMessage, ContactStats
+from services.contact_analytics import (
+    Aggregates,
+    MessageKeys,
+    RunningStats,
+    contact_analytics,
+    conversation_messages,
+)
+
+
+def test_running_stats_match_the_two_pass_formulas():
+    rng = random.Random(7)
+    values = [rng.gauss(3.0, 2.0) for _ in range(500)]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.n == 500
+    assert math.isclose(stats.mean, statistics.fmean(values), rel_tol=1e-12)
+    assert math.isclose(stats.variance, statistics.variance(values), rel_tol=1e-9)
+
+
+def test_running_stats_stay_accurate_with_a_large_offset():
+    # The naive sum-of-squares formula loses every digit here
+    values = [1e9 + x for x in (4.0, 7.0, 13.0, 16.0)]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert math.isclose(stats.variance, 30.0, rel_tol=1e-9)
+
+
+def test_running_stats_variance_needs_two_samples():
+    stats = RunningStats()
+    assert stats.variance == 0.0
+    stats.add(5.0)
+    assert stats.variance == 0.0
+
+
+def test_running_stats_resume_from_stored_values():
+    values = [0.9, -0.5, 0.2, 0.6, -0.7]
+    first, resumed = RunningStats(), RunningStats()
+    for value in values:
+        first.add(value)
+    for value in values[:2]:
+        resumed.add(value)
+    resumed = RunningStats(resumed.n, resumed.mean, resumed.m2)
+    for value in values[2:]:
+        resumed.add(value)
+    assert (resumed.n, resumed.mean) == (first.n, pytest.approx(first.mean))
+    assert resumed.variance == pytest.approx(first.variance)
+
+
+def test_reply_gap_is_measured_from_the_first_unanswered_user_message():
+    at = datetime(2024, 1, 1, 12, 0)
+    aggregates = Aggregates()
+    pending = {}
+    aggregates.add("user", None, at, "c", pending)
+    aggregates.add("user", None, at + timedelta(minutes=5), "c", pending)
+    aggregates.add("contact", "happy", at + timedelta(minutes=10), "c", pending)
+    aggregates.add("contact", "sad", at + timedelta(minutes=11), "c", pending)
+    assert aggregates.message_count == 2
+    assert aggregates.gaps.n == 1
+    assert aggregates.gap_min == aggregates.gap_max == 10.0
+    assert aggregates.emotion_counts == {"happy": 1, "sad": 1}
+
+
+def test_uncounted_message_only_clears_the_pending_question():
+    at = datetime(2024, 1, 1, 12, 0)
+    aggregates = Aggregates()
+    pending = {}
+    aggregates.add("user", None, at, "c", pending)
+    aggregates.add("contact", "happy", at + timedelta(minutes=3), "c", pending, counted=False)
+    assert pending == {}
+    assert aggregates.message_count == 0 and aggregates.gaps.n == 0
+
+
+def test_message_keys_tell_repeats_apart_and_stay_stable():
+    at = datetime(2024, 1, 1, 12, 0)
+    messages = [
+        {"sender": "contact", "text": "haha", "sent_at": at},
+        {"sender": "contact", "text": "haha", "sent_at": at},
+        {"sender": "user", "text": "haha", "sent_at": at},
+    ]
+    keys = [MessageKeys()(m) for m in messages]
+    assert keys[0] == keys[1]  # a fresh instance per message: same identity
+
+    keyer = MessageKeys()
+    first = [keyer(m) for m in messages]
+    assert len(set(first)) == 3
+    again = MessageKeys()
+    assert [again(m) for m in messages] == first
+
+    # Without a real timestamp, only the same scope gives the same key
+    keys = {scope: MessageKeys(scope, dated=False)(messages[0]) for scope in ("img1", "img2")}
+    assert keys["img1"] == MessageKeys("img1", dated=False)(messages[0])
+    assert keys["img1"] != keys["img2"]
+
+
+def test_conversation_messages_roll_over_midnight():
+    messages = conversation_messages([
+        {"sender": "Partner", "text": "late", "time": "11:58 PM", "emotion": "Tired"},
+        {"sender": "User", "text": "go to bed", "time": "00:03"},
+    ])
+    assert [m["sender"] for m in messages] == ["contact", "user"]
+    assert messages[0]["emotion"] == "tired"
+    assert messages[1]["sent_at"] - messages[0]["sent_at"] == timedelta(minutes=5)
+
+
+def screenshot(*texts: str) -> list[dict]:
+    return conversation_messages([
+        {"sender": "Partner" if i % 2 else "User", "text": text, "time": f"12:{i:02d}", "emotion": "happy"}
+        for i, text in enumerate(texts)
+    ])
+
+
+@pytest.mark.anyio
+async def test_same_screenshot_observed_again_counts_once(db):
+    contact = Contact(name="Sam")
+    db.add(contact)
+    await db.flush()
+
+    conversation = screenshot("a", "b", "c", "d")
+    assert await contact_analytics.record(db, contact, conversation, "analyze", message_keys=MessageKeys("img1", dated=False)) == 4
+    assert await contact_analytics.record(db, contact, conversation, "analyze", message_keys=MessageKeys("img1", dated=False)) == 0
+    await db.commit()
+
+    stats = await contact_analytics.stats(db, contact.id)
+    assert stats["message_count"] == 2
+    assert await db.scalar(select(func.count(ContactMessage.id))) == 4
+
+    online = (await db.get(ContactStats, contact.id)).gap_n
+    await contact_analytics.recompute(db, [contact.id])
+    assert (await contact_analytics.stats(db, contact.id)) == stats
+    assert (await db.get(ContactStats, contact.id)).gap_n == online
+
+
+@pytest.mark.anyio
+async def test_same_short_text_in_two_conversations_counts_twice(db):
+    db.add(Contact(name="Sam"))
+    await db.commit()
+    untimed = [{"sender": "Partner", "text": "ok", "emotion": "happy"}]
+    timed = [{"sender": "Partner", "text": "haha", "time": "12:00", "emotion": "amused"}]
+    await contact_analytics._apply_batch([
+        # Untimed, and on different days that screenshots can't tell apart
+        ("Sam", conversation_messages(untimed), "analyze", "img1", False),
+        ("Sam", conversation_messages([{**untimed[0], "emotion": "angry"}]), "analyze", "img2", False),
+        ("Sam", conversation_messages(timed), "analyze", "img1", False),
+        ("Sam", conversation_messages(timed), "analyze", "img2", False),
+        # Chat observations carry no time at all
+        ("Sam", [{"sender": "contact", "text": "ok", "emotion": "sad"}], "chat", None, False),
+        ("Sam", [{"sender": "contact", "text": "ok", "emotion": "sad"}], "chat", None, False),
+    ])
+    contact = await db.scalar(select(Contact))
+    stats = await contact_analytics.stats(db, contact.id)
+    assert stats["message_count"] == 6
+    assert set(stats["emotions"]) == {"happy", "angry", "amused", "sad"}
+
+
+@pytest.mark.anyio
+async def test_dated_messages_are_recognized_across_sources(db):
+    contact = Contact(name="Sam")
+    db.add(contact)
+    await db.flush()
+    at = datetime(2024, 1, 2, 12, 0)
+    messages = [{"sender": "contact", "text": "ok", "emotion": None, "sent_at": at}]
+    assert await contact_analytics.record(db, contact, messages, "import", message_keys=MessageKeys("export1")) == 1
+    assert await contact_analytics.record(db, contact, messages, "import", message_keys=MessageKeys("export2")) == 0
+    undated = [{"sender": "contact", "text": "ok", "emotion": None, "sent_at": None}]
+    assert await contact_analytics.record(db, contact, undated, "import", message_keys=MessageKeys("export1")) == 1
+    assert await contact_analytics.record(db, contact, undated, "import", message_keys=MessageKeys("export1")) == 0
+    assert await contact_analytics.record(db, contact, undated, "import", message_keys=MessageKeys("export2")) == 1
+
+
+@pytest.mark.anyio
+async def test_analysis_for_an_unknown_contact_is_not_stored(db):
+    await contact_analytics._apply_batch([("Sarn", screenshot("hi", "hey"), "analyze", "img1", False)])
+    assert await db.scalar(select(func.count(Contact.id))) == 0
+    assert await db.scalar(select(func.count(ContactMessage.id))) == 0
+
+
+@pytest.mark.anyio
+async def test_queue_batch_with_two_conversations_for_one_contact_keeps_both(db):
+    db.add(Contact(name="Sam"))
+    await db.commit()
+    await contact_analytics._apply_batch([
+        ("Sam", screenshot("a", "b"), "analyze", "img1", False),
+        ("sam", screenshot("c", "d"), "analyze", "img2", False),
+    ])
+    contact = await db.scalar(select(Contact))
+    assert (await contact_analytics.stats(db, contact.id))["message_count"] == 2
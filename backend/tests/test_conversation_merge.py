@@ -0,0 +1,53 @@
+from services.conversation_merge import merge_analyses, merge_message_lists
+
+
+def msg(sender: str, text: str) -> dict:
+    return {"sender": sender, "text": text}
+
+
+def texts(messages: list[dict]) -> list[str]:
+    return [m["text"] for m in messages]
+
+
+def test_forward_overlap_is_stitched_once():
+    first = [msg("Partner", "hey"), msg("User", "hi!"), msg("Partner", "dinner tonight?")]
+    second = [msg("User", "hi!"), msg("Partner", "dinner tonight?"), msg("User", "sure, 8?")]
+    assert texts(merge_message_lists([first, second])) == ["hey", "hi!", "dinner tonight?", "sure, 8?"]
+
+
+def test_screenshot_scrolled_further_up_is_prepended():
+    later = [msg("Partner", "dinner tonight?"), msg("User", "sure, 8?")]
+    earlier = [msg("Partner", "hey"), msg("Partner", "dinner tonight?")]
+    assert texts(merge_message_lists([later, earlier])) == ["hey", "dinner tonight?", "sure, 8?"]
+
+
+def test_ocr_differences_still_match():
+    first = [msg("Partner", "See you at the station at 7"), msg("User", "ok")]
+    second = [msg("partner", "See you at the statlon at 7!"), msg("User", "ok"), msg("Partner", "great")]
+    assert texts(merge_message_lists([first, second])) == ["See you at the station at 7", "ok", "great"]
+
+
+def test_contained_screenshot_adds_nothing():
+    full = [msg("Partner", "a"), msg("User", "b"), msg("Partner", "c"), msg("User", "d")]
+    assert merge_message_lists([full, full[1:3], []]) == full
+
+
+def test_same_text_from_the_other_sender_is_not_an_overlap():
+    first = [msg("Partner", "lol")]
+    second = [msg("User", "lol")]
+    assert merge_message_lists([first, second]) == first + second
+
+
+def test_no_overlap_appends():
+    assert texts(merge_message_lists([[msg("Partner", "one")], [msg("Partner", "two")]])) == ["one", "two"]
+
+
+def test_merge_analyses_takes_the_common_name_and_latest_mood():
+    merged = merge_analyses([
+        {"conversation": [msg("Partner", "hey")], "participant_name": "Sam", "summary": "Greeting", "overall_mood": "Calm"},
+        {"conversation": [msg("User", "hi")], "participant_name": "Partner", "summary": "Greeting", "overall_mood": "Warm"},
+    ])
+    assert merged["participant_name"] == "Sam"
+    assert merged["summary"] == "Greeting"
+    assert merged["overall_mood"] == "Warm"
+    assert texts(merged["conversation"]) == ["hey", "hi"]
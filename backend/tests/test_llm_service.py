@@ -0,0 +1,113 @@
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from services import llm_service as llm_module
+from services.llm_service import _parse_complete_replies, llm_service
+from services.result_cache import context_hash, reply_cache
+
+REPLIES = [
+    {"tone": "Warm & Supportive", "text": "That sounds hard, {want to talk}?", "reasoning": "validates"},
+    {"tone": "Playful & Light", "text": "a \"bracket\" ] inside", "reasoning": "teases"},
+    {"tone": "Direct & Confident", "text": "Let's meet at 8.", "reasoning": "clear"},
+]
+PAYLOAD = json.dumps({"replies": REPLIES}, indent=2)
+
+
+def test_nothing_before_the_array_opens():
+    assert _parse_complete_replies('{"repl', None) == ([], None)
+    assert _parse_complete_replies('{"replies": ', None) == ([], None)
+
+
+def test_each_reply_is_returned_once_as_the_buffer_grows():
+    seen = []
+    pos = None
+    for end in range(1, len(PAYLOAD) + 1):
+        replies, pos = _parse_complete_replies(PAYLOAD[:end], pos)
+        seen.extend(replies)
+    assert seen == REPLIES
+
+
+def test_partial_object_waits_for_more():
+    buffer = PAYLOAD[:PAYLOAD.index("Playful") + 3]
+    replies, pos = _parse_complete_replies(buffer, None)
+    assert replies == REPLIES[:1]
+    # Resuming from the returned position on the same buffer finds nothing new
+    assert _parse_complete_replies(buffer, pos) == ([], pos)
+
+
+def test_stops_at_the_end_of_the_array():
+    replies, pos = _parse_complete_replies(PAYLOAD, None)
+    assert replies == REPLIES
+    assert PAYLOAD[pos] == "]"
+
+
+class FakeStream:
+    def __init__(self, text: str, size: int = 20):
+        self._pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._pieces:
+            raise StopAsyncIteration
+        delta = SimpleNamespace(content=self._pieces.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replace the reply model call; set `.text` to what it answers with."""
+    state = SimpleNamespace(text=PAYLOAD, calls=0)
+
+    async def chat_completion(task, stream=False, **kwargs):
+        state.calls += 1
+        if stream:
+            return FakeStream(state.text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=state.text))])
+
+    monkeypatch.setattr(llm_module.model_router, "chat_completion", chat_completion)
+    return state
+
+
+def context() -> dict:
+    return {"conversation": [{"sender": "Partner", "text": uuid.uuid4().hex}]}
+
+
+async def events(stream) -> list[tuple[str, dict]]:
+    return [event async for event in stream]
+
+
+@pytest.mark.anyio
+async def test_full_stream_is_cached(upstream):
+    ctx = context()
+    await events(llm_service.stream_replies(ctx))
+    assert await events(llm_service.stream_replies(ctx)) == [("reply", r) for r in REPLIES] + [("done", {"replies": REPLIES})]
+    assert upstream.calls == 1
+
+
+@pytest.mark.anyio
+async def test_stream_cut_short_is_not_cached(upstream):
+    upstream.text = PAYLOAD[:PAYLOAD.index("Direct")]
+    ctx = context()
+    first = await events(llm_service.stream_replies(ctx))
+    assert first[-1] == ("done", {"replies": REPLIES[:2]})
+    assert await reply_cache.get(context_hash(ctx)) is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("answer", [
+    {"replies": REPLIES[:1]},
+    {"options": REPLIES},
+    {"replies": [{"tone": "Warm & Supportive"}] * 3},
+])
+async def test_incomplete_json_answer_is_returned_but_not_cached(upstream, answer):
+    upstream.text = json.dumps(answer)
+    ctx = context()
+    assert await llm_service.generate_replies(ctx) == answer
+    assert await reply_cache.get(context_hash(ctx)) is None
+    await llm_service.generate_replies(ctx)
+    assert upstream.calls == 2
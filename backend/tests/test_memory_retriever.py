@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.config import settings
+from models.conversation import ContactMemory, fact_hash
+from services.memory_retriever import MemoryRetriever
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def index_settings(monkeypatch):
+    monkeypatch.setattr(settings, "MEMORY_INDEX_REFRESH_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "MEMORY_INDEX_SETTLE_SECONDS", 60.0)
+    monkeypatch.setattr(settings, "MEMORY_INDEX_MAX_ENTRIES", 50000)
+
+
+async def store(db, memory_id: int, fact: str, age: timedelta = timedelta(0)) -> ContactMemory:
+    memory = ContactMemory(
+        id=memory_id,
+        contact_name="Sam",
+        fact=fact,
+        fact_hash=fact_hash(fact),
+        category="preference",
+        created_at=datetime.utcnow() - age,
+    )
+    db.add(memory)
+    await db.commit()
+    return memory
+
+
+async def test_row_committed_after_a_higher_id_is_still_picked_up(db):
+    retriever = MemoryRetriever()
+    await store(db, 1, "Loves hiking", age=timedelta(hours=1))
+    await store(db, 5, "Hates mornings")
+    await retriever._sync(db)
+    # Settled rows move the watermark; recent ones may still have lower ids in flight
+    assert retriever._synced_id == 1
+
+    await store(db, 4, "Allergic to cats")  # another worker's transaction, committed late
+    await retriever._sync(db)
+    assert 4 in retriever._entries
+    assert "Allergic to cats" in retriever._select({"sam"}, set())
+
+
+async def test_watermark_advances_past_settled_rows(db):
+    retriever = MemoryRetriever()
+    await store(db, 1, "Loves hiking", age=timedelta(hours=1))
+    await retriever._sync(db)
+    await store(db, 2, "Plays guitar", age=timedelta(minutes=5))
+    await store(db, 3, "Hates mornings")
+    await retriever._sync(db)
+    assert retriever._synced_id == 2
+    assert set(retriever._entries) == {1, 2, 3}
+
+
+async def test_local_add_does_not_move_the_watermark(db):
+    retriever = MemoryRetriever()
+    await retriever._sync(db)
+    retriever.add(await store(db, 9, "Plays guitar", age=timedelta(hours=1)))
+    assert retriever._synced_id == 0
+
+    await store(db, 3, "Loves hiking", age=timedelta(hours=1))
+    await retriever._sync(db)
+    assert set(retriever._entries) == {3, 9}
+    assert retriever._synced_id == 9
+
+
+async def test_index_keeps_the_newest_entries(db, monkeypatch):
+    monkeypatch.setattr(settings, "MEMORY_INDEX_MAX_ENTRIES", 2)
+    retriever = MemoryRetriever()
+    for memory_id, fact in enumerate(["Loves hiking", "Plays guitar", "Hates mornings"], start=1):
+        await store(db, memory_id, fact, age=timedelta(hours=1))
+    await retriever._sync(db)
+    assert set(retriever._entries) == {2, 3}
+
+    await store(db, 4, "Allergic to cats", age=timedelta(hours=1))
+    await retriever._sync(db)
+    assert set(retriever._entries) == {3, 4}
+    assert "hiking" not in retriever._by_term and "guitar" not in retriever._by_term
+
+
+async def test_new_memory_refreshes_a_cached_selection(db):
+    retriever = MemoryRetriever()
+    await store(db, 1, "Loves hiking", age=timedelta(hours=1))
+    assert "Loves hiking" in await retriever.get_context(db, 1, "what should I tell Sam?")
+
+    await store(db, 2, "Hates mornings", age=timedelta(hours=1))
+    assert "Hates mornings" in await retriever.get_context(db, 1, "what should I tell Sam?")
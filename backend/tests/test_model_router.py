@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+from core import model_router as router_module
+from core.config import settings
+from core.model_router import CircuitBreaker, ModelRouter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 30.0)
+    clock = Clock()
+    monkeypatch.setattr(router_module.time, "monotonic", clock)
+    return CircuitBreaker(), clock
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    breaker, _ = breaker
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # resets the streak
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.available()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.available()
+    assert breaker.opened == 1
+
+
+def test_half_open_lets_one_trial_through(breaker):
+    breaker, clock = breaker
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.available() and breaker.state == "half_open"
+    assert not breaker.available()  # the trial is still running
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.available()
+
+
+def test_failed_trial_reopens(breaker):
+    breaker, clock = breaker
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.available()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2
+    clock.now += 29
+    assert not breaker.available()
+
+
+def test_ignored_trial_frees_the_slot(breaker):
+    breaker, clock = breaker
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.available()
+    breaker.record_ignored()
+    assert breaker.state == "half_open" and breaker.available()
+
+
+def test_released_trial_frees_the_slot(breaker):
+    breaker, clock = breaker
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.available()
+    breaker.release()
+    assert breaker.state == "half_open" and breaker.available()
+
+
+def test_routes_reject_a_model_listed_twice(monkeypatch):
+    from core.config import _model_routes
+
+    monkeypatch.setenv("MODEL_ROUTES", '{"chat": ["gpt-4o-mini", "gpt-4o", "gpt-4o-mini"]}')
+    with pytest.raises(ValueError):
+        _model_routes()
+
+
+def test_default_routes_have_distinct_models():
+    for models in settings.MODEL_ROUTES.values():
+        assert len(set(models)) == len(models)
+
+
+class FakeUpstream:
+    """create_chat_completion stand-in: `failing` models time out after `delay`."""
+
+    def __init__(self, failing: set[str], delay: float):
+        self.failing = failing
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, model: str, **kwargs):
+        self.calls.append(model)
+        await asyncio.sleep(self.delay)
+        if model in self.failing:
+            raise asyncio.TimeoutError()
+        return model
+
+
+@pytest.mark.anyio
+async def test_fallback_skips_the_model_the_hedge_already_tried(monkeypatch):
+    monkeypatch.setitem(settings.MODEL_ROUTES, "test", ["primary", "hedge", "last"])
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "HEDGE_MIN_DELAY", 0.01)
+    upstream = FakeUpstream(failing={"primary", "hedge"}, delay=0.03)
+    monkeypatch.setattr(router_module, "create_chat_completion", upstream)
+
+    router = ModelRouter()
+    for _ in range(settings.HEDGE_MIN_SAMPLES):
+        router._tracker("test", "primary").add(0.01)
+
+    assert await router.chat_completion("test", messages=[]) == "last"
+    assert upstream.calls[:2] == ["primary", "hedge"]
+    assert upstream.calls.count("hedge") == 1
+    assert router.hedged == 1 and router.fallbacks == 1
+
+
+@pytest.mark.anyio
+async def test_open_breaker_is_skipped(monkeypatch):
+    monkeypatch.setitem(settings.MODEL_ROUTES, "test", ["primary", "backup"])
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+    upstream = FakeUpstream(failing=set(), delay=0)
+    monkeypatch.setattr(router_module, "create_chat_completion", upstream)
+
+    router = ModelRouter()
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+        router._breaker("primary").record_failure()
+    assert await router.chat_completion("test", messages=[]) == "backup"
+    assert upstream.calls == ["backup"]
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_send_one_half_open_trial(monkeypatch):
+    monkeypatch.setitem(settings.MODEL_ROUTES, "test", ["primary", "backup"])
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+    upstream = FakeUpstream(failing=set(), delay=0.01)
+    monkeypatch.setattr(router_module, "create_chat_completion", upstream)
+
+    router = ModelRouter()
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+        router._breaker("primary").record_failure()
+    router._breaker("primary")._opened_at -= settings.CIRCUIT_RESET_SECONDS
+
+    results = await asyncio.gather(*(router.chat_completion("test", messages=[]) for _ in range(5)))
+    assert upstream.calls.count("primary") == 1
+    assert sorted(results) == ["backup"] * 4 + ["primary"]
+    assert router._breaker("primary").state == "closed"
+    assert not router._breaker("backup")._trial_in_flight
+
+
+@pytest.mark.anyio
+async def test_unused_trial_is_released(monkeypatch):
+    monkeypatch.setitem(settings.MODEL_ROUTES, "test", ["primary", "backup"])
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+    upstream = FakeUpstream(failing=set(), delay=0)
+    monkeypatch.setattr(router_module, "create_chat_completion", upstream)
+
+    router = ModelRouter()
+    backup = router._breaker("backup")
+    for _ in range(settings.CIRCUIT_FAILURE_THRESHOLD):
+        backup.record_failure()
+    backup._opened_at -= settings.CIRCUIT_RESET_SECONDS
+
+    # The primary answers, so the backup's claimed trial is never made and must be given back
+    assert await router.chat_completion("test", messages=[]) == "primary"
+    assert backup.state == "half_open" and backup.available()
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Response
+
+from api.v1.endpoints.contacts import read_contacts
+from models.contact import Contact
+from models.conversation import ChatMessage, ChatSession
+from services.chat_service import chat_service
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_history_pages_walk_back_without_gaps_or_repeats(db):
+    chat_session = ChatSession()
+    db.add(chat_session)
+    await db.flush()
+    start = datetime(2024, 1, 1, 12, 0)
+    # Pairs share a timestamp, as a user message and its reply saved together do
+    db.add_all([
+        ChatMessage(session_id=chat_session.id, role="user", content=f"m{i}", created_at=start + timedelta(seconds=i // 2))
+        for i in range(11)
+    ])
+    await db.commit()
+
+    pages = []
+    before_id = None
+    while True:
+        page = await chat_service.get_history(db, chat_session.id, before_id=before_id, limit=4)
+        pages.append([message["content"] for message in page["messages"]])
+        before_id = page["next_before_id"]
+        if before_id is None:
+            break
+
+    assert pages == [["m7", "m8", "m9", "m10"], ["m3", "m4", "m5", "m6"], ["m0", "m1", "m2"]]
+
+
+async def test_contacts_keyset_pages(db):
+    db.add_all([Contact(name=f"c{i}") for i in range(5)])
+    await db.commit()
+
+    names = []
+    after_id = None
+    while True:
+        response = Response()
+        page = await read_contacts(response, after_id=after_id, limit=2, skip=0, db=db)
+        names.extend(contact.name for contact in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        after_id = int(cursor)
+
+    assert names == [f"c{i}" for i in range(5)]
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from core import scheduler as scheduler_module
+from core.config import settings
+from core.scheduler import ModelLimiter, Priority, SchedulerTimeout, TokenBucket, current_client, current_priority
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 3600
+    assert bucket.wait_time(60) == 0.0
+    bucket.wait_time(0)
+    assert bucket.available == 60
+
+
+def test_token_bucket_oversize_request_waits_for_a_full_bucket(clock):
+    bucket = TokenBucket(per_minute=600)
+    bucket.take(300)
+    assert bucket.wait_time(10_000) == pytest.approx(30.0)
+
+
+def test_token_bucket_settles_against_real_usage(clock):
+    bucket = TokenBucket(per_minute=1000)
+    bucket.take(500)  # estimate
+    bucket.give(500 - 800)  # the call used more than estimated
+    assert bucket.available == pytest.approx(200)
+    bucket.give(10_000)
+    assert bucket.available == 1000
+
+
+def test_token_bucket_without_limit_never_waits(clock):
+    bucket = TokenBucket(per_minute=0)
+    bucket.take(1_000_000)
+    assert bucket.wait_time(1_000_000) == 0.0
+
+
+async def run_calls(limiter: ModelLimiter, calls: list[tuple[str, Priority]]) -> list[str]:
+    """Queue `calls` (name, priority; the client is the name before the dot) behind one
+    call holding the only slot, and return the order they were served in."""
+    served = []
+
+    async def call(name: str, priority: Priority):
+        current_client.set(name.split(".")[0])
+        current_priority.set(priority)
+        await limiter.acquire(0)
+        served.append(name)
+        await asyncio.sleep(0)
+        limiter.release()
+
+    await limiter.acquire(0)
+    tasks = []
+    for name, priority in calls:
+        tasks.append(asyncio.create_task(call(name, priority)))
+        await asyncio.sleep(0)  # enqueue in this order
+    limiter.release()
+    await asyncio.gather(*tasks)
+    return served
+
+
+@pytest.mark.anyio
+async def test_clients_take_turns_within_a_priority():
+    limiter = ModelLimiter("m", concurrency=1, rpm=0, tpm=0)
+    served = await run_calls(limiter, [
+        ("busy.1", Priority.INTERACTIVE),
+        ("busy.2", Priority.INTERACTIVE),
+        ("busy.3", Priority.INTERACTIVE),
+        ("other.1", Priority.INTERACTIVE),
+    ])
+    assert served == ["busy.1", "other.1", "busy.2", "busy.3"]
+
+
+@pytest.mark.anyio
+async def test_interactive_calls_go_before_background_ones():
+    limiter = ModelLimiter("m", concurrency=1, rpm=0, tpm=0)
+    served = await run_calls(limiter, [
+        ("worker.1", Priority.BACKGROUND),
+        ("worker.2", Priority.BACKGROUND),
+        ("user.1", Priority.INTERACTIVE),
+    ])
+    assert served == ["user.1", "worker.1", "worker.2"]
+
+
+@pytest.mark.anyio
+async def test_request_rate_delays_dispatch():
+    limiter = ModelLimiter("m", concurrency=10, rpm=1200, tpm=0)  # one request per 50 ms once drained
+    limiter.requests.take(limiter.requests.available)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await limiter.acquire(0)
+    assert loop.time() - started >= 0.04
+    assert limiter.throttled == 1
+
+
+@pytest.mark.anyio
+async def test_queue_timeout_gives_up_and_leaves_no_waiter(monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_QUEUE_TIMEOUT", 0.05)
+    limiter = ModelLimiter("m", concurrency=1, rpm=0, tpm=0)
+    await limiter.acquire(0)
+    with pytest.raises(SchedulerTimeout):
+        await limiter.acquire(0)
+    assert limiter.depth == 0 and limiter.timed_out == 1
+    limiter.release()
+    await limiter.acquire(0)
+    assert limiter.in_flight == 1
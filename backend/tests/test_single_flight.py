@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from core.config import settings
+from core.scheduler import current_client
+from core.single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+class Upstream:
+    def __init__(self, delay: float = 0.05, error: Exception | None = None):
+        self.calls = 0
+        self.cancelled = False
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return {"replies": ["a"]}
+
+
+@pytest.fixture
+def scopes(monkeypatch):
+    def set_scope(scope: str):
+        monkeypatch.setattr(settings, "SINGLE_FLIGHT_SCOPES", {"test": scope})
+    set_scope("global")
+    return set_scope
+
+
+async def test_concurrent_callers_share_one_call_and_get_their_own_copy(scopes):
+    flight, upstream = SingleFlight("test"), Upstream()
+    results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(5)))
+    assert upstream.calls == 1
+    assert (flight.leaders, flight.coalesced) == (1, 4)
+    results[1]["replies"].append("changed")
+    assert results[0] == results[2] == {"replies": ["a"]}
+    assert flight.stats()["in_flight"] == 0
+
+
+async def test_sequential_calls_are_not_coalesced(scopes):
+    flight, upstream = SingleFlight("test"), Upstream(delay=0)
+    await flight.do("k", upstream)
+    await flight.do("k", upstream)
+    assert upstream.calls == 2
+
+
+async def test_errors_reach_every_caller(scopes):
+    flight, upstream = SingleFlight("test"), Upstream(error=ValueError("boom"))
+    results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(3)), return_exceptions=True)
+    assert upstream.calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.failures == 1
+
+
+async def test_call_survives_the_leader_going_away(scopes):
+    flight, upstream = SingleFlight("test"), Upstream()
+    leader = asyncio.create_task(flight.do("k", upstream))
+    follower = asyncio.create_task(flight.do("k", upstream))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == {"replies": ["a"]}
+    assert not upstream.cancelled
+
+
+async def test_call_is_cancelled_when_the_last_caller_goes_away(scopes):
+    flight, upstream = SingleFlight("test"), Upstream()
+    caller = asyncio.create_task(flight.do("k", upstream))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    await asyncio.sleep(0)
+    assert upstream.cancelled
+
+
+async def test_client_scope_shares_only_within_a_client(scopes):
+    scopes("client")
+    flight, upstream = SingleFlight("test"), Upstream()
+
+    async def as_client(client: str):
+        current_client.set(client)
+        return await flight.do("k", upstream)
+
+    await asyncio.gather(as_client("a"), as_client("a"), as_client("b"))
+    assert upstream.calls == 2
+
+
+async def test_off_scope_never_shares(scopes):
+    scopes("off")
+    flight, upstream = SingleFlight("test"), Upstream()
+    await asyncio.gather(*(flight.do("k", upstream) for _ in range(3)))
+    assert upstream.calls == 3
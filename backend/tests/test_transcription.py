@@ -0,0 +1,36 @@
+import pytest
+
+from core.config import settings
+from services.transcription_service import plan_chunks
+
+
+@pytest.fixture(autouse=True)
+def chunk_lengths(monkeypatch):
+    monkeypatch.setattr(settings, "TRANSCRIPTION_CHUNK_SECONDS", 60.0)
+    monkeypatch.setattr(settings, "TRANSCRIPTION_MAX_CHUNK_SECONDS", 120.0)
+
+
+def test_short_audio_is_one_span():
+    assert plan_chunks(100.0, [(50.0, 51.0)]) == [(0.0, 100.0)]
+
+
+def test_without_silences_cuts_at_the_maximum():
+    assert plan_chunks(300.0, []) == [(0.0, 120.0), (120.0, 240.0), (240.0, 300.0)]
+
+
+def test_cuts_in_the_silence_closest_to_the_target():
+    silences = [(170.0, 172.0), (58.0, 60.0), (100.0, 101.0)]
+    assert plan_chunks(250.0, silences) == [(0.0, 59.0), (59.0, 100.5), (100.5, 171.0), (171.0, 250.0)]
+
+
+def test_ignores_silences_too_early_in_the_span():
+    # A cut at 11s would leave a uselessly short chunk
+    assert plan_chunks(200.0, [(10.0, 12.0)]) == [(0.0, 120.0), (120.0, 200.0)]
+
+
+def test_spans_cover_the_audio_without_gaps():
+    silences = [(float(t), t + 0.5) for t in range(7, 1000, 23)]
+    spans = plan_chunks(1000.0, silences)
+    assert spans[0][0] == 0.0 and spans[-1][1] == 1000.0
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+    assert all(0 < end - start <= 120.0 for start, end in spans)
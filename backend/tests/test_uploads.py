@@ -0,0 +1,33 @@
+import base64
+import os
+import tempfile
+
+import pytest
+
+from core.uploads import B64_CHUNK_SIZE, b64_data_url, upload_stats
+
+
+@pytest.mark.parametrize("size", [0, 1, B64_CHUNK_SIZE - 1, B64_CHUNK_SIZE, 2 * B64_CHUNK_SIZE + 2])
+def test_data_url_matches_one_shot_encoding(size):
+    data = os.urandom(size)
+    expected = f"data:image/png;base64,{base64.b64encode(data).decode()}"
+    assert b64_data_url("image/png", data) == expected
+    with tempfile.TemporaryFile() as file:
+        file.write(data)
+        assert b64_data_url("image/png", file) == expected
+
+
+def test_data_url_peak_memory_is_about_twice_the_encoded_size():
+    size = 24 * 1024 * 1024
+    encoded = 4 * size // 3
+    with tempfile.TemporaryFile() as file:
+        for _ in range(size // (1024 * 1024)):
+            file.write(os.urandom(1024 * 1024))
+
+        before = upload_stats.snapshot()["memory"]["peak_rss_bytes"]
+        url = b64_data_url("image/png", file)
+        peak = upload_stats.snapshot()["memory"]["peak_rss_bytes"] - before
+
+    assert len(url) == len("data:image/png;base64,") + encoded
+    # The encoded slices plus the joined string; the file itself is never read whole
+    assert peak <= 2.25 * encoded
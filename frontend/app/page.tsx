@@ -5,7 +5,7 @@ import { ChatMessage as ChatMessageComponent } from '@/components/chat-message';
 import { ChatInput } from '@/components/chat-input';
 import {
   getChatHistory,
-  sendChatMessage,
+  streamChatMessage,
   clearChat,
   ChatMessage as ChatMessageType
 } from '@/lib/api';
@@ -22,6 +22,7 @@ import { Button } from '@/components/ui/button';
 export default function Home() {
   const [messages, setMessages] = useState<ChatMessageType[]>([]);
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState(false);
   const [isInitialLoading, setIsInitialLoading] = useState(true);
   const scrollRef = useRef<HTMLDivElement>(null);
 
@@ -59,32 +60,47 @@ export default function Home() {
     setMessages(prev => [...prev, optimisticMsg]);
     setLoading(true);
 
-    try {
-      const result = await sendChatMessage(text, image);
-
-      // Replace with actual data from backend
-      const assistantMsg: ChatMessageType = {
-        id: Date.now() + 1,
-        role: 'assistant',
-        content: result.response,
-        created_at: new Date().toISOString()
-      };
+    // The reply is streamed into this message; it is added on the first token
+    const assistantId = Date.now() + 1;
+    const setReply = (content: string) => {
+      setMessages(prev => {
+        const reply: ChatMessageType = {
+          id: assistantId,
+          role: 'assistant',
+          content,
+          created_at: new Date().toISOString()
+        };
+        return prev.some(msg => msg.id === assistantId)
+          ? prev.map(msg => (msg.id === assistantId ? { ...msg, content } : msg))
+          : [...prev, reply];
+      });
+    };
 
-      setMessages(prev => [...prev, assistantMsg]);
+    try {
+      let reply = '';
+      const result = await streamChatMessage(text, (token) => {
+        reply += token;
+        setStreaming(true);
+        setReply(reply);
+      }, image);
+
+      // The final response is the authoritative text
+      setReply(result.response);
     } catch (err) {
       console.error('Chat error:', err);
       // Show actual error to user for debugging
       alert(`Connection Error: ${err instanceof Error ? err.message : String(err)}`);
 
-      // Add error message
-      setMessages(prev => [...prev, {
-        id: Date.now() + 1,
+      // Replace any partial reply with an error message
+      setMessages(prev => [...prev.filter(msg => msg.id !== assistantId), {
+        id: assistantId,
         role: 'assistant',
         content: "Sorry, I lost my connection for a moment. Please try again! (Check console for details)",
         created_at: new Date().toISOString()
       }]);
     } finally {
       setLoading(false);
+      setStreaming(false);
     }
   };
 
@@ -161,8 +177,8 @@ export default function Home() {
               <ChatMessageComponent key={msg.id} message={msg} />
             ))}
 
-            {/* Thinking Indicator */}
-            {loading && (
+            {/* Thinking Indicator (until the reply starts streaming in) */}
+            {loading && !streaming && (
               <div className="flex justify-start mb-6 animate-in fade-in duration-300">
                 <div className="flex-shrink-0 h-8 w-8 rounded-full bg-indigo-50 flex items-center justify-center mt-1 outline outline-2 outline-indigo-100 outline-offset-2">
                   <Brain className="h-4 w-4 text-indigo-600 animate-pulse" />
@@ -65,10 +65,65 @@ export async function sendChatMessage(message: string, image?: File): Promise<Ch
     return response.json();
 }
 
+/**
+ * Send a chat message and stream the reply token by token (server-sent events).
+ * `onToken` is called for each chunk of text; resolves with the final response.
+ */
+export async function streamChatMessage(
+    message: string,
+    onToken: (token: string) => void,
+    image?: File,
+): Promise<ChatResponse> {
+    const formData = new FormData();
+    formData.append('message', message);
+    if (image) {
+        formData.append('image', image);
+    }
+
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: 'POST',
+        body: formData,
+    });
+
+    if (!response.ok || !response.body) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || 'Failed to send message');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            const event = frame.match(/^event: (.*)$/m)?.[1];
+            const data = JSON.parse(frame.match(/^data: (.*)$/m)?.[1] || '{}');
+
+            if (event === 'token') {
+                onToken(data.content);
+            } else if (event === 'done') {
+                return data;
+            } else if (event === 'error') {
+                throw new Error(data.error || 'Failed to send message');
+            }
+        }
+    }
+
+    throw new Error('Stream ended unexpectedly');
+}
+
 /**
  * Get chat history.
  */
-export async function getChatHistory(): Promise<{ messages: ChatMessage[] }> {
+export async function getChatHistory(): Promise<{ messages: ChatMessage[]; next_before_id: number | null }> {
     const response = await fetch(`${API_BASE_URL}/chat/history`);
 
     if (!response.ok) {